@@ -0,0 +1,123 @@
+"""Sales analytics computed with grouped SQL aggregates.
+
+Produces the same shape as ``app.compute_summary`` but only ever transfers
+aggregated rows, so the cost stays flat as the ``sales`` table grows.
+"""
+
+PERIODS = {
+    "today": "day",
+    "week": "week",
+    "month": "month",
+    "year": "year",
+}
+
+
+def _window(period=None, since=None, until=None):
+    """Build a WHERE clause and params for an optional time window."""
+    clauses = []
+    params = []
+    if period:
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}'. Use one of: {', '.join(PERIODS)}")
+        clauses.append("created_at >= date_trunc(%s, now())")
+        params.append(PERIODS[period])
+    if since is not None:
+        clauses.append("created_at >= %s")
+        params.append(since)
+    if until is not None:
+        clauses.append("created_at < %s")
+        params.append(until)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    return where, params
+
+
+def empty_summary():
+    return {
+        "total_revenue": 0,
+        "total_sales_count": 0,
+        "avg_order_value": 0,
+        "best_selling_item": None,
+        "best_selling_quantity": 0,
+        "items_sold": {},
+        "hourly_sales": {hour: 0 for hour in range(24)},
+        "recent_sales": []
+    }
+
+
+def compute_summary_sql(cur, period=None, since=None, until=None):
+    """Compute the sales summary on the database side.
+
+    ``period`` restricts the window to the current day/week/month/year
+    (via ``date_trunc``); ``since``/``until`` bound it explicitly.
+    """
+    where, params = _window(period, since, until)
+
+    cur.execute(f"""
+        SELECT
+            COUNT(*) AS order_count,
+            COALESCE(SUM(quantity), 0) AS total_sales_count,
+            COALESCE(SUM(quantity * price), 0) AS total_revenue
+        FROM sales
+        {where}
+    """, params)
+    totals = cur.fetchone()
+    if not totals or not totals['order_count']:
+        return empty_summary()
+
+    # Grouped by item_id under the item's current name, so renames keep their
+    # history. Ties resolve to the item sold most recently, matching
+    # compute_summary's iteration over sales ordered by id DESC.
+    cur.execute(f"""
+        SELECT COALESCE(st.item_name, s.item_name) AS item_name,
+               SUM(s.quantity) AS quantity, MAX(s.id) AS last_id
+        FROM (SELECT id, item_id, item_name, quantity FROM sales {where}) s
+        LEFT JOIN storage st ON st.item_id = s.item_id
+        GROUP BY 1
+        ORDER BY quantity DESC, last_id DESC
+    """, params)
+    items_sold = {row['item_name']: row['quantity'] for row in cur.fetchall()}
+
+    cur.execute(f"""
+        SELECT EXTRACT(HOUR FROM created_at)::int AS hour, SUM(quantity) AS quantity
+        FROM sales
+        {where}
+        GROUP BY 1
+    """, params)
+    hourly_sales = {hour: 0 for hour in range(24)}
+    for row in cur.fetchall():
+        if row['hour'] is not None:
+            hourly_sales[row['hour']] = row['quantity']
+
+    cur.execute(f"""
+        SELECT COALESCE(st.item_name, s.item_name) AS item_name, s.quantity, s.price, s.created_at
+        FROM (
+            SELECT item_id, item_name, quantity, price, created_at
+            FROM sales
+            {where}
+            ORDER BY created_at DESC
+            LIMIT 5
+        ) s
+        LEFT JOIN storage st ON st.item_id = s.item_id
+        ORDER BY s.created_at DESC
+    """, params)
+    recent_sales = cur.fetchall()
+
+    best_selling_item, best_selling_quantity = next(iter(items_sold.items()), (None, 0))
+    total_revenue = totals['total_revenue']
+
+    return {
+        "total_revenue": total_revenue,
+        "total_sales_count": totals['total_sales_count'],
+        "avg_order_value": total_revenue / totals['order_count'],
+        "best_selling_item": best_selling_item,
+        "best_selling_quantity": best_selling_quantity,
+        "items_sold": items_sold,
+        "hourly_sales": hourly_sales,
+        "recent_sales": [{
+            'item_name': s['item_name'],
+            'quantity': s['quantity'],
+            'price': float(s['price']),
+            'total': float(s['quantity'] * s['price']),
+            'time': s['created_at'].strftime('%H:%M')
+        } for s in recent_sales]
+    }
@@ -1,150 +1,107 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, session, stream_with_context
+from flask import json as flask_json
 from flask_cors import CORS
-import os, re, json
+import os, re, time
 from dotenv import load_dotenv
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import google.generativeai as genai
 from datetime import datetime, timedelta
 from functools import wraps
 
 # ---------------- Flask Setup ----------------
+from logs import configure_logging
+import metrics
+import fastjson
+import compression
+import assets
+
+configure_logging()
 app = Flask(__name__)
 CORS(app)
+metrics.init_app(app)
+fastjson.init_app(app)
+compression.init_app(app)
+assets.init_app(app)
 app.secret_key = os.getenv('SECRET_KEY', 'dev_key_for_testing_only')
 app.permanent_session_lifetime = timedelta(days=1)  # Session expires after 1 day
 
+# ---------------- Cooperative I/O (gevent workers) ----------------
+import green
+green.setup()
+
 # ---------------- Load Gemini ----------------
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")  # e.g. a proxy, or the benchmark's fake Gemini
 if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+    genai.configure(
+        api_key=GEMINI_API_KEY,
+        transport=green.gemini_transport(),
+        client_options={"api_endpoint": GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None
+    )
 
 # ---------------- Database Config ----------------
-import urllib.parse
-from urllib.parse import urlparse
+from db import get_db_connection, pool_stats, router
+import replicas
+from replicas import read_connection
+replicas.init_app(app)
+from analytics import compute_summary_sql
+import rollups
+from catalog import catalog
+from sale_engine import record_sales, take_stock, ALL_OR_NOTHING, BEST_EFFORT
+import stock_shards
+import partitions
+from bulk_ingest import ingest_sales, parse_csv
+from local_parser import parse_local_command
+from llm_cache import response_cache, make_key
+from llm_client import llm, parse_reply, MessageExtractor
+from llm_gateway import gateway, LLMUnavailable
+from data_versions import conditional, time_bucket
+import live
+from live import broadcaster
+from sales import (fetch_sales_page, iter_sales_export, parse_datetime,
+                   DEFAULT_PAGE_SIZE, UNPAGED_CAP, EXPORT_FORMATS)
 
-def get_db_connection():
-    # Get the database URL from environment variables (provided by Railway)
-    DATABASE_URL = os.getenv('DATABASE_URL')
-    
-    print(f"Attempting to connect to database...")
-    print(f"DATABASE_URL: {'*' * 8 + DATABASE_URL[-8:] if DATABASE_URL else 'Not set'}")
-    
-    if not DATABASE_URL:
-        error_msg = "❌ DATABASE_URL environment variable is not set"
-        print(error_msg)
-        raise ValueError(error_msg)
-    
-    # For Railway's PostgreSQL service
-    if 'postgres.railway.internal' in DATABASE_URL:
-        DATABASE_URL = DATABASE_URL.replace('postgresql://', 'postgresql://')
-    
-    try:
-        # Parse the connection URL
-        print("Parsing database URL...")
-        result = urlparse(DATABASE_URL)
-        
-        username = result.username
-        password = result.password
-        database = result.path[1:]  # Remove the leading '/'
-        hostname = result.hostname
-        port = result.port
-        
-        # Create connection parameters
-        conn_params = {
-            'dbname': database,
-            'user': username,
-            'password': password,
-            'host': hostname,
-            'port': port,
-            'sslmode': 'require',  # Enable SSL for secure connection
-            'connect_timeout': 10,  # 10 second connection timeout
-            'keepalives': 1,        # Enable keepalive
-            'keepalives_idle': 30,  # Idle time before sending keepalive
-            'keepalives_interval': 10,  # Interval between keepalives
-            'keepalives_count': 5,  # Number of keepalives before dropping connection
-            'application_name': 'LakuAI-App'  # For identifying connection in pg_stat_activity
-        }
-        
-        print(f"Connecting to database: {hostname}:{port}/{database} as user {username}")
-        print(f"Using SSL: {'Yes' if 'sslmode=require' in DATABASE_URL else 'No'}")
-        
-        # Create and return the connection with RealDictCursor
-        conn = psycopg2.connect(
-            **conn_params,
-            cursor_factory=RealDictCursor
-        )
-        print("✅ Successfully connected to the database")
-        return conn
-        
-    except Exception as e:
-        error_msg = f"❌ Error connecting to the database: {str(e)}"
-        print(error_msg)
-        print(f"Error type: {type(e).__name__}")
-        
-        # Log specific connection errors
-        if "Connection refused" in str(e):
-            print("⚠️  The database server is not running or not accessible")
-            print("   - Check if the database host and port are correct")
-            print(f"   - Host: {hostname}, Port: {port}")
-        elif "password authentication failed" in str(e).lower():
-            print("⚠️  Authentication failed")
-            print("   - Check if the username and password are correct")
-        elif "does not exist" in str(e).lower():
-            print("⚠️  Database does not exist")
-            print(f"   - Database name: {database}")
-        
-        # Fallback to local config if available
-        try:
-            print("\nAttempting fallback to local database configuration...")
-            local_config = {
-                "dbname": os.getenv("DB_NAME"),
-                "user": os.getenv("DB_USER"),
-                "password": os.getenv("DB_PASSWORD"),
-                "host": os.getenv("DB_HOST"),
-                "port": int(os.getenv("DB_PORT", 5432))
-            }
-            print(f"Local config: { {k: v if k != 'password' else '***' for k, v in local_config.items()} }")
-            conn = psycopg2.connect(**local_config, cursor_factory=RealDictCursor)
-            print("✅ Successfully connected to local database")
-            return conn
-        except Exception as fallback_error:
-            print(f"❌ Fallback connection also failed: {fallback_error}")
-            print(f"Error type: {type(fallback_error).__name__}")
-            print("\nTroubleshooting steps:")
-            print("1. Verify your DATABASE_URL is correct")
-            print("2. Check if the database server is running and accessible")
-            print("3. Verify the database user has the correct permissions")
-            print("4. Check if the database exists and is accessible with the provided credentials")
-            print("5. Ensure your IP is whitelisted in the database's firewall settings")
-            raise
+@app.before_request
+def start_partition_maintenance():
+    # Creates the coming months' sales partitions (and archives old ones) in the background
+    partitions.maintainer.ensure_started()
 
 def get_item_price(item_name):
-    """Get the price of an item from the inventory."""
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT price FROM storage WHERE LOWER(item_name) = LOWER(%s)", (item_name,))
-            result = cur.fetchone()
-            return float(result['price']) if result else None
+    """Get the price of an item from the inventory (served from the catalog cache)."""
+    return catalog.price(item_name)
 
-def fetch_sales():
-    with get_db_connection() as conn:
+def fetch_summary(period=None):
+    """Sales summary (same shape as compute_summary).
+
+    The all-time summary is read from the rollup tables; windowed
+    summaries are aggregated in SQL. Served by a replica when one is
+    configured and safe to use.
+    """
+    with read_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT * FROM sales ORDER BY id DESC;")
-            return cur.fetchall()
+            if period is None:
+                return rollups.read_summary(cur)
+            return compute_summary_sql(cur, period=period)
 
 def delete_sale(sale_id):
     with get_db_connection() as conn:
         with conn.cursor() as cur:
             if str(sale_id).lower() == 'all':
-                cur.execute("DELETE FROM sales RETURNING id;")
-                deleted = cur.fetchall()
+                # TRUNCATE empties every partition without visiting rows; the
+                # running totals (read under the same lock) give the count
+                cur.execute("LOCK TABLE sales IN ACCESS EXCLUSIVE MODE")
+                deleted_count = rollups.read_totals(cur)['total_sales']
+                cur.execute("TRUNCATE sales")
+                rollups.reset(cur)
+                live.publish_refresh(cur, "sales")
                 conn.commit()
-                return {"message": "All sales have been deleted", "deleted_count": len(deleted)}
+                return {"message": "All sales have been deleted", "deleted_count": deleted_count}
             else:
                 cur.execute("DELETE FROM sales WHERE id = %s RETURNING *;", (sale_id,))
                 deleted = cur.fetchone()
+                if deleted:
+                    rollups.apply_sales(cur, [deleted], sign=-1)
+                    live.publish_sales_deleted(cur, [deleted])
                 conn.commit()
                 if deleted:
                     return {"message": f"Sale #{sale_id} has been deleted", "deleted_sale": deleted}
@@ -152,52 +109,15 @@ def delete_sale(sale_id):
                     return {"error": f"No sale found with ID {sale_id}"}
 
 def insert_sale(item_name, quantity, price):
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            # First check if we have enough quantity in stock
-            cur.execute(
-                "SELECT quantity FROM storage WHERE LOWER(item_name) = LOWER(%s) FOR UPDATE;",
-                (item_name,)
-            )
-            stock = cur.fetchone()
-            
-            if not stock:
-                raise ValueError(f"Item '{item_name}' not found in inventory")
-                
-            current_quantity = stock['quantity']
-            if current_quantity < quantity:
-                raise ValueError(f"Insufficient stock for '{item_name}'. Available: {current_quantity}, Requested: {quantity}")
-            
-            # Insert the sale
-            cur.execute(
-                "INSERT INTO sales (item_name, quantity, price) VALUES (%s, %s, %s) RETURNING *;",
-                (item_name, float(quantity), float(price))
-            )
-            result = cur.fetchone()
-            
-            # Update the storage quantity
-            cur.execute(
-                "UPDATE storage SET quantity = quantity - %s WHERE LOWER(item_name) = LOWER(%s) RETURNING quantity;",
-                (quantity, item_name)
-            )
-            updated_stock = cur.fetchone()
-            
-            conn.commit()
-            return result
-
-def delete_sale(sale_id):
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            if sale_id.lower() == 'all':
-                cur.execute("DELETE FROM sales;")
-                return {"message": "All sales have been deleted", "deleted_count": cur.rowcount}
-            else:
-                cur.execute("DELETE FROM sales WHERE id = %s RETURNING *;", (sale_id,))
-                deleted = cur.fetchone()
-                if deleted:
-                    return {"message": f"Sale #{sale_id} has been deleted", "deleted_sale": deleted}
-                else:
-                    return {"error": f"No sale found with ID {sale_id}"}
+    """Record a single sale, raising ValueError if it cannot be sold."""
+    outcome = record_sales(
+        [{"item_name": item_name, "quantity": quantity, "price": price}],
+        mode=ALL_OR_NOTHING
+    )
+    line = outcome["lines"][0]
+    if line["status"] != "added":
+        raise ValueError(line["error"])
+    return outcome["sales"][0]
 
 def parse_sales_input(text):
     """
@@ -314,14 +234,95 @@ def delete_sale_route(sale_id):
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/sales', methods=['GET'])
+# ?item= resolves the name through storage, so a rename changes the result
+@conditional('sales', 'storage')
 def get_sales():
+    """List sales newest first.
+
+    Query parameters: ``limit`` (page size), ``cursor`` (from the previous
+    page's ``X-Next-Cursor`` header), ``since``/``until`` (ISO dates),
+    ``item`` (exact item name) and ``q`` (text search). Without any of them
+    the most recent sales are returned, capped at ``UNPAGED_CAP`` rows.
+    ``fields`` and ``layout`` shape the rows (see :func:`fastjson.rows_response`).
+    """
     try:
-        sales = fetch_sales()
-        summary = compute_summary(sales)
-        return jsonify(sales), 200
+        args = request.args
+        paged = any(key in args for key in ('limit', 'cursor', 'since', 'until', 'item', 'q'))
+        with read_connection() as conn:
+            with conn.cursor() as cur:
+                sales, next_cursor = fetch_sales_page(
+                    cur,
+                    limit=args.get('limit', DEFAULT_PAGE_SIZE if paged else UNPAGED_CAP, type=int),
+                    cursor=args.get('cursor'),
+                    since=parse_datetime(args.get('since'), 'since'),
+                    until=parse_datetime(args.get('until'), 'until'),
+                    item=args.get('item'),
+                    q=args.get('q')
+                )
+        response = fastjson.rows_response(sales)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+            next_args = args.to_dict()
+            next_args['cursor'] = next_cursor
+            response.headers['Link'] = f'<{url_for("get_sales", **next_args)}>; rel="next"'
+        return response, 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/sales/export', methods=['GET'])
+def export_sales():
+    """Stream sales as NDJSON (default) or CSV: ``?format=csv&since=2024-01-01&until=2024-02-01``."""
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown export format '{fmt}'. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        since = parse_datetime(request.args.get('since'), 'since')
+        until = parse_datetime(request.args.get('until'), 'until')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    item = request.args.get('item')
+
+    def generate():
+        with get_db_connection() as conn:
+            yield from iter_sales_export(conn, fmt, since=since, until=until, item=item)
+
+    filename = f"sales-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{'csv' if fmt == 'csv' else 'ndjson'}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/api/sales/bulk', methods=['POST'])
+def bulk_add_sales():
+    """Ingest many sales at once from CSV (``Content-Type: text/csv``) or a JSON array.
+
+    Columns/fields: item_name, quantity and optionally price and created_at.
+    ``?mode=all_or_nothing`` rejects the whole batch if any line fails.
+    """
+    try:
+        mode = request.args.get('mode', BEST_EFFORT)
+        if request.mimetype in ('text/csv', 'application/csv', 'text/plain'):
+            rows = parse_csv(request.get_data(as_text=True))
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                mode = data.get('mode', mode)
+                data = data.get('sales')
+            if not isinstance(data, list):
+                return jsonify({"error": "Send a CSV body or a JSON array of sales"}), 400
+            rows = data
+        result = ingest_sales(rows, mode=mode)
+        status = 201 if result['inserted'] else 400
+        return jsonify(result), status
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error in bulk_add_sales: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route("/sales", methods=["POST"])
 @app.route('/api/sales', methods=['POST'])
 def add_sale():
@@ -361,23 +362,34 @@ def add_sale():
         except (ValueError, TypeError) as e:
             return jsonify({"error": "Invalid quantity or price format. Must be positive numbers."}), 400
         
+        # Existence is checked against the catalog cache; stock is checked by the decrement below
+        entry = catalog.lookup(item_name)
+        if not entry:
+            return jsonify({
+                "error": f"Item '{item_name}' not found in inventory. Please add it to inventory first.",
+                "suggestion": "Check your spelling or add the item to inventory first."
+            }), 404
+        item_name = entry['item_name']
+        
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                # First check if item exists and get current stock
-                cur.execute(
-                    "SELECT item_id, item_name, quantity FROM storage WHERE LOWER(item_name) = LOWER(%s) FOR UPDATE;",
-                    (item_name,)
-                )
-                item = cur.fetchone()
-                
-                if not item:
-                    return jsonify({
-                        "error": f"Item '{item_name}' not found in inventory. Please add it to inventory first.",
-                        "suggestion": "Check your spelling or add the item to inventory first."
-                    }), 404
+                # Check and take the stock in one statement; the item's row stays
+                # locked from here to the commit, so only cheap writes follow
+                updated_item = take_stock(cur, entry['item_id'], quantity, entry['stock_shards'])
                 
-                # Check if we have enough stock
-                if item['quantity'] < quantity:
+                if not updated_item:
+                    conn.rollback()
+                    cur.execute(
+                        "SELECT item_id, item_name, quantity FROM storage_stock WHERE item_id = %s",
+                        (entry['item_id'],)
+                    )
+                    item = cur.fetchone()
+                    if not item:
+                        catalog.invalidate()
+                        return jsonify({
+                            "error": f"Item '{item_name}' not found in inventory. Please add it to inventory first.",
+                            "suggestion": "Check your spelling or add the item to inventory first."
+                        }), 404
                     return jsonify({
                         "error": f"Insufficient stock for '{item['item_name']}'. Available: {item['quantity']}, Requested: {quantity}",
                         "item_id": item['item_id'],
@@ -387,47 +399,28 @@ def add_sale():
                 
                 # Record the sale
                 cur.execute(
-                    "INSERT INTO sales (item_name, quantity, price) VALUES (%s, %s, %s) RETURNING *;",
-                    (item_name, quantity, price)
+                    "INSERT INTO sales (item_id, item_name, quantity, price) VALUES (%s, %s, %s, %s) RETURNING *;",
+                    (entry['item_id'], item_name, quantity, price)
                 )
                 sale = cur.fetchone()
+                rollups.apply_sales(cur, [sale])
                 
-                # Update the inventory
-                cur.execute(
-                    "UPDATE storage SET quantity = quantity - %s WHERE item_id = %s RETURNING quantity;",
-                    (quantity, item['item_id'])
-                )
-                updated_stock = cur.fetchone()
-                
-                # Get updated sales summary
-                cur.execute("""
-                    SELECT 
-                        COUNT(*) as total_sales,
-                        SUM(quantity) as total_items_sold,
-                        SUM(quantity * price) as total_revenue
-                    FROM sales
-                """)
-                summary = cur.fetchone()
+                # Get updated sales summary from the running totals
+                summary = rollups.read_totals(cur)
+                live.publish_sales(cur, [sale], [updated_item], totals=summary)
                 
                 conn.commit()
                 
-                # Get updated inventory for the sold item
-                cur.execute(
-                    "SELECT * FROM storage WHERE item_id = %s",
-                    (item['item_id'],)
-                )
-                updated_item = cur.fetchone()
-                
                 return jsonify({
                     "success": True,
                     "sale": dict(sale) if sale else None,
                     "inventory_update": {
-                        "item_id": item['item_id'],
-                        "item_name": item['item_name'],
-                        "previous_quantity": item['quantity'],
-                        "new_quantity": updated_stock['quantity'],
+                        "item_id": updated_item['item_id'],
+                        "item_name": updated_item['item_name'],
+                        "previous_quantity": updated_item['quantity'] + quantity,
+                        "new_quantity": updated_item['quantity'],
                         "quantity_sold": quantity,
-                        "updated_item": dict(updated_item) if updated_item else None
+                        "updated_item": dict(updated_item)
                     },
                     "summary": dict(summary) if summary else {},
                     "message": f"Successfully recorded sale: {quantity}x {item_name} at ${price:.2f} each"
@@ -443,30 +436,67 @@ def add_sale():
         }), 500
 
 @app.route("/api/analytics")
+# Items are listed under their current names in storage
+@conditional('sales', 'storage', vary=lambda: time_bucket() if request.args.get('period') else '')
 def get_analytics():
     try:
-        sales = fetch_sales()
-        analytics = compute_summary(sales)
+        analytics = fetch_summary(request.args.get('period'))
         return jsonify({
             "success": True,
             "analytics": analytics
         }), 200
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
 
+# ---------------- Live Updates ----------------
+@app.route('/api/live')
+def live_updates():
+    """Dashboard change events as Server-Sent Events (see live.py). A 503 means: keep polling."""
+    subscription = broadcaster.subscribe(request.headers.get('Last-Event-ID'))
+    if subscription is None:
+        return jsonify({"error": "Too many live connections on this worker, poll instead"}), 503
+
+    def generate():
+        # Ending the stream now and then lets the browser reconnect to a less busy worker
+        deadline = time.monotonic() + live.LIVE_MAX_DURATION
+        with subscription:
+            yield "retry: 3000\n\n"
+            for item in subscription.events():
+                if item is None:
+                    yield ": keepalive\n\n"
+                else:
+                    event_id, name, data = item
+                    yield f"id: {event_id}\nevent: {name}\ndata: {data}\n\n"
+                if time.monotonic() > deadline:
+                    return
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # ---------------- Items API ----------------
 @app.route('/api/items', methods=['GET', 'POST'])
+@conditional('storage')
 def handle_items():
     if request.method == 'GET':
         try:
-            with get_db_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute("SELECT * FROM storage ORDER BY item_name")
+            with read_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT * FROM storage_stock ORDER BY item_name")
                     items = cur.fetchall()
-                    return jsonify(items)
+            return fastjson.rows_response(items)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             app.logger.error(f"Error fetching items: {str(e)}")
             return jsonify({"error": "Failed to fetch items"}), 500
@@ -481,26 +511,24 @@ def handle_items():
             if not item_name or price is None:
                 return jsonify({"error": "Item name and price are required"}), 400
                 
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Check if item already exists
-            cursor.execute("SELECT * FROM storage WHERE LOWER(item_name) = LOWER(%s)", (item_name,))
-            if cursor.fetchone():
-                return jsonify({"error": "An item with this name already exists"}), 400
-            
-            # Insert new item
-            # Default quantity to 1 if not provided
-            quantity = request.json.get('quantity', 1)
-            cursor.execute(
-                "INSERT INTO storage (item_name, price, quantity) VALUES (%s, %s, %s) RETURNING item_id, item_name, price, quantity",
-                (item_name, price, quantity)
-            )
-            new_item = cursor.fetchone()
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with get_db_connection() as conn:
+                with conn.cursor() as cursor:
+                    # Check if item already exists
+                    if catalog.lookup(item_name):
+                        return jsonify({"error": "An item with this name already exists"}), 400
+                    
+                    # Insert new item
+                    # Default quantity to 1 if not provided
+                    quantity = request.json.get('quantity', 1)
+                    cursor.execute(
+                        "INSERT INTO storage (item_name, price, quantity) VALUES (%s, %s, %s) RETURNING item_id, item_name, price, quantity",
+                        (item_name, price, quantity)
+                    )
+                    new_item = cursor.fetchone()
+                    live.publish_stock(cursor, [new_item])
+                    
+                    conn.commit()
+                    catalog.invalidate()
             
             return jsonify({
                 "message": "Item added successfully",
@@ -508,17 +536,18 @@ def handle_items():
             }), 201
             
         except Exception as e:
-            print(f"Error adding item: {str(e)}")
+            app.logger.error(f"Error adding item: {str(e)}")
             return jsonify({"error": "Failed to add item"}), 500
 
 @app.route('/api/inventory/chart-data', methods=['GET'])
+@conditional('storage')
 def get_inventory_chart_data():
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        with read_connection() as conn:
+            with conn.cursor() as cur:
                 cur.execute("""
                     SELECT item_name as name, quantity 
-                    FROM storage 
+                    FROM storage_stock 
                     WHERE quantity > 0
                     ORDER BY quantity DESC
                 """)
@@ -534,490 +563,408 @@ def get_inventory_chart_data():
 @app.route('/api/items/<int:item_id>', methods=['DELETE'])
 def delete_item(item_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if item exists
-        cursor.execute("SELECT * FROM storage WHERE item_id = %s", (item_id,))
-        item = cursor.fetchone()
-        
-        if not item:
-            return jsonify({"error": "Item not found"}), 404
-        
-        # Check if item is referenced in sales
-        cursor.execute("SELECT COUNT(*) FROM sales WHERE item_name = %s", (item['item_name'],))
-        sales_count = cursor.fetchone()['count']
-        
-        if sales_count > 0:
-            return jsonify({
-                "error": "Cannot delete item with existing sales records. Delete the sales first."
-            }), 400
-        
-        # Delete the item
-        cursor.execute("DELETE FROM storage WHERE item_id = %s", (item_id,))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                # Check if item exists
+                cursor.execute("SELECT * FROM storage WHERE item_id = %s", (item_id,))
+                item = cursor.fetchone()
+                
+                if not item:
+                    return jsonify({"error": "Item not found"}), 404
+                
+                # Check if item is referenced in sales (an index probe on idx_sales_item_id_created_at)
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM sales WHERE item_id = %s) AS has_sales", (item_id,))
+                
+                if cursor.fetchone()['has_sales']:
+                    return jsonify({
+                        "error": "Cannot delete item with existing sales records. Delete the sales first."
+                    }), 400
+                
+                # Delete the item
+                cursor.execute("DELETE FROM storage WHERE item_id = %s", (item_id,))
+                live.publish_stock(cursor, removed=[item])
+                
+                conn.commit()
+                catalog.invalidate()
         
         return jsonify({"message": "Item deleted successfully"}), 200
         
     except Exception as e:
-        print(f"Error deleting item: {str(e)}")
+        app.logger.error(f"Error deleting item: {str(e)}")
         return jsonify({"error": "Failed to delete item"}), 500
 
+@app.route('/api/items/<int:item_id>/stock-shards', methods=['PUT'])
+def set_item_stock_shards(item_id):
+    """Split a hot item's stock across ``shards`` counters (0 turns sharding off)."""
+    data = request.get_json(silent=True) or {}
+    try:
+        shards = int(data.get('shards'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "shards must be a whole number"}), 400
+    if not 0 <= shards <= stock_shards.MAX_SHARDS:
+        return jsonify({"error": f"shards must be between 0 and {stock_shards.MAX_SHARDS}"}), 400
+
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                item = stock_shards.set_shards(cur, item_id, shards)
+                if not item:
+                    return jsonify({"error": "Item not found"}), 404
+                live.publish_stock(cur, [item])
+                conn.commit()
+                catalog.invalidate()
+        return jsonify({"success": True, "item": dict(item)})
+    except Exception as e:
+        app.logger.error(f"Error sharding stock of item {item_id}: {str(e)}")
+        return jsonify({"error": "Failed to update stock shards"}), 500
+
 # ---------------- AI Assistant ----------------
+def execute_ai_action(response_data):
+    """Carry out an action parsed from the user's message and return the response payload."""
+    action = response_data.get("action")
+
+    if action == "add_sale":
+        items = response_data.get("items")
+        if not items:
+            # Handle single item (backward compatibility)
+            items = [{
+                "item_name": response_data.get("item_name"),
+                "quantity": response_data.get("quantity"),
+                "price": response_data.get("price")
+            }]
+
+        # Record the whole basket in one transaction
+        mode = ALL_OR_NOTHING if response_data.get("all_or_nothing") else BEST_EFFORT
+        outcome = record_sales(items, mode=mode)
+
+        results = []
+        for line in outcome["lines"]:
+            if line["status"] == "added":
+                results.append(f"✅ Added {line['quantity']} {line['item_name']} at BND {line['price']:.2f} each (BND {line['total']:.2f})")
+            elif line["item_name"] and line["quantity"] is not None:
+                results.append(f"⚠️ Error adding {line['quantity']} {line['item_name']}: {line['error']}")
+            else:
+                results.append(f"⚠️ Skipping item: {line['error']}")
+        total_amount = outcome["total_amount"]
+
+        # Generate response message
+        if not results:
+            return {
+                "ai_response": "⚠️ No valid items to add. Please check your request.",
+                "action": "error"
+            }
+
+        message = "\n".join(results)
+        if len(results) > 1:
+            message += f"\n\nTotal: BND {total_amount:.2f}"
+
+        return {
+            "ai_response": response_data.get("message", message),
+            "action": "sale_added",
+            "lines": outcome["lines"],
+            "total_amount": total_amount
+        }
+
+    elif action == "get_summary":
+        summary = fetch_summary()
+        return {
+            "ai_response": response_data.get("message", "📊 Sales Summary"),
+            "action": "summary",
+            "summary": summary
+        }
+
+    elif action == "remove_sale":
+        sale_id = response_data.get("sale_id")
+        if not sale_id:
+            return {
+                "ai_response": "⚠️ Please specify a sale ID or 'all' to remove sales",
+                "action": "error"
+            }
+
+        if sale_id == "all" and not response_data.get("confirmed"):
+            return {
+                "ai_response": "⚠️ Are you sure you want to delete ALL sales? This cannot be undone! Type 'yes, delete all' to confirm.",
+                "action": "confirm_delete_all"
+            }
+
+        result = delete_sale(sale_id)
+        if "error" in result:
+            return {
+                "ai_response": f"❌ {result['error']}",
+                "action": "error"
+            }
+
+        return {
+            "ai_response": f"✅ {result['message']}",
+            "action": "sale_deleted",
+            "result": result
+        }
+
+    elif action == "convert_currency":
+        amount = response_data.get("amount")
+        from_currency = response_data.get("from_currency")
+        to_currency = response_data.get("to_currency")
+        # TO DO: implement currency conversion logic
+        return {
+            "ai_response": response_data.get("message", "📊 Currency Conversion"),
+            "action": "convert_currency",
+            "amount": amount,
+            "from_currency": from_currency,
+            "to_currency": to_currency
+        }
+
+    # Inventory Management Actions
+    elif action == "add_inventory":
+        item_name = response_data.get("item_name")
+        price = response_data.get("price")
+        quantity = response_data.get("quantity", 1)
+
+        if not item_name or price is None:
+            return {
+                "ai_response": "⚠️ Please provide both item name and price",
+                "action": "error"
+            }
+
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    # Check if item already exists
+                    if catalog.lookup(item_name):
+                        return {
+                            "ai_response": f"⚠️ An item named '{item_name}' already exists in inventory",
+                            "action": "error"
+                        }
+
+                    # Add new item
+                    cur.execute(
+                        "INSERT INTO storage (item_name, price, quantity) VALUES (%s, %s, %s) RETURNING *",
+                        (item_name, float(price), int(quantity))
+                    )
+                    new_item = cur.fetchone()
+                    live.publish_stock(cur, [new_item])
+                    conn.commit()
+                    catalog.invalidate()
+
+                    return {
+                        "ai_response": response_data.get("message", f"✅ Added {quantity} {item_name} to inventory at BND {price:.2f} each"),
+                        "action": "inventory_updated",
+                        "item": dict(new_item) if new_item else None
+                    }
+        except Exception as e:
+            return {
+                "ai_response": f"⚠️ Failed to add item to inventory: {str(e)}",
+                "action": "error"
+            }
+
+    elif action == "update_inventory":
+        item_id = response_data.get("item_id")
+        item_name = response_data.get("item_name")
+        price = response_data.get("price")
+        quantity = response_data.get("quantity")
+
+        if not item_id or (not item_name and price is None and quantity is None):
+            return {
+                "ai_response": "⚠️ Please provide item_id and at least one field to update (item_name, price, or quantity)",
+                "action": "error"
+            }
+
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    # Build dynamic update query based on provided fields
+                    update_fields = []
+                    params = []
+
+                    if item_name is not None:
+                        update_fields.append("item_name = %s")
+                        params.append(item_name)
+                    if price is not None:
+                        update_fields.append("price = %s")
+                        params.append(float(price))
+                    if quantity is not None:
+                        update_fields.append("quantity = %s")
+                        params.append(int(quantity))
+
+                    params.append(item_id)  # For WHERE clause
+
+                    query = f"""
+                        UPDATE storage 
+                        SET {', '.join(update_fields)}
+                        WHERE item_id = %s
+                        RETURNING *
+                    """
+
+                    cur.execute(query, params)
+                    updated_item = cur.fetchone()
+                    if updated_item and updated_item['stock_shards']:
+                        # The new quantity is the item's whole stock; otherwise add the shards back
+                        if quantity is not None:
+                            stock_shards.reset(cur, item_id)
+                        else:
+                            updated_item['quantity'] += stock_shards.shard_total(cur, item_id, lock=False)
+                    if updated_item and item_name is not None:
+                        # Dashboards key stock by name; a rename is easier to refetch
+                        live.publish_refresh(cur, "storage")
+                    elif updated_item:
+                        live.publish_stock(cur, [updated_item])
+                    conn.commit()
+                    catalog.invalidate()
+
+                    if not updated_item:
+                        return {
+                            "ai_response": f"⚠️ No item found with ID {item_id}",
+                            "action": "error"
+                        }
+
+                    return {
+                        "ai_response": response_data.get("message", f"✅ Updated item: {updated_item['item_name']}"),
+                        "action": "inventory_updated",
+                        "item": dict(updated_item) if updated_item else None
+                    }
+        except Exception as e:
+            return {
+                "ai_response": f"⚠️ Failed to update inventory: {str(e)}",
+                "action": "error"
+            }
+
+    elif action == "remove_inventory":
+        item_id = response_data.get("item_id")
+
+        if not item_id:
+            return {
+                "ai_response": "⚠️ Please provide item_id to remove",
+                "action": "error"
+            }
+
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    # First get the item name for the response message
+                    cur.execute("SELECT item_name FROM storage WHERE item_id = %s", (item_id,))
+                    item = cur.fetchone()
+
+                    if not item:
+                        return {
+                            "ai_response": f"⚠️ No item found with ID {item_id}",
+                            "action": "error"
+                        }
+
+                    cur.execute("SELECT EXISTS (SELECT 1 FROM sales WHERE item_id = %s) AS has_sales", (item_id,))
+                    if cur.fetchone()['has_sales']:
+                        return {
+                            "ai_response": f"⚠️ Cannot remove {item['item_name']}: it has sales records. Delete the sales first.",
+                            "action": "error"
+                        }
+
+                    # Delete the item
+                    cur.execute("DELETE FROM storage WHERE item_id = %s RETURNING *", (item_id,))
+                    deleted_item = cur.fetchone()
+                    live.publish_stock(cur, removed=[deleted_item])
+                    conn.commit()
+                    catalog.invalidate()
+
+                    return {
+                        "ai_response": response_data.get("message", f"✅ Removed {deleted_item['item_name']} from inventory"),
+                        "action": "inventory_updated",
+                        "item": dict(deleted_item) if deleted_item else None
+                    }
+        except Exception as e:
+            return {
+                "ai_response": f"⚠️ Failed to remove item from inventory: {str(e)}",
+                "action": "error"
+            }
+
+    elif action == "list_inventory":
+        try:
+            with read_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT * FROM storage_stock ORDER BY item_name")
+                    items = [dict(item) for item in cur.fetchall()]
+
+                    return {
+                        "ai_response": response_data.get("message", "📋 Current Inventory"),
+                        "action": "list_inventory",
+                        "inventory": items
+                    }
+        except Exception as e:
+            return {
+                "ai_response": f"⚠️ Failed to fetch inventory: {str(e)}",
+                "action": "error"
+            }
+
+    # For chat responses or unrecognized actions
+    return {
+        "ai_response": response_data.get("message", "I'm not sure how to respond to that."),
+        "action": "chat"
+    }
+
+def answer_without_gemini(user_text):
+    """Answer from the local parser or the response cache, or degrade if Gemini is down.
+
+    Returns ``(payload, cache_key)``; ``payload`` is None when Gemini has to be asked.
+    """
+    # Common sale phrases are parsed locally without a Gemini round trip
+    local_action = parse_local_command(user_text, catalog)
+    if local_action:
+        payload = execute_ai_action(local_action)
+        payload["handled_by"] = "local"
+        return payload, None
+
+    if not GEMINI_API_KEY:
+        return gemini_unavailable(), None
+
+    # Repeated phrases reuse the parsed action from an earlier Gemini call
+    cache_key = make_key(user_text, catalog.version, llm.version)
+    response_data = response_cache.get(cache_key)
+    if response_data is not None:
+        payload = execute_ai_action(response_data)
+        payload["handled_by"] = "cache"
+        return payload, cache_key
+
+    # Don't queue behind a Gemini outage
+    if not gateway.available():
+        return gemini_unavailable("circuit_open"), None
+    return None, cache_key
+
+def gemini_unavailable(reason=None):
+    payload = {"ai_response": "⚠️ Gemini unavailable. Enter sales manually.", "handled_by": "none"}
+    if reason:
+        payload["reason"] = reason
+    return payload
+
+def answer_from_gemini(ai_response, usage, cache_key):
+    """Parse a Gemini reply, cache the parsed action and carry it out."""
+    response_data = parse_reply(ai_response)
+    if response_data is None:
+        return {
+            "ai_response": "⚠️ I had trouble processing that request. Please try rephrasing it.",
+            "action": "error",
+            "handled_by": "gemini"
+        }
+
+    # Only the parsed action is cached, never the result of running it
+    response_cache.set(cache_key, response_data)
+    payload = execute_ai_action(response_data)
+    payload["handled_by"] = "gemini"
+    payload["usage"] = usage
+    return payload
+
 @app.route("/ai", methods=["POST"])
 def ai_assistant():
     user_text = request.json.get("user_text")
     if not user_text:
         return jsonify({"error":"No input"}), 400
 
-    if not GEMINI_API_KEY:
-        return jsonify({"ai_response":"⚠️ Gemini unavailable. Enter sales manually."}), 200
-
-    system_prompt = """
-You are **Laku**, a friendly Bruneian AI assistant built by Team Katalis to help small businesses track sales and manage inventory.
-
- Core Rules
-1. **Always output valid JSON only** (inside triple backticks). No extra text outside JSON.
-2. **Monetary values:** numbers only (no currency symbols).
-3. **Quantities:** whole numbers only.
-4. Use the **exact action names and field names** listed below.
-5. Default currency: **BND (Brunei Dollar)** unless specified.
-6. **Language:** Match user's language (English or Malay).
-7. **Multiple items:**
-   - Parse items separated by commas, "and", or newlines.
-   - Support multiple formats: 
-     - `1 item1, 2 item2`
-     - `1x item1, 2x item2`
-     - `item1 x1, item2 x2`
-     - `add 3 of item1 and 2 of item2`
-   - Always use the `items` array format in JSON when multiple items are present.
-   - **Do not ask user for missing prices.** Always assume the price exists in the storage table and will be retrieved automatically.
-   - Provide a total price in the confirmation message when multiple items are added.
-
- Available Actions
-
- 1. Sales Management
-- **Add Sale (single or multiple items):**
-  - Single item:
-  ```json
-  {
-    "action": "add_sale",
-    "item_name": "product name",
-    "quantity": 1,
-    "currency": "BND",
-    "message": "Friendly confirmation message"
-  }
-  ```
-  - Multiple items (preferred format):
-  ```json
-  {
-    "action": "add_sale",
-    "items": [
-      {"item_name": "product 1", "quantity": 1},
-      {"item_name": "product 2", "quantity": 2}
-    ],
-    "currency": "BND",
-    "message": "Friendly confirmation message for multiple items"
-  }
-  ```
-
-- **Remove Sale:**
-  - Remove specific sale: 
-    ```json
-    {"action": "remove_sale", "sale_id": 123, "message": "..."}
-    ```
-  - Remove all sales: 
-    ```json
-    {"action": "remove_sale", "sale_id": "all", "confirmed": true, "message": "..."}
-    ```
-
-- **Get Sales Summary:**
-  ```json
-  {
-    "action": "get_summary",
-    "currency": "BND",
-    "message": "Sales summary for today"
-  }
-  ```
-
- 2. Inventory Management
-- **Add New Item to Inventory:**
-  ```json
-  {
-    "action": "add_inventory",
-    "item_name": "product name",
-    "price": 5.00,
-    "quantity": 10,
-    "message": "Added new item to inventory"
-  }
-  ```
-
-- **Update Inventory Item:**
-  ```json
-  {
-    "action": "update_inventory",
-    "item_id": 1,
-    "item_name": "updated name",
-    "price": 6.00,
-    "quantity": 15,
-    "message": "Updated item details"
-  }
-  ```
-
-- **Remove Item from Inventory:**
-  ```json
-  {
-    "action": "remove_inventory",
-    "item_id": 1,
-    "message": "Item removed from inventory"
-  }
-  ```
-
-- **List Inventory:**
-  ```json
-  {
-    "action": "list_inventory",
-    "message": "Current inventory items"
-  }
-  ```
-
- 3. General
-- **Chat/General Response:**
-  ```json
-  {
-    "action": "chat",
-    "message": "Your friendly response here"
-  }
-  ```
-
- Examples
-
- Adding Multiple Sales (with prices from storage table)
-```json
-{
-  "function_call": [
-    {"action": "add_sale", "item_name": "nasi_lemak", "quantity": 2, "currency": "BND", "message": "2 nasi lemak added"},
-    {"action": "add_sale", "item_name": "teh_tarik", "quantity": 1, "currency": "BND", "message": "1 teh tarik added"}
-  ],
-  "reply": "✅ Added 2 nasi lemak and 1 teh tarik. Total will be retrieved based on stored prices."
-}
-```
-
- Adding New Inventory
-```json
-{
-  "action": "add_inventory",
-  "item_name": "ayam_penyet",
-  "price": 6.50,
-  "quantity": 20,
-  "message": "Added 20 ayam penyet to inventory at BND 6.50 each"
-}
-```
-"""
-
-
     try:
-        # Add user's message to the prompt
-        full_prompt = system_prompt + '\n\nUser: ' + user_text + '\n"""'
-        
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(full_prompt)
-        ai_response = response.text.strip()
-        
-        # Try to extract JSON from code blocks
-        import re
-        json_match = re.search(r'```(?:json\n)?(.*?)\n```', ai_response, re.DOTALL)
-        
-        if json_match:
+        payload, cache_key = answer_without_gemini(user_text)
+        if payload is None:
+            # The worker's model already carries the system prompt; only the user's text is sent
             try:
-                response_data = json.loads(json_match.group(1).strip())
-                action = response_data.get("action")
-                
-                if action == "add_sale":
-                    items = response_data.get("items")
-                    if not items:
-                        # Handle single item (backward compatibility)
-                        items = [{
-                            "item_name": response_data.get("item_name"),
-                            "quantity": response_data.get("quantity"),
-                            "price": response_data.get("price")
-                        }]
-                    
-                    results = []
-                    total_amount = 0
-                    
-                    for item in items:
-                        item_name = item.get("item_name")
-                        quantity = item.get("quantity")
-                        price = item.get("price")
-                        
-                        if not item_name or quantity is None:
-                            results.append(f"⚠️ Skipping item: Missing name or quantity")
-                            continue
-                        
-                        # If price is not provided, try to get it from inventory
-                        if price is None:
-                            try:
-                                price = get_item_price(item_name)
-                                if price is None:
-                                    results.append(f"⚠️ Could not find price for '{item_name}'. Please add it to inventory first.")
-                                    continue
-                            except Exception as e:
-                                results.append(f"⚠️ Error getting price for '{item_name}': {str(e)}")
-                                continue
-                        
-                        try:
-                            sale = insert_sale(item_name, quantity, price)
-                            if sale:
-                                item_total = quantity * price
-                                total_amount += item_total
-                                results.append(f"✅ Added {quantity} {item_name} at BND {price:.2f} each (BND {item_total:.2f})")
-                        except Exception as e:
-                            results.append(f"⚠️ Error adding {quantity} {item_name}: {str(e)}")
-                    
-                    # Generate response message
-                    if not results:
-                        return jsonify({
-                            "ai_response": "⚠️ No valid items to add. Please check your request.",
-                            "action": "error"
-                        })
-                    
-                    message = "\n".join(results)
-                    if len(results) > 1:
-                        message += f"\n\nTotal: BND {total_amount:.2f}"
-                    
-                    return jsonify({
-                        "ai_response": response_data.get("message", message),
-                        "action": "sale_added"
-                    })
-                
-                elif action == "get_summary":
-                    sales = fetch_sales()
-                    summary = compute_summary(sales)
-                    return jsonify({
-                        "ai_response": response_data.get("message", "📊 Sales Summary"),
-                        "action": "summary",
-                        "summary": summary
-                    })
-                    
-                elif action == "remove_sale":
-                    sale_id = response_data.get("sale_id")
-                    if not sale_id:
-                        return jsonify({
-                            "ai_response": "⚠️ Please specify a sale ID or 'all' to remove sales",
-                            "action": "error"
-                        })
-                        
-                    if sale_id == "all" and not response_data.get("confirmed"):
-                        return jsonify({
-                            "ai_response": "⚠️ Are you sure you want to delete ALL sales? This cannot be undone! Type 'yes, delete all' to confirm.",
-                            "action": "confirm_delete_all"
-                        })
-                        
-                    result = delete_sale(sale_id)
-                    if "error" in result:
-                        return jsonify({
-                            "ai_response": f"❌ {result['error']}",
-                            "action": "error"
-                        })
-                    
-                    return jsonify({
-                        "ai_response": f"✅ {result['message']}",
-                        "action": "sale_deleted",
-                        "result": result
-                    })
-                    
-                elif action == "convert_currency":
-                    amount = response_data.get("amount")
-                    from_currency = response_data.get("from_currency")
-                    to_currency = response_data.get("to_currency")
-                    # TO DO: implement currency conversion logic
-                    return jsonify({
-                        "ai_response": response_data.get("message", "📊 Currency Conversion"),
-                        "action": "convert_currency",
-                        "amount": amount,
-                        "from_currency": from_currency,
-                        "to_currency": to_currency
-                    })
-                
-                # Inventory Management Actions
-                elif action == "add_inventory":
-                    item_name = response_data.get("item_name")
-                    price = response_data.get("price")
-                    quantity = response_data.get("quantity", 1)
-                    
-                    if not item_name or price is None:
-                        return jsonify({
-                            "ai_response": "⚠️ Please provide both item name and price",
-                            "action": "error"
-                        })
-                    
-                    try:
-                        with get_db_connection() as conn:
-                            with conn.cursor() as cur:
-                                # Check if item already exists
-                                cur.execute("SELECT * FROM storage WHERE LOWER(item_name) = LOWER(%s)", (item_name,))
-                                if cur.fetchone():
-                                    return jsonify({
-                                        "ai_response": f"⚠️ An item named '{item_name}' already exists in inventory",
-                                        "action": "error"
-                                    })
-                                
-                                # Add new item
-                                cur.execute(
-                                    "INSERT INTO storage (item_name, price, quantity) VALUES (%s, %s, %s) RETURNING *",
-                                    (item_name, float(price), int(quantity))
-                                )
-                                new_item = cur.fetchone()
-                                conn.commit()
-                                
-                                return jsonify({
-                                    "ai_response": response_data.get("message", f"✅ Added {quantity} {item_name} to inventory at BND {price:.2f} each"),
-                                    "action": "inventory_updated",
-                                    "item": dict(new_item) if new_item else None
-                                })
-                    except Exception as e:
-                        return jsonify({
-                            "ai_response": f"⚠️ Failed to add item to inventory: {str(e)}",
-                            "action": "error"
-                        })
-                
-                elif action == "update_inventory":
-                    item_id = response_data.get("item_id")
-                    item_name = response_data.get("item_name")
-                    price = response_data.get("price")
-                    quantity = response_data.get("quantity")
-                    
-                    if not item_id or (not item_name and price is None and quantity is None):
-                        return jsonify({
-                            "ai_response": "⚠️ Please provide item_id and at least one field to update (item_name, price, or quantity)",
-                            "action": "error"
-                        })
-                    
-                    try:
-                        with get_db_connection() as conn:
-                            with conn.cursor() as cur:
-                                # Build dynamic update query based on provided fields
-                                update_fields = []
-                                params = []
-                                
-                                if item_name is not None:
-                                    update_fields.append("item_name = %s")
-                                    params.append(item_name)
-                                if price is not None:
-                                    update_fields.append("price = %s")
-                                    params.append(float(price))
-                                if quantity is not None:
-                                    update_fields.append("quantity = %s")
-                                    params.append(int(quantity))
-                                
-                                params.append(item_id)  # For WHERE clause
-                                
-                                query = f"""
-                                    UPDATE storage 
-                                    SET {', '.join(update_fields)}
-                                    WHERE item_id = %s
-                                    RETURNING *
-                                """
-                                
-                                cur.execute(query, params)
-                                updated_item = cur.fetchone()
-                                conn.commit()
-                                
-                                if not updated_item:
-                                    return jsonify({
-                                        "ai_response": f"⚠️ No item found with ID {item_id}",
-                                        "action": "error"
-                                    })
-                                
-                                return jsonify({
-                                    "ai_response": response_data.get("message", f"✅ Updated item: {updated_item['item_name']}"),
-                                    "action": "inventory_updated",
-                                    "item": dict(updated_item) if updated_item else None
-                                })
-                    except Exception as e:
-                        return jsonify({
-                            "ai_response": f"⚠️ Failed to update inventory: {str(e)}",
-                            "action": "error"
-                        })
-                
-                elif action == "remove_inventory":
-                    item_id = response_data.get("item_id")
-                    
-                    if not item_id:
-                        return jsonify({
-                            "ai_response": "⚠️ Please provide item_id to remove",
-                            "action": "error"
-                        })
-                    
-                    try:
-                        with get_db_connection() as conn:
-                            with conn.cursor() as cur:
-                                # First get the item name for the response message
-                                cur.execute("SELECT item_name FROM storage WHERE item_id = %s", (item_id,))
-                                item = cur.fetchone()
-                                
-                                if not item:
-                                    return jsonify({
-                                        "ai_response": f"⚠️ No item found with ID {item_id}",
-                                        "action": "error"
-                                    })
-                                
-                                # Delete the item
-                                cur.execute("DELETE FROM storage WHERE item_id = %s RETURNING *", (item_id,))
-                                deleted_item = cur.fetchone()
-                                conn.commit()
-                                
-                                return jsonify({
-                                    "ai_response": response_data.get("message", f"✅ Removed {deleted_item['item_name']} from inventory"),
-                                    "action": "inventory_updated",
-                                    "item": dict(deleted_item) if deleted_item else None
-                                })
-                    except Exception as e:
-                        return jsonify({
-                            "ai_response": f"⚠️ Failed to remove item from inventory: {str(e)}",
-                            "action": "error"
-                        })
-                
-                elif action == "list_inventory":
-                    try:
-                        with get_db_connection() as conn:
-                            with conn.cursor() as cur:
-                                cur.execute("SELECT * FROM storage ORDER BY item_name")
-                                items = [dict(item) for item in cur.fetchall()]
-                                
-                                return jsonify({
-                                    "ai_response": response_data.get("message", "📋 Current Inventory"),
-                                    "action": "list_inventory",
-                                    "inventory": items
-                                })
-                    except Exception as e:
-                        return jsonify({
-                            "ai_response": f"⚠️ Failed to fetch inventory: {str(e)}",
-                            "action": "error"
-                        })
-                
-                # For chat responses or unrecognized actions
-                return jsonify({
-                    "ai_response": response_data.get("message", "I'm not sure how to respond to that."),
-                    "action": "chat"
-                })
-                
-            except json.JSONDecodeError as e:
-                # If JSON parsing fails, return the raw AI response
-                return jsonify({
-                    "ai_response": f"⚠️ I had trouble processing that request. {str(e)}",
-                    "action": "error"
-                })
-        
-        # If no JSON found, return the raw response as a chat message
-        return jsonify({
-            "ai_response": ai_response,
-            "action": "chat"
-        })
+                ai_response, usage = gateway.generate(user_text)
+            except LLMUnavailable as e:
+                return jsonify(gemini_unavailable(e.reason))
+            payload = answer_from_gemini(ai_response, usage, cache_key)
+        return jsonify(payload)
             
     except Exception as e:
         return jsonify({
@@ -1025,18 +972,58 @@ You are **Laku**, a friendly Bruneian AI assistant built by Team Katalis to help
             "action": "error"
         }), 200
 
+@app.route("/ai/stream", methods=["POST"])
+def ai_assistant_stream():
+    """Same as /ai, as Server-Sent Events: ``ack``, then ``delta`` text while Gemini writes, then ``result``."""
+    user_text = request.json.get("user_text")
+    if not user_text:
+        return jsonify({"error":"No input"}), 400
+
+    def event(name, data):
+        return f"event: {name}\ndata: {flask_json.dumps(data)}\n\n"
+
+    def generate():
+        yield event("ack", {"status": "received"})
+        try:
+            payload, cache_key = answer_without_gemini(user_text)
+            if payload is None:
+                reply = gateway.stream(user_text)
+                extractor = MessageExtractor()
+                for chunk in reply:
+                    text = extractor.feed(chunk)
+                    if text:
+                        yield event("delta", {"text": text})
+                payload = answer_from_gemini(reply.text, reply.usage, cache_key)
+        except LLMUnavailable as e:
+            payload = gemini_unavailable(e.reason)
+        except Exception as e:
+            payload = {
+                "ai_response": f"⚠️ An error occurred: {str(e)}",
+                "action": "error"
+            }
+        yield event("result", payload)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # ---------------- Test Routes ----------------
 @app.route('/test-db')
 def test_db():
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute('SELECT version()')
-            db_version = cur.fetchone()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('SELECT version()')
+                db_version = cur.fetchone()
+        live_stats = broadcaster.stats()
         return jsonify({
             'status': 'success',
             'database': 'connected',
-            'version': db_version['version'] if db_version else 'unknown'
+            'version': db_version['version'] if db_version else 'unknown',
+            # Dashboards turned away here poll instead of getting live updates
+            'live': {key: live_stats[key] for key in ('worker_mode', 'subscribers', 'limit', 'refused')}
         })
     except Exception as e:
         return jsonify({
@@ -1045,20 +1032,41 @@ def test_db():
             'type': type(e).__name__
         }), 500
 
+@app.route('/test-db/pool')
+def test_db_pool():
+    return jsonify({'status': 'success', 'pool': pool_stats(), 'replicas': router.stats()})
+
+@app.route('/api/ai/stats')
+def ai_stats():
+    return jsonify({'status': 'success', 'llm': llm.stats(), 'gateway': gateway.stats(), 'response_cache': response_cache.stats()})
+
+@app.route('/test-db/catalog')
+def test_db_catalog():
+    return jsonify({'status': 'success', 'catalog': catalog.stats()})
+
+@app.route('/test-db/live')
+def test_db_live():
+    return jsonify({'status': 'success', 'live': broadcaster.stats()})
+
+@app.route('/test-db/partitions')
+def test_db_partitions():
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            listing = partitions.list_partitions(cur)
+    return jsonify({'status': 'success', 'maintenance': partitions.maintainer.stats(), 'partitions': listing})
+
 # ---------------- Run ----------------
 if __name__ == "__main__":
-    # Print environment variables (for debugging, remove in production)
-    print("Environment Variables:")
+    # Log database settings (masked) for debugging
     for key, value in os.environ.items():
         if 'DATABASE' in key or 'DB_' in key:
-            print(f"{key}: {'*' * 8 + value[-8:] if value else 'Not set'}")
+            app.logger.debug(f"{key}: {'*' * 8 + value[-8:] if value else 'Not set'}")
     
     # Test database connection on startup
     try:
-        conn = get_db_connection()
-        print("✅ Database connection successful!")
-        conn.close()
+        with get_db_connection():
+            app.logger.info("✅ Database connection successful!")
     except Exception as e:
-        print(f"❌ Database connection failed: {e}")
+        app.logger.error(f"❌ Database connection failed: {e}")
     
     app.run(debug=True)
@@ -0,0 +1,145 @@
+"""Fingerprinted, precompressed static assets.
+
+:func:`build` copies every file under ``static/`` to
+``static/dist/<name>.<hash><ext>``, named after a hash of its content,
+plus ``.br`` and ``.gz`` siblings for text files, and writes
+``static/dist/manifest.json`` mapping each source to its copy. It only
+writes what changed, and :func:`init_app` runs it at startup, so editing a
+file and restarting is enough.
+
+Templates keep calling ``url_for('static', filename='script.js')``; the
+URL is rewritten to the fingerprinted copy, which is served with
+``Cache-Control: immutable`` and the best precompressed encoding the
+client accepts. A changed file gets a new name, so repeat page loads
+never revalidate an unchanged asset. In debug mode, or if the build
+fails (e.g. a read-only filesystem), the plain files are served.
+
+    python assets.py build
+"""
+import os
+import sys
+import json
+import hashlib
+import logging
+import tempfile
+import mimetypes
+import contextlib
+
+from flask import request, send_from_directory
+
+import compression
+
+logger = logging.getLogger(__name__)
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+HASH_LENGTH = 12
+MAX_AGE = 365 * 24 * 3600
+# Already-compressed formats (images, fonts) only get a fingerprinted copy
+PRECOMPRESSED_EXTENSIONS = (".js", ".css", ".html", ".svg", ".json", ".txt", ".map")
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _sources(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir and DIST in dirs:
+            dirs.remove(DIST)
+        for name in files:
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, static_dir).replace(os.sep, "/"), path
+
+
+def _write(path, data):
+    # Without --preload every worker builds at startup; each writes its own
+    # temporary file, so one cannot truncate or rename away another's
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".partial")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.chmod(partial, 0o644)
+        os.replace(partial, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(partial)
+        raise
+
+
+def build(static_dir):
+    """Fingerprint and precompress every file in ``static_dir``; returns the manifest."""
+    dist_dir = os.path.join(static_dir, DIST)
+    manifest = {}
+    for name, path in sorted(_sources(static_dir)):
+        with open(path, "rb") as f:
+            data = f.read()
+        stem, ext = os.path.splitext(name)
+        hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+        manifest[name] = hashed
+
+        target = os.path.join(dist_dir, hashed)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write(target, data)
+        if ext.lower() not in PRECOMPRESSED_EXTENSIONS:
+            continue
+        for encoding, suffix in ENCODINGS:
+            if (encoding == "br" and compression.brotli is None) or os.path.exists(target + suffix):
+                continue
+            compressed = compression.compress(data, encoding, gzip_level=9, brotli_quality=11)
+            if len(compressed) < len(data):
+                _write(target + suffix, compressed)
+
+    manifest_path = os.path.join(dist_dir, MANIFEST)
+    if manifest != load_manifest(static_dir):
+        os.makedirs(dist_dir, exist_ok=True)
+        _write(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(static_dir):
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def send_asset(dist_dir, filename):
+    """Send a fingerprinted file, precompressed when the client accepts it."""
+    accepted = request.accept_encodings
+    for encoding, suffix in ENCODINGS:
+        if accepted[encoding] and os.path.isfile(os.path.join(dist_dir, filename + suffix)):
+            mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            response = send_from_directory(dist_dir, filename + suffix, mimetype=mimetype, max_age=MAX_AGE)
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(dist_dir, filename, max_age=MAX_AGE)
+    response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = f"public, max-age={MAX_AGE}, immutable"
+    return response
+
+
+def init_app(app):
+    try:
+        manifest = build(app.static_folder)
+    except OSError as e:
+        logger.warning("Could not build the static assets, serving them unfingerprinted: %s", e)
+        manifest = {}
+    dist_dir = os.path.join(app.static_folder, DIST)
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == "static" and not app.debug and values.get("filename") in manifest:
+            values["filename"] = f"{DIST}/{manifest[values['filename']]}"
+
+    @app.route(f"{app.static_url_path}/{DIST}/<path:filename>")
+    def static_asset(filename):
+        return send_asset(dist_dir, filename)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        print("Usage: python assets.py build")
+        sys.exit(2)
+    static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+    print(f"✅ {len(build(static_dir))} assets in {os.path.join(static_dir, DIST)}")
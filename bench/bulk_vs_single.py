@@ -0,0 +1,108 @@
+"""Cost of recording N sales: one N-line POST /api/sales/bulk vs N single POST /api/sales.
+
+    python bench/bulk_vs_single.py --lines 10 100 1000 --repeat 5
+
+For every ``--lines`` size, posts ``--repeat`` rounds of the same N sales
+(one unit each, spread over the catalog) both ways through the Flask test
+client, and reports the median milliseconds per round, sales per second
+and the bulk speedup. The requests never leave the process, so the saving
+of N-1 network round trips to the app is not in these numbers; only the
+database round trips and the per-request work are.
+
+Runs against a throwaway database (see pgserver.py). Afterwards every
+sale must be in the table and ``rollups.verify`` must find no drift;
+otherwise the problems are listed and the exit status is 1.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import seed
+from pgserver import throwaway_postgres
+
+# The app is imported in main(), once DATABASE_URL points at the throwaway database
+
+
+def make_lines(items, count):
+    return [{"item_name": items[n % len(items)]["item_name"], "quantity": 1,
+             "price": str(items[n % len(items)]["price"])} for n in range(count)]
+
+
+def post_single(client, lines):
+    for line in lines:
+        response = client.post("/api/sales", json=line)
+        if response.status_code >= 300:
+            raise RuntimeError(f"POST /api/sales: {response.status_code} {response.get_data(as_text=True)}")
+
+
+def post_bulk(client, lines):
+    response = client.post("/api/sales/bulk", json=lines)
+    if response.status_code >= 300 or response.get_json()["inserted"] != len(lines):
+        raise RuntimeError(f"POST /api/sales/bulk: {response.status_code} {response.get_data(as_text=True)}")
+
+
+def timed(post, client, lines, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        post(client, lines)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {"median_ms": round(median * 1000, 1), "sales_per_s": round(len(lines) / median, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--items", type=int, default=200)
+    args = parser.parse_args()
+
+    results = {"repeat": args.repeat, "items": args.items, "sizes": {}, "problems": []}
+    with throwaway_postgres() as database_url:
+        seed.seed(database_url, sales=0, items=args.items)
+        os.environ["DATABASE_URL"] = database_url
+
+        import rollups
+        from app import app
+        from db import get_db_connection, get_pool
+
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT item_name, price FROM storage ORDER BY item_id")
+                items = cur.fetchall()
+
+        client = app.test_client()
+        posted = 0
+        for count in args.lines:
+            print(f"Posting {count} lines...", file=sys.stderr)
+            lines = make_lines(items, count)
+            single = timed(post_single, client, lines, args.repeat)
+            bulk = timed(post_bulk, client, lines, args.repeat)
+            bulk["speedup"] = round(single["median_ms"] / bulk["median_ms"], 1) if bulk["median_ms"] else None
+            results["sizes"][count] = {"single": single, "bulk": bulk}
+            posted += 2 * count * args.repeat
+
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT COUNT(*) AS count FROM sales")
+                recorded = cur.fetchone()["count"]
+                if recorded != posted:
+                    results["problems"].append(f"{posted} sales posted, {recorded} recorded")
+                conn.rollback()
+                results["problems"].extend(rollups.verify(cur))
+        get_pool().closeall()
+
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if results["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
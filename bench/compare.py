@@ -0,0 +1,44 @@
+"""Compare two bench/run.py result files endpoint by endpoint.
+
+    python bench/compare.py before.json after.json
+
+Prints throughput, p50/p95/p99 and error counts for both runs with the relative change.
+"""
+import sys
+import json
+
+METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "errors", "client_errors")
+
+
+def _change(before, after):
+    if before in (None, 0) or after is None:
+        return ""
+    return f"{(after - before) / before * 100:+.0f}%"
+
+
+def compare(before, after):
+    rows = []
+    endpoints = sorted(set(before["results"]["by_path"]) | set(after["results"]["by_path"]))
+    for endpoint in ["overall"] + endpoints:
+        old = before["results"]["overall"] if endpoint == "overall" else before["results"]["by_path"].get(endpoint, {})
+        new = after["results"]["overall"] if endpoint == "overall" else after["results"]["by_path"].get(endpoint, {})
+        for metric in METRICS:
+            rows.append((endpoint, metric, old.get(metric), new.get(metric), _change(old.get(metric), new.get(metric))))
+    return rows
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    with open(sys.argv[1]) as f:
+        before = json.load(f)
+    with open(sys.argv[2]) as f:
+        after = json.load(f)
+
+    print(f"{'endpoint':<32} {'metric':<15} {before.get('commit') or 'before':>10} {after.get('commit') or 'after':>10} {'change':>8}")
+    for endpoint, metric, old, new, change in compare(before, after):
+        print(f"{endpoint:<32} {metric:<15} {str(old):>10} {str(new):>10} {change:>8}")
+
+
+if __name__ == "__main__":
+    main()
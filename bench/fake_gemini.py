@@ -0,0 +1,122 @@
+"""Deterministic stand-in for the Gemini REST API, with configurable latency.
+
+Point the app at it with::
+
+    GEMINI_API_KEY=fake GEMINI_TRANSPORT=rest GEMINI_API_ENDPOINT=http://127.0.0.1:8766
+
+Answers ``generateContent`` and ``streamGenerateContent`` for any model. The
+reply depends only on the user's text, so runs are repeatable.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STREAM_CHUNKS = 4
+
+
+def fake_reply(user_text):
+    """The action JSON a well-behaved model would return for ``user_text``."""
+    text = user_text.lower()
+    if "summary" in text or "how are" in text or "doing" in text:
+        reply = {"message": "Here is how your sales are going.", "action": "get_summary", "currency": "BND"}
+    elif "inventory" in text or "stock" in text or "restock" in text:
+        reply = {"message": "Here is your current inventory.", "action": "list_inventory"}
+    else:
+        reply = {"message": f"You said: {user_text[:80]}. How else can I help?", "action": "chat"}
+    return json.dumps(reply)
+
+
+def _user_text(body):
+    contents = body.get("contents") or []
+    for content in reversed(contents):
+        if content.get("role", "user") == "user":
+            return " ".join(part.get("text", "") for part in content.get("parts", []))
+    return ""
+
+
+def _response(text, prompt_text, final=True):
+    response = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+    if final:
+        response["candidates"][0]["finishReason"] = "STOP"
+        response["usageMetadata"] = {
+            "promptTokenCount": len(prompt_text) // 4 + 1,
+            "candidatesTokenCount": len(text) // 4 + 1,
+            "totalTokenCount": (len(prompt_text) + len(text)) // 4 + 2,
+        }
+    return response
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    latency = 0.5     # seconds per call, spread across chunks when streaming
+    jitter = 0.0      # +/- uniform jitter in seconds
+    calls = 0
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        with self._lock:
+            FakeGeminiHandler.calls += 1
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        user_text = _user_text(body)
+        prompt_text = json.dumps(body)
+        reply = fake_reply(user_text)
+
+        if path.endswith(":generateContent"):
+            time.sleep(self._delay())
+            payload = json.dumps(_response(reply, prompt_text)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        elif path.endswith(":streamGenerateContent"):
+            # Streamed as a JSON array, one element per chunk, like the REST API
+            delay = self._delay() / STREAM_CHUNKS
+            size = len(reply) // STREAM_CHUNKS + 1
+            parts = [reply[i:i + size] for i in range(0, len(reply), size)]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"[")
+            for i, part in enumerate(parts):
+                time.sleep(delay)
+                chunk = json.dumps(_response(part, prompt_text, final=i == len(parts) - 1))
+                self.wfile.write((("," if i else "") + chunk + "\n").encode())
+                self.wfile.flush()
+            self.wfile.write(b"]")
+        else:
+            self.send_error(404, "Unknown method")
+
+
+def serve(port=8766, latency=0.5, jitter=0.0, host="127.0.0.1"):
+    """Start the fake in a background thread; returns the server (call ``shutdown()``)."""
+    FakeGeminiHandler.latency = latency
+    FakeGeminiHandler.jitter = jitter
+    server = ThreadingHTTPServer((host, port), FakeGeminiHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Gemini REST endpoint")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+    server = serve(args.port, args.latency, args.jitter)
+    print(f"Fake Gemini listening on http://127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
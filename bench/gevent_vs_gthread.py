@@ -0,0 +1,94 @@
+"""Compare concurrent throughput of the gthread and gevent (Procfile) worker modes.
+
+Starts gunicorn once per mode, drives the same mixed load at each and
+prints one JSON document with both results::
+
+    python bench/gevent_vs_gthread.py --concurrency 100 --duration 30
+
+Without DATABASE_URL it seeds a throwaway database with ``--sales`` rows
+(see pgserver.py), and /ai calls go to bench/fake_gemini.py, answering
+after ``--llm-latency`` seconds. With DATABASE_URL it uses that database
+as it is, and the real Gemini if GEMINI_API_KEY is set.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import loadgen
+import fake_gemini
+from pgserver import throwaway_postgres
+from seed import seed, parse_size
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    # The thread-based mode the Procfile used before gevent
+    "gthread": ["gunicorn", "--workers", "{workers}", "--worker-class", "gthread", "--threads", "2",
+                "--timeout", "120", "--preload", "--bind", "127.0.0.1:{port}", "wsgi:app"],
+    "gevent": ["gunicorn", "-c", "gunicorn_gevent.conf.py", "--workers", "{workers}",
+               "--bind", "127.0.0.1:{port}", "wsgi:app"],
+}
+
+WORKLOAD = [
+    ("GET", "/api/items", None),
+    ("GET", "/api/sales?limit=50", None),
+    ("GET", "/api/analytics", None),
+    ("GET", "/api/inventory/chart-data", None),
+    ("POST", "/ai", {"user_text": "show me something I can sell more of this week"}),
+]
+
+
+def run_mode(mode, args, env):
+    command = [part.format(workers=args.workers, port=args.port) for part in MODES[mode]]
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        if not loadgen.wait_until_up(base_url):
+            raise RuntimeError(f"gunicorn ({mode}) did not start")
+        loadgen.run(base_url, WORKLOAD, concurrency=min(args.concurrency, 10), duration=2)  # warm-up
+        return loadgen.run(base_url, WORKLOAD, concurrency=args.concurrency, duration=args.duration)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+        time.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["gthread", "gevent"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sales", default="100k", help="sales rows to seed without DATABASE_URL")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="fake Gemini seconds per call")
+    parser.add_argument("--llm-port", type=int, default=8766)
+    args = parser.parse_args()
+
+    results = {"workers": args.workers, "modes": {}}
+    with contextlib.ExitStack() as stack:
+        env = dict(os.environ)
+        if "DATABASE_URL" not in env:
+            env["DATABASE_URL"] = stack.enter_context(throwaway_postgres())
+            print(f"Seeding {args.sales} sales...", file=sys.stderr)
+            seed(env["DATABASE_URL"], parse_size(args.sales))
+            results["sales"] = parse_size(args.sales)
+        if "GEMINI_API_KEY" not in env:
+            stack.callback(fake_gemini.serve(args.llm_port, args.llm_latency).shutdown)
+            env.update(GEMINI_API_KEY="fake", GEMINI_TRANSPORT="rest",
+                       GEMINI_API_ENDPOINT=f"http://127.0.0.1:{args.llm_port}")
+            results["llm_latency"] = args.llm_latency
+        for mode in args.modes:
+            print(f"Running {mode}...", file=sys.stderr)
+            results["modes"][mode] = run_mode(mode, args, env)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
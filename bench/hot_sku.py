@@ -0,0 +1,193 @@
+"""Sale throughput on a single hot item with many parallel sellers.
+
+    python bench/hot_sku.py --sellers 50 --duration 20
+    python bench/hot_sku.py --stock 5000   # race the item to zero; checks for overselling
+    python bench/hot_sku.py --paths conditional sharded --shards 16
+
+Every seller sells one unit of the same item in a loop, each sale in its
+own transaction, through three paths:
+
+* ``locking``: the old sequence, ``SELECT ... FOR UPDATE``, INSERT,
+  UPDATE, rollups, commit, with the row lock held across all of it;
+* ``conditional``: ``sale_engine.record_sales`` (what ``insert_sale`` and
+  the assistant use), built on one conditional ``UPDATE ... WHERE
+  quantity >= n``;
+* ``sharded``: the same, with the item's stock split ``--shards`` ways
+  (stock_shards.py).
+
+Runs against a throwaway database (see pgserver.py), then checks that
+stock, sale rows and rollups agree. The gap between the two paths widens
+with the round-trip time to the server, so also try a remote
+``BENCH_DATABASE_URL``.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import loadgen
+from pgserver import throwaway_postgres
+
+HOT_ITEM_ID = 1
+
+# The app modules (db, sale_engine, ...) are imported inside functions: the
+# connection pool reads its size from the environment when db is imported,
+# and main() sizes it to the number of sellers first.
+
+
+def locking_sale(item):
+    """One unit sold the way add_sale/record_sales did before the conditional decrement."""
+    import live
+    import rollups
+    from db import get_db_connection
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT item_id, item_name, quantity, price FROM storage WHERE item_id = %s FOR UPDATE",
+                        (item["item_id"],))
+            row = cur.fetchone()
+            if row["quantity"] < 1:
+                conn.rollback()
+                return False
+            cur.execute("INSERT INTO sales (item_id, item_name, quantity, price) VALUES (%s, %s, 1, %s) RETURNING *",
+                        (row["item_id"], row["item_name"], row["price"]))
+            sale = cur.fetchone()
+            cur.execute("UPDATE storage SET quantity = quantity - 1 WHERE item_id = %s RETURNING item_id, item_name, quantity",
+                        (row["item_id"],))
+            stock = cur.fetchone()
+            rollups.apply_sales(cur, [sale])
+            live.publish_sales(cur, [sale], [stock])
+            conn.commit()
+            return True
+
+
+def conditional_sale(item):
+    from sale_engine import record_sales, ALL_OR_NOTHING
+    return record_sales([{"item_name": item["item_name"], "quantity": 1}], mode=ALL_OR_NOTHING)["success"]
+
+
+PATHS = {"locking": locking_sale, "conditional": conditional_sale, "sharded": conditional_sale}
+
+
+def run_path(sell, item, sellers, duration):
+    latencies = []
+    sold = [0]
+    sold_out = [0]
+    errors = [0]
+    error_types = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def seller():
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = sell(item)
+            except Exception as e:
+                with lock:
+                    errors[0] += 1
+                    error_types[type(e).__name__] = error_types.get(type(e).__name__, 0) + 1
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if ok:
+                    sold[0] += 1
+                else:
+                    sold_out[0] += 1
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=seller, daemon=True) for _ in range(sellers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = loadgen.summarize(latencies, errors[0], time.monotonic() - started)
+    result.update(sold=sold[0], sold_out=sold_out[0], error_types=error_types)
+    return result
+
+
+def prepare(database_url, stock, shards=0):
+    """Reseed the catalog and give the hot item ``stock`` units; returns its catalog entry."""
+    import psycopg2
+    import stock_shards
+    from psycopg2.extras import RealDictCursor
+    from catalog import catalog
+    from seed import seed, item_name
+
+    seed(database_url, sales=0, items=10)
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE storage SET quantity = %s WHERE item_id = %s", (stock, HOT_ITEM_ID))
+            if shards:
+                stock_shards.set_shards(cur, HOT_ITEM_ID, shards)
+        conn.commit()
+    finally:
+        conn.close()
+    catalog.invalidate()
+    return catalog.lookup(item_name(HOT_ITEM_ID))
+
+
+def check(database_url, item, stock, sold):
+    """Stock, sale rows and rollups must agree, and stock must never go negative."""
+    import psycopg2
+    import rollups
+    from psycopg2.extras import RealDictCursor
+
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT quantity FROM storage_stock WHERE item_id = %s", (item["item_id"],))
+            left = cur.fetchone()["quantity"]
+            cur.execute("SELECT COALESCE(SUM(quantity), 0) AS sold FROM sales WHERE item_id = %s",
+                        (item["item_id"],))
+            recorded = cur.fetchone()["sold"]
+            conn.rollback()
+            drift = rollups.verify(cur)
+    finally:
+        conn.close()
+    problems = []
+    if left < 0:
+        problems.append(f"stock went negative ({left})")
+    if recorded != sold or left != stock - sold:
+        problems.append(f"sold {sold}, recorded {recorded}, stock {stock} -> {left}")
+    return problems + drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", nargs="+", choices=sorted(PATHS), default=["locking", "conditional", "sharded"])
+    parser.add_argument("--sellers", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--stock", type=int, default=1_000_000_000)
+    parser.add_argument("--shards", type=int, default=16, help="stock shards for the sharded path")
+    args = parser.parse_args()
+
+    # One pooled connection per seller
+    os.environ["DB_POOL_MAX_SIZE"] = str(args.sellers)
+    os.environ["DB_POOL_TIMEOUT"] = "30"
+
+    results = {"sellers": args.sellers, "stock": args.stock, "shards": args.shards, "paths": {}}
+    with throwaway_postgres() as database_url:
+        os.environ["DATABASE_URL"] = database_url
+        for path in args.paths:
+            print(f"Running {path}...", file=sys.stderr)
+            item = prepare(database_url, args.stock, args.shards if path == "sharded" else 0)
+            result = run_path(PATHS[path], item, args.sellers, args.duration)
+            result["consistency_problems"] = check(database_url, item, args.stock, result["sold"])
+            results["paths"][path] = result
+
+        from db import get_pool
+        get_pool().closeall()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
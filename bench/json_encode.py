@@ -0,0 +1,98 @@
+"""Cost of encoding a GET /api/sales page: Flask's default jsonify vs fastjson.
+
+    python bench/json_encode.py --rows 5000 --repeat 20
+    JSON_BACKEND=stdlib python bench/json_encode.py
+
+Builds rows shaped like the sales table's (Decimal prices, aware
+datetimes, a non-ASCII name now and then) and times, per encoding, the
+median of ``--repeat`` runs and the body size:
+
+* ``jsonify``: Flask's own DefaultJSONProvider, what the app used before;
+* ``stdlib`` and ``orjson`` (when installed): fastjson's encoders;
+* ``fields`` and ``columns``: the app's backend with
+  ``?fields=id,item_name,total_price`` and ``?layout=columns``.
+
+Every full encoding must parse to the same value as jsonify's output;
+any that does not is listed under ``mismatches``. No database needed.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import fastjson
+
+NAMES = ["Coffee", "Tea", "Croissant", "Bagel", "Crème brûlée", "Matcha latte", "Muffin", "Jalapeño wrap"]
+
+
+def make_rows(count, seed=1):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for n in range(count, 0, -1):
+        item_id = rng.randrange(len(NAMES))
+        quantity = rng.randint(1, 5)
+        price = Decimal(rng.randint(100, 2500)) / 100
+        created_at = start + timedelta(seconds=n * 37)
+        rows.append({"id": n, "item_id": item_id + 1, "item_name": NAMES[item_id], "quantity": quantity,
+                     "price": price, "total_price": quantity * price,
+                     "created_at": created_at, "updated_at": created_at})
+    return rows
+
+
+def timed(encode, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode()
+        times.append(time.perf_counter() - start)
+    return {"median_ms": round(statistics.median(times) * 1000, 3), "bytes": len(body)}, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    rows = make_rows(args.rows)
+    default_provider = DefaultJSONProvider(app)
+
+    results = {"rows": args.rows, "backend": fastjson.BACKEND, "encodings": {}, "mismatches": []}
+    with app.test_request_context("/api/sales"):
+        result, expected = timed(lambda: default_provider.response(rows).get_data(), args.repeat)
+        results["encodings"]["jsonify"] = result
+        expected = json.loads(expected)
+
+        for name, dumps in fastjson.ENCODERS.items():
+            result, body = timed(lambda: dumps(rows), args.repeat)
+            results["encodings"][name] = result
+            if json.loads(body) != expected:
+                results["mismatches"].append(name)
+
+    for name, query in (("fields", "fields=id,item_name,total_price"), ("columns", "layout=columns")):
+        with app.test_request_context(f"/api/sales?{query}"):
+            result, _ = timed(lambda: fastjson.rows_response(rows).get_data(), args.repeat)
+            results["encodings"][name] = result
+
+    baseline = results["encodings"]["jsonify"]["median_ms"]
+    for result in results["encodings"].values():
+        result["speedup"] = round(baseline / result["median_ms"], 2) if result["median_ms"] else None
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if results["mismatches"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Minimal closed-loop HTTP load generator (stdlib only).
+
+``concurrency`` clients each send one request at a time, picking the next
+request from ``requests`` round-robin, for ``duration`` seconds.
+
+Only 2xx and 304 responses count as served and go into the latencies.
+4xx responses are counted as ``client_errors`` (a broken request mix
+should not look like fast successes), 5xx responses and connection
+failures as ``errors``.
+"""
+import json
+import time
+import threading
+import urllib.error
+import urllib.request
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, client_errors=0):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "client_errors": client_errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "max_ms": _ms(latencies[-1] if latencies else None),
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _send(base_url, request, timeout):
+    method, path, body = request
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method,
+                                 headers={"Content-Type": "application/json"} if data else {})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+
+
+def run(base_url, requests, concurrency=50, duration=10.0, timeout=30.0):
+    """Run the load and return ``{"overall": stats, "by_path": {"METHOD /path": stats}}``.
+
+    ``requests`` is a list of ``(method, path, json_body_or_None)``.
+    """
+    lock = threading.Lock()
+    results = {}          # path -> [latencies]
+    errors = {}           # path -> count of 5xx and failed connections
+    client_errors = {}    # path -> count of 4xx
+    counter = iter(range(10 ** 12))
+    stop_at = time.monotonic() + duration
+
+    def client():
+        while time.monotonic() < stop_at:
+            with lock:
+                request = requests[next(counter) % len(requests)]
+            path = f"{request[0]} {request[1].split('?')[0]}"
+            started = time.perf_counter()
+            try:
+                status = _send(base_url, request, timeout)
+            except (urllib.error.URLError, OSError):
+                status = None
+            latency = time.perf_counter() - started
+            with lock:
+                if status is not None and (200 <= status < 300 or status == 304):
+                    results.setdefault(path, []).append(latency)
+                elif status is not None and 400 <= status < 500:
+                    client_errors[path] = client_errors.get(path, 0) + 1
+                else:
+                    errors[path] = errors.get(path, 0) + 1
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    all_latencies = [lat for values in results.values() for lat in values]
+    return {
+        "concurrency": concurrency,
+        "duration_seconds": round(elapsed, 1),
+        "overall": summarize(all_latencies, sum(errors.values()), elapsed, sum(client_errors.values())),
+        "by_path": {path: summarize(results.get(path, []), errors.get(path, 0), elapsed, client_errors.get(path, 0))
+                    for path in sorted(set(results) | set(errors) | set(client_errors))},
+    }
+
+
+def wait_until_up(base_url, path="/test-db", timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _send(base_url, ("GET", path, None), 5)
+            return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    return False
@@ -0,0 +1,77 @@
+"""Throwaway Postgres for benchmarks.
+
+Uses ``BENCH_DATABASE_URL`` if set: a scratch database is created on that
+server and dropped afterwards. Otherwise a private cluster is started with
+``initdb``/``pg_ctl`` (from ``PG_BIN`` or ``PATH``) in a temp directory and
+removed afterwards.
+"""
+import os
+import shutil
+import socket
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from urllib.parse import urlparse, urlunparse
+
+import psycopg2
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pg_tool(name):
+    pg_bin = os.getenv("PG_BIN")
+    path = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise RuntimeError(f"'{name}' not found; set PG_BIN or BENCH_DATABASE_URL")
+    return path
+
+
+@contextmanager
+def scratch_database(server_url):
+    """Create a uniquely named database on an existing server and drop it afterwards."""
+    name = f"lakuai_bench_{os.getpid()}"
+    admin = psycopg2.connect(server_url)
+    admin.autocommit = True
+    try:
+        with admin.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {name}")
+            cur.execute(f"CREATE DATABASE {name}")
+        yield urlunparse(urlparse(server_url)._replace(path="/" + name))
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+        admin.close()
+
+
+@contextmanager
+def local_cluster():
+    """Run a private Postgres cluster on a free port for the duration of the block."""
+    data_dir = tempfile.mkdtemp(prefix="lakuai-bench-pg-")
+    port = _free_port()
+    subprocess.run([_pg_tool("initdb"), "-D", data_dir, "-U", "postgres", "-A", "trust", "--no-sync"],
+                   check=True, stdout=subprocess.DEVNULL)
+    options = f"-p {port} -k {data_dir} -c listen_addresses=127.0.0.1 -c fsync=off -c max_connections=200"
+    subprocess.run([_pg_tool("pg_ctl"), "-D", data_dir, "-o", options, "-w", "-l",
+                    os.path.join(data_dir, "server.log"), "start"], check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield f"postgresql://postgres@127.0.0.1:{port}/postgres?sslmode=disable"
+    finally:
+        subprocess.run([_pg_tool("pg_ctl"), "-D", data_dir, "-m", "immediate", "stop"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+@contextmanager
+def throwaway_postgres():
+    """Yield a DATABASE_URL for an empty database that is removed afterwards."""
+    server_url = os.getenv("BENCH_DATABASE_URL")
+    if server_url:
+        with scratch_database(server_url) as url:
+            yield url
+    else:
+        with local_cluster() as url:
+            yield url
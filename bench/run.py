@@ -0,0 +1,170 @@
+"""End-to-end load benchmark: throwaway Postgres, fake Gemini, mixed workload.
+
+    python bench/run.py --sales 100k --duration 30 --output results.json
+    python bench/compare.py before.json results.json
+
+Boots gunicorn (``--mode gthread``, or ``gevent`` as in the Procfile) against
+a freshly seeded database (see pgserver.py and seed.py) with Gemini replaced
+by bench/fake_gemini.py, then drives a weighted mix of sale posts, dashboard
+polling and chat messages. Prints (and optionally writes) JSON with p50/p95/
+p99 latency and throughput per endpoint, tagged with the current commit.
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import platform
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import loadgen
+import fake_gemini
+from pgserver import throwaway_postgres
+from seed import seed, parse_size, item_name
+
+SERVER_COMMANDS = {
+    "gthread": ["gunicorn", "--workers", "{workers}", "--worker-class", "gthread", "--threads", "2",
+                "--timeout", "120", "--preload", "--bind", "127.0.0.1:{port}", "wsgi:app"],
+    "gevent": ["gunicorn", "-c", "gunicorn_gevent.conf.py", "--workers", "{workers}",
+               "--bind", "127.0.0.1:{port}", "wsgi:app"],
+}
+
+DASHBOARD = [
+    ("GET", "/api/analytics", None),
+    ("GET", "/api/sales?limit=10", None),
+    ("GET", "/api/items", None),
+    ("GET", "/api/inventory/chart-data", None),
+]
+
+CHAT_TO_GEMINI = [
+    "how are my sales doing today?",
+    "what should I restock this week?",
+    "give me a quick sales summary please",
+    "any tips to sell more in the evening?",
+]
+
+
+def build_workload(mix, items, size=2000, seed_value=7):
+    """A shuffled request list matching the ``sales``/``dashboard``/``chat`` weights."""
+    rng = random.Random(seed_value)
+    total = sum(mix.values())
+    requests = []
+    for _ in range(size):
+        pick = rng.uniform(0, total)
+        if pick < mix["sales"]:
+            requests.append(("POST", "/api/sales", {
+                "item_name": item_name(rng.randint(1, items)),
+                "quantity": rng.randint(1, 3),
+                "price": 1.0,
+            }))
+        elif pick < mix["sales"] + mix["dashboard"]:
+            requests.append(rng.choice(DASHBOARD))
+        elif rng.random() < 0.5:
+            # Parsed locally, never reaches Gemini
+            requests.append(("POST", "/ai", {"user_text": f"{rng.randint(1, 3)} {item_name(rng.randint(1, items))}"}))
+        else:
+            requests.append(("POST", "/ai", {"user_text": rng.choice(CHAT_TO_GEMINI)}))
+    return requests
+
+
+def parse_mix(value):
+    mix = {"sales": 0.0, "dashboard": 0.0, "chat": 0.0}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in mix:
+            raise argparse.ArgumentTypeError(f"Unknown workload '{name}'")
+        mix[name] = float(weight)
+    return mix
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the mixed-workload benchmark")
+    parser.add_argument("--sales", default="1k", help="sales rows to seed: 1k, 100k, 1m or a number")
+    parser.add_argument("--items", type=int, default=200, help="catalog items to seed")
+    parser.add_argument("--mode", choices=sorted(SERVER_COMMANDS), default="gthread")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("sales=2,dashboard=6,chat=2"),
+                        help="relative weights, e.g. sales=2,dashboard=6,chat=2")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="fake Gemini seconds per call")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. LLM_CACHE_ENABLED=0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-port", type=int, default=8766)
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+    sales = parse_size(args.sales)
+
+    with throwaway_postgres() as database_url:
+        print(f"Seeding {sales} sales and {args.items} items...", file=sys.stderr)
+        seeded = seed(database_url, sales, args.items)
+
+        llm = fake_gemini.serve(args.llm_port, args.llm_latency, args.llm_jitter)
+        env = dict(
+            os.environ,
+            DATABASE_URL=database_url,
+            GEMINI_API_KEY="fake",
+            GEMINI_TRANSPORT="rest",
+            GEMINI_API_ENDPOINT=f"http://127.0.0.1:{args.llm_port}",
+            LLM_CACHE_PATH=os.path.join(BENCH_DIR, f".llm-cache-{os.getpid()}.sqlite3"),
+        )
+        env.update(item.split("=", 1) for item in args.env)
+        command = [part.format(workers=args.workers, port=args.port) for part in SERVER_COMMANDS[args.mode]]
+        server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            if not loadgen.wait_until_up(base_url):
+                raise RuntimeError("gunicorn did not start")
+            workload = build_workload(args.mix, args.items)
+            if args.warmup:
+                loadgen.run(base_url, workload, concurrency=min(args.concurrency, 8), duration=args.warmup)
+            print(f"Running for {args.duration:g}s at concurrency {args.concurrency}...", file=sys.stderr)
+            results = loadgen.run(base_url, workload, concurrency=args.concurrency, duration=args.duration)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+            llm.shutdown()
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(env["LLM_CACHE_PATH"] + suffix)
+                except OSError:
+                    pass
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": {
+            "mode": args.mode, "workers": args.workers, "concurrency": args.concurrency,
+            "mix": args.mix, "llm_latency": args.llm_latency, "llm_jitter": args.llm_jitter,
+            "env": args.env, "seeded": seeded,
+        },
+        "fake_llm_calls": fake_gemini.FakeGeminiHandler.calls,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Seed a benchmark database with a catalog and a sales history.
+
+    python bench/seed.py postgresql://... --sales 100k --items 200
+
+Sales are spread over the past year and generated server-side with
+``generate_series`` and a fixed ``setseed``, so a given size always produces
+the same data. Stock is effectively unlimited so sale posts never run out.
+"""
+import os
+import sys
+import time
+import argparse
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rollups
+from init_db import create_schema
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def parse_size(value):
+    value = str(value).lower()
+    if value in SIZES:
+        return SIZES[value]
+    return int(value)
+
+
+def item_name(number):
+    return f"item {number}"
+
+
+def seed(database_url, sales=SIZES["1k"], items=200):
+    """Create the schema and load ``items`` catalog rows and ``sales`` sale rows."""
+    started = time.monotonic()
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor() as cur:
+            create_schema(cur)
+            cur.execute("TRUNCATE sales, storage_shards, storage RESTART IDENTITY")
+            cur.execute("SELECT setseed(0.42)")
+            cur.execute("""
+                INSERT INTO storage (item_name, quantity, price)
+                SELECT 'item ' || g, 1000000000, round((1 + random() * 19)::numeric, 2)
+                FROM generate_series(1, %s) g
+            """, (items,))
+            cur.execute("""
+                INSERT INTO sales (item_id, item_name, quantity, price, created_at)
+                SELECT s.item_id, s.item_name, 1 + floor(random() * 5)::int, s.price,
+                       now() - random() * interval '365 days'
+                FROM generate_series(1, %s) g
+                JOIN storage s ON s.item_id = 1 + (g %% %s)
+            """, (sales, items))
+            rollups.rebuild(cur)
+        conn.commit()
+
+        # ANALYZE after commit so the planner sees the new rows
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+    finally:
+        conn.close()
+    return {"items": items, "sales": sales, "seconds": round(time.monotonic() - started, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed a benchmark database")
+    parser.add_argument("database_url")
+    parser.add_argument("--sales", default="1k", help="1k, 100k, 1m or a number of rows")
+    parser.add_argument("--items", type=int, default=200)
+    args = parser.parse_args()
+    print(seed(args.database_url, parse_size(args.sales), args.items))
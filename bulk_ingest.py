@@ -0,0 +1,230 @@
+"""Bulk sales ingest for end-of-day POS reconciliation.
+
+Lines are validated in Python against the catalog cache, streamed into a
+temporary staging table with ``COPY``, and applied with one ``INSERT ...
+SELECT`` and one set-based ``UPDATE storage ... FROM`` (sharded items are
+folded back into ``storage.quantity`` first). Stock is allocated like
+``sale_engine`` does it: in input order, skipping a line that does not
+fit, so a later, smaller line can still use what is left. Every rejected
+line is reported with its line number.
+"""
+import io
+import os
+import csv
+from decimal import Decimal, InvalidOperation
+
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+
+import live
+import rollups
+import stock_shards
+import partitions
+from catalog import catalog
+from db import get_db_connection
+from sales import parse_datetime
+from sale_engine import ALL_OR_NOTHING, BEST_EFFORT
+
+MAX_BULK_LINES = int(os.getenv("MAX_BULK_LINES", 10000))
+REQUIRED_COLUMNS = ("item_name", "quantity")
+OPTIONAL_COLUMNS = ("price", "created_at")
+
+STAGING_SQL = """
+CREATE TEMP TABLE sales_staging (
+    line INTEGER PRIMARY KEY,
+    item_id INTEGER NOT NULL,
+    item_name TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    price NUMERIC(10, 2),
+    created_at TIMESTAMP WITH TIME ZONE
+) ON COMMIT DROP
+"""
+
+
+def parse_csv(text):
+    """Parse CSV with a header row into line dicts."""
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        raise ValueError("CSV is empty")
+    fields = [f.strip().lower() for f in reader.fieldnames]
+    missing = [c for c in REQUIRED_COLUMNS if c not in fields]
+    if missing:
+        raise ValueError(f"CSV header is missing column(s): {', '.join(missing)}")
+    reader.fieldnames = fields
+    return [{k: (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+            for row in reader]
+
+
+def validate_lines(rows):
+    """Return ``(valid, rejected)``; line numbers are 1-based input positions."""
+    if len(rows) > MAX_BULK_LINES:
+        raise ValueError(f"Too many lines ({len(rows)}). The limit is {MAX_BULK_LINES} per request.")
+
+    valid = []
+    rejected = []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            rejected.append({"line": number, "error": "Each line must be an object"})
+            continue
+        name = row.get("item_name")
+        try:
+            quantity = int(row.get("quantity"))
+            if quantity <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            rejected.append({"line": number, "item_name": name, "error": "Quantity must be a positive whole number"})
+            continue
+
+        price = row.get("price")
+        if price in (None, ""):
+            price = None
+        else:
+            try:
+                price = Decimal(str(price))
+                if price <= 0:
+                    raise InvalidOperation
+            except (InvalidOperation, ValueError):
+                rejected.append({"line": number, "item_name": name, "error": "Price must be a positive number"})
+                continue
+
+        try:
+            created_at = parse_datetime(row.get("created_at") or None, "created_at")
+        except ValueError as e:
+            rejected.append({"line": number, "item_name": name, "error": str(e)})
+            continue
+
+        entry = catalog.lookup(name) if name else None
+        if not entry:
+            rejected.append({"line": number, "item_name": name, "error": f"Item '{name}' not found in inventory"})
+            continue
+
+        valid.append((number, entry["item_id"], entry["item_name"], quantity, price, created_at))
+    return valid, rejected
+
+
+def _copy_rows(cur, rows):
+    if extensions.get_wait_callback() is not None:
+        # psycopg2 cannot COPY while a wait callback is registered (gevent
+        # workers); a multi-row INSERT is slower but still one round trip per page.
+        execute_values(cur, """
+            INSERT INTO sales_staging (line, item_id, item_name, quantity, price, created_at)
+            VALUES %s
+        """, rows, page_size=1000)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for number, item_id, name, quantity, price, created_at in rows:
+        writer.writerow([number, item_id, name, quantity,
+                         "" if price is None else price,
+                         "" if created_at is None else created_at.isoformat()])
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY sales_staging (line, item_id, item_name, quantity, price, created_at) "
+        "FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+
+def _allocate(valid, available, rejected):
+    """Give each item's ``available`` stock to its lines in input order; returns the lines that fit.
+
+    A line that does not fit is rejected and the next one is still tried,
+    as ``sale_engine._allocate_short`` does for a basket.
+    """
+    accepted = []
+    for line in valid:
+        number, item_id, name, quantity = line[:4]
+        if item_id not in available:
+            catalog.invalidate()
+            rejected.append({"line": number, "item_name": name, "error": f"Item '{name}' not found in inventory"})
+        elif quantity > available[item_id]:
+            rejected.append({"line": number, "item_name": name,
+                             "error": f"Insufficient stock for '{name}'. "
+                                      f"Available: {available[item_id]}, Requested: {quantity}"})
+        else:
+            available[item_id] -= quantity
+            accepted.append(line)
+    return accepted
+
+
+def ingest_sales(rows, mode=BEST_EFFORT):
+    """Validate and apply a batch of sale lines. Returns a summary with per-line rejections."""
+    if mode not in (ALL_OR_NOTHING, BEST_EFFORT):
+        raise ValueError(f"Unknown mode '{mode}'. Use '{ALL_OR_NOTHING}' or '{BEST_EFFORT}'")
+
+    valid, rejected = validate_lines(rows)
+
+    def result(inserted, total_amount=Decimal(0)):
+        rejected.sort(key=lambda r: r["line"])
+        return {
+            "success": inserted > 0 and (mode == BEST_EFFORT or not rejected),
+            "mode": mode,
+            "received": len(rows),
+            "inserted": inserted,
+            "rejected": rejected,
+            "total_amount": total_amount,
+        }
+
+    if not valid or (mode == ALL_OR_NOTHING and rejected):
+        return result(0)
+
+    # Backdated lines need their months' partitions. Creating one locks the
+    # whole sales table, so do it up front in its own short transaction.
+    months = {created_at for *_, created_at in valid if created_at is not None}
+    if months:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                partitions.ensure_partitions(cur, months)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            # Lock the affected items in item_id order, the order record_sales takes
+            # them in, and fold any sharded stock back into storage.quantity
+            item_ids = {row[1] for row in valid}
+            stock_shards.lock_items(cur, item_ids)
+            cur.execute("SELECT item_id, quantity FROM storage WHERE item_id = ANY(%s)", (sorted(item_ids),))
+            available = {row["item_id"]: row["quantity"] for row in cur.fetchall()}
+
+            accepted = _allocate(valid, available, rejected)
+            if not accepted or (mode == ALL_OR_NOTHING and rejected):
+                conn.rollback()
+                return result(0)
+
+            cur.execute(STAGING_SQL)
+            _copy_rows(cur, accepted)
+            cur.execute("""
+                UPDATE sales_staging st SET price = s.price
+                FROM storage s
+                WHERE st.item_id = s.item_id AND st.price IS NULL
+            """)
+            cur.execute("""
+                INSERT INTO sales (item_id, item_name, quantity, price, created_at)
+                SELECT item_id, item_name, quantity, price, COALESCE(created_at, CURRENT_TIMESTAMP)
+                FROM sales_staging
+                ORDER BY line
+                RETURNING *
+            """)
+            sales = cur.fetchall()
+            if not sales:
+                conn.rollback()
+                return result(0)
+
+            cur.execute("""
+                UPDATE storage s SET quantity = s.quantity - d.sold
+                FROM (
+                    SELECT item_id, SUM(quantity) AS sold
+                    FROM sales_staging
+                    GROUP BY item_id
+                ) d
+                WHERE s.item_id = d.item_id
+                RETURNING s.item_id, s.item_name, s.quantity
+            """)
+            stock = cur.fetchall()
+            rollups.apply_sales(cur, sales)
+            # Large batches exceed the NOTIFY payload limit and go out as a refresh
+            live.publish_sales(cur, sales, stock)
+            conn.commit()
+
+    total_amount = sum((sale["quantity"] * sale["price"] for sale in sales), Decimal(0))
+    return result(len(sales), total_amount)
@@ -0,0 +1,238 @@
+"""Per-worker cache of the inventory catalog (name -> item_id, name, price, stock_shards).
+
+Item existence and price lookups are answered from memory. Coherence across
+gunicorn workers comes from ``catalog_version``, a counter bumped by a
+statement trigger whenever items are added, renamed, repriced or removed.
+The trigger also NOTIFYs ``catalog_changed``; the worker's shared listener
+(see listener.py) marks the cache stale as soon as that arrives. If the listener is down, the
+version is polled at most every ``CATALOG_CHECK_INTERVAL`` seconds.
+
+Stock quantities are deliberately *not* cached: they change on every sale
+and are checked by the write transaction itself, as it takes the stock with
+a conditional ``UPDATE ... WHERE quantity >= n`` (or, for sharded items,
+from a shard no other seller holds; see stock_shards.py).
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from db import get_db_connection
+from listener import listener
+
+logger = logging.getLogger(__name__)
+
+CATALOG_MAX_ITEMS = int(os.getenv("CATALOG_MAX_ITEMS", 5000))
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", 5))
+CATALOG_CHANNEL = "catalog_changed"
+
+CATALOG_VERSION_SQL = """
+-- Version counter bumped whenever the item catalog (names/prices/sharding) changes
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO catalog_version (id) VALUES (1) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1 RETURNING version INTO new_version;
+    PERFORM pg_notify('catalog_changed', new_version::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Stock-only updates (every sale) do not touch the catalog version
+DROP TRIGGER IF EXISTS storage_catalog_version ON storage;
+CREATE TRIGGER storage_catalog_version
+    AFTER INSERT OR DELETE OR UPDATE OF item_name, price, stock_shards ON storage
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+"""
+
+
+def normalize_name(name):
+    return " ".join(str(name).split()).lower() if name is not None else ""
+
+
+class Catalog:
+    """Bounded LRU map of normalized item name -> {item_id, item_name, price, stock_shards}."""
+
+    def __init__(self, max_items=CATALOG_MAX_ITEMS, check_interval=CATALOG_CHECK_INTERVAL):
+        self.max_items = max_items
+        self.check_interval = check_interval
+        self._reset()
+
+    def _reset(self):
+        """(Re)initialise all state; also run in each worker after a --preload fork."""
+        self._lock = threading.RLock()
+        self._items = OrderedDict()
+        self._complete = False        # True when every storage row is cached
+        self._loaded_version = None   # catalog_version at the last full load
+        self._known_version = None    # newest version seen via NOTIFY or polling
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0, "db_lookups": 0}
+
+    # ---------------- Freshness ----------------
+    def _is_stale(self):
+        if self._loaded_at == 0.0:
+            return True
+        if self._loaded_version is None:
+            # No catalog_version table yet: fall back to a plain TTL.
+            return time.monotonic() - self._loaded_at > self.check_interval
+        if not listener.healthy and time.monotonic() - self._checked_at > self.check_interval:
+            version = self._fetch_version()
+            if version is not None:
+                self._known_version = version
+            self._checked_at = time.monotonic()
+        return self._known_version != self._loaded_version
+
+    def _fetch_version(self):
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+                    row = cur.fetchone()
+                    return row['version'] if row else None
+        except Exception as e:
+            logger.warning("Could not read catalog_version: %s", e)
+            return None
+
+    def notify(self, version):
+        """Record a version announced by NOTIFY (called from the listener thread)."""
+        with self._lock:
+            if self._known_version is None or version > self._known_version:
+                self._known_version = version
+
+    def _on_notify(self, payload):
+        try:
+            self.notify(int(payload))
+        except ValueError:
+            self.invalidate()
+
+    def _load(self):
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                # Read the version first: a change committed between the two
+                # statements then only causes one extra reload, never a stale cache.
+                try:
+                    cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+                    row = cur.fetchone()
+                    version = row['version'] if row else None
+                except Exception as e:
+                    logger.warning("Could not read catalog_version: %s", e)
+                    conn.rollback()
+                    version = None
+                cur.execute(
+                    "SELECT item_id, item_name, price, stock_shards FROM storage ORDER BY item_id LIMIT %s",
+                    (self.max_items + 1,)
+                )
+                rows = cur.fetchall()
+
+        items = OrderedDict()
+        for row in rows[:self.max_items]:
+            items[normalize_name(row['item_name'])] = self._entry(row)
+        self._items = items
+        self._complete = len(rows) <= self.max_items
+        self._loaded_version = version
+        if self._known_version is None or (version is not None and version > self._known_version):
+            self._known_version = version
+        self._loaded_at = self._checked_at = time.monotonic()
+        self._stats["loads"] += 1
+        logger.debug("Loaded %d catalog items (version %s, complete=%s)", len(items), version, self._complete)
+
+    @staticmethod
+    def _entry(row):
+        return {"item_id": row['item_id'], "item_name": row['item_name'], "price": row['price'],
+                "stock_shards": row['stock_shards']}
+
+    def _refresh(self):
+        listener.ensure_started()
+        if self._is_stale():
+            self._load()
+
+    # ---------------- Lookups ----------------
+    def lookup(self, name):
+        """Return ``{item_id, item_name, price, stock_shards}`` for an item name, or None."""
+        key = normalize_name(name)
+        if not key:
+            return None
+        with self._lock:
+            self._refresh()
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry
+            self._stats["misses"] += 1
+            if self._complete:
+                return None
+
+        # Cache is partial (evictions happened): fall back to the database.
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT item_id, item_name, price, stock_shards FROM storage WHERE LOWER(item_name) = LOWER(%s)",
+                    (name.strip(),)
+                )
+                row = cur.fetchone()
+        with self._lock:
+            self._stats["db_lookups"] += 1
+            if row is None:
+                return None
+            entry = self._entry(row)
+            self._put(key, entry)
+            return entry
+
+    def _put(self, key, entry):
+        self._items[key] = entry
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+            self._complete = False
+            self._stats["evictions"] += 1
+
+    def price(self, name):
+        entry = self.lookup(name)
+        return float(entry['price']) if entry else None
+
+    def names(self):
+        """Cached item names (all of them when the catalog fits in the cache)."""
+        with self._lock:
+            self._refresh()
+            return [entry['item_name'] for entry in self._items.values()]
+
+    def invalidate(self):
+        """Force a reload on next use (call after this worker changes storage)."""
+        with self._lock:
+            self._loaded_at = 0.0
+
+    @property
+    def version(self):
+        with self._lock:
+            self._refresh()
+            return self._loaded_version
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                size=len(self._items),
+                max_items=self.max_items,
+                complete=self._complete,
+                version=self._loaded_version,
+                listener_healthy=listener.healthy,
+                hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            )
+
+
+catalog = Catalog()
+# Anything changed while the listener was disconnected is caught by the version check
+listener.register(CATALOG_CHANNEL, catalog._on_notify, on_connect=catalog.invalidate)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=catalog._reset)
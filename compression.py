@@ -0,0 +1,59 @@
+"""gzip/brotli compression of JSON responses, negotiated with ``Accept-Encoding``.
+
+JSON bodies of at least ``COMPRESS_MIN_SIZE`` bytes are compressed with
+brotli when the client accepts it and the ``brotli`` package is installed,
+otherwise with gzip. Smaller bodies, streamed responses (SSE, exports) and
+responses that already carry a ``Content-Encoding`` are sent as they are.
+The ETags that :func:`data_versions.conditional` sets are weak, so they
+stay valid for every encoding of a body.
+"""
+import os
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))             # bytes; smaller bodies are not worth it
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 4))    # 11 is for precompressed files, too slow per request
+
+COMPRESSED_MIMETYPES = ("application/json",)
+
+
+def negotiate():
+    """The best encoding for this request's client: ``"br"``, ``"gzip"`` or None."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding, gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY):
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    # mtime=0 keeps the output the same for the same input
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def init_app(app):
+    @app.after_request
+    def compress_response(response):
+        if (response.mimetype not in COMPRESSED_MIMETYPES or response.status_code != 200
+                or response.is_streamed or response.direct_passthrough
+                or "Content-Encoding" in response.headers):
+            return response
+        if response.calculate_content_length() < MIN_SIZE:
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate()
+        if encoding is None:
+            return response
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,168 @@
+"""Per-table data versions and conditional GETs (ETag / If-None-Match).
+
+Triggers bump ``data_versions`` for ``sales`` and ``storage`` once per
+writing transaction, as it commits, so a version is visible exactly when
+its data is and no writer holds a version row while it takes its other
+locks. Each version is split over slot rows, so commits rarely queue on
+the same row either. Read endpoints decorated with :func:`conditional` derive
+a weak ETag from the versions of the tables they read plus the request
+URL, and answer a matching ``If-None-Match`` with 304 after a single
+primary-key lookup, without building the payload. The versions come from the same database (primary or replica) the view then
+reads, so a payload is never older than its tag.
+"""
+import time
+import hashlib
+import logging
+from functools import wraps
+
+from flask import request, make_response
+
+from replicas import read_connection
+
+logger = logging.getLogger(__name__)
+
+DATA_VERSION_SQL = """
+-- Version counters bumped by every transaction that writes the versioned
+-- tables. Each table's version is the sum over its slot rows; a transaction
+-- bumps one slot picked at random, so concurrent commits rarely share a row.
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name TEXT NOT NULL,
+    slot SMALLINT NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, slot)
+);
+INSERT INTO data_versions (table_name) VALUES ('sales'), ('storage') ON CONFLICT DO NOTHING;
+
+-- Bumps the version of the trigger's table, or of the table named in its
+-- argument, straight away (TRUNCATE, which takes the table's strongest lock anyway)
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE data_versions SET version = version + 1
+    WHERE table_name = COALESCE(TG_ARGV[0], TG_TABLE_NAME) AND slot = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Notes that this transaction changes the version of the trigger's table (or
+-- of the table in its argument); takes no lock
+CREATE OR REPLACE FUNCTION mark_data_version() RETURNS trigger AS $$
+DECLARE
+    marked TEXT := COALESCE(current_setting('lakuai.data_versions', true), '');
+    name TEXT := COALESCE(TG_ARGV[0], TG_TABLE_NAME);
+BEGIN
+    IF NOT name = ANY(string_to_array(marked, ',')) THEN
+        PERFORM set_config('lakuai.data_versions', concat_ws(',', NULLIF(marked, ''), name), true);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Deferred to commit: bumps every version the transaction marked, once, in
+-- table_name order, each in the same random one of 16 slots. The version
+-- rows are locked after all of the transaction's other locks and only until
+-- it commits, so writers never deadlock or queue on them mid-transaction.
+CREATE OR REPLACE FUNCTION bump_marked_data_versions() RETURNS trigger AS $$
+DECLARE
+    marked TEXT := NULLIF(current_setting('lakuai.data_versions', true), '');
+    picked_slot SMALLINT := floor(random() * 16);
+    name TEXT;
+BEGIN
+    IF marked IS NOT NULL THEN
+        PERFORM set_config('lakuai.data_versions', '', true);
+        FOREACH name IN ARRAY (SELECT array_agg(t ORDER BY t) FROM unnest(string_to_array(marked, ',')) t) LOOP
+            INSERT INTO data_versions AS v (table_name, slot, version) VALUES (name, picked_slot, 1)
+            ON CONFLICT (table_name, slot) DO UPDATE SET version = v.version + 1;
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_data_version ON sales;
+CREATE TRIGGER sales_data_version
+    AFTER INSERT OR UPDATE OR DELETE ON sales
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_data_version('sales');
+DROP TRIGGER IF EXISTS sales_data_version_commit ON sales;
+CREATE CONSTRAINT TRIGGER sales_data_version_commit
+    AFTER INSERT OR UPDATE OR DELETE ON sales
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION bump_marked_data_versions();
+DROP TRIGGER IF EXISTS sales_data_version_truncate ON sales;
+CREATE TRIGGER sales_data_version_truncate
+    AFTER TRUNCATE ON sales
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('sales');
+
+DROP TRIGGER IF EXISTS storage_data_version ON storage;
+CREATE TRIGGER storage_data_version
+    AFTER INSERT OR UPDATE OR DELETE ON storage
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_data_version('storage');
+DROP TRIGGER IF EXISTS storage_data_version_commit ON storage;
+CREATE CONSTRAINT TRIGGER storage_data_version_commit
+    AFTER INSERT OR UPDATE OR DELETE ON storage
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION bump_marked_data_versions();
+DROP TRIGGER IF EXISTS storage_data_version_truncate ON storage;
+CREATE TRIGGER storage_data_version_truncate
+    AFTER TRUNCATE ON storage
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('storage');
+"""
+
+# Windows like "today" move at local midnight; offsets are multiples of 15 minutes
+TIME_BUCKET_SECONDS = 900
+
+
+def fetch_versions(tables):
+    """Return ``{table: version}`` for the given tables, from the request's read target."""
+    with read_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT table_name, SUM(version)::bigint AS version FROM data_versions "
+                "WHERE table_name = ANY(%s) GROUP BY table_name",
+                (list(tables),)
+            )
+            return {row['table_name']: row['version'] for row in cur.fetchall()}
+
+
+def make_etag(*parts):
+    return hashlib.sha1("\x00".join(str(p) for p in parts).encode()).hexdigest()[:20]
+
+
+def time_bucket():
+    """ETag part for responses that depend on the clock (e.g. ``?period=today``)."""
+    return int(time.time() // TIME_BUCKET_SECONDS)
+
+
+def conditional(*tables, vary=None):
+    """Serve a GET view with a weak ETag derived from ``tables``' data versions.
+
+    ``vary`` is an optional callable returning extra ETag input (for example
+    :func:`time_bucket` when the result depends on the current time).
+    The ETag is read *before* the view runs, so the payload is never older
+    than its tag; at worst a concurrent write makes the next poll refetch.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            try:
+                versions = fetch_versions(tables)
+            except Exception as e:
+                # e.g. the data_versions migration has not been applied yet
+                logger.warning("Data versions unavailable, serving %s unconditionally: %s", request.path, e)
+                return view(*args, **kwargs)
+
+            etag = make_etag(request.full_path, *(versions.get(t) for t in tables),
+                             vary() if vary else "")
+            if request.if_none_match.contains_weak(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # Always revalidate; a 304 costs one primary-key lookup
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,545 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+
+import psycopg2
+import psycopg2.pool
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor
+
+from metrics import record_query, record_pool_wait
+
+logger = logging.getLogger(__name__)
+
+# ---------------- Pool Config ----------------
+# Sized per gunicorn worker: each worker process owns its own pool, so the
+# total number of server connections is roughly workers * DB_POOL_MAX_SIZE.
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 4))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))               # seconds to wait for a free connection
+POOL_VALIDATE_AFTER = float(os.getenv("DB_POOL_VALIDATE_AFTER", 30))  # ping connections idle longer than this
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 1800))    # recycle connections older than this
+
+# ---------------- Read replicas ----------------
+# Comma-separated URLs of streaming replicas for read-only requests; each
+# gets its own per-process pool of up to DB_REPLICA_POOL_MAX_SIZE connections.
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_POOL_MAX_SIZE = int(os.getenv("DB_REPLICA_POOL_MAX_SIZE", POOL_MAX_SIZE))
+REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 5))   # seconds between health checks
+REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 10))                # seconds of replay lag tolerated
+REPLICA_TIMEOUT = float(os.getenv("DB_REPLICA_TIMEOUT", 1))                 # pool wait before using the primary
+
+
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """Raised when no connection could be checked out within the pool timeout."""
+
+
+def get_connection_params(database_url=None):
+    """Build psycopg2 connection parameters from DATABASE_URL (parsed once per pool)."""
+    database_url = database_url or os.getenv('DATABASE_URL')
+    if not database_url:
+        raise ValueError("❌ DATABASE_URL environment variable is not set")
+
+    result = urlparse(database_url)
+    query = parse_qs(result.query)
+
+    return {
+        'dbname': result.path[1:],  # Remove the leading '/'
+        'user': result.username,
+        'password': result.password,
+        'host': result.hostname,
+        'port': result.port,
+        'sslmode': query.get('sslmode', ['require'])[0],  # SSL unless the URL says otherwise
+        'connect_timeout': 10,
+        'keepalives': 1,
+        'keepalives_idle': 30,
+        'keepalives_interval': 10,
+        'keepalives_count': 5,
+        'application_name': 'LakuAI-App'  # For identifying connection in pg_stat_activity
+    }
+
+
+def get_local_connection_params():
+    """Fallback parameters from the DB_* variables used by init_db.py."""
+    return {
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": int(os.getenv("DB_PORT", 5432))
+    }
+
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor that reports the duration of every statement to the request metrics."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(time.perf_counter() - started)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_query(time.perf_counter() - started)
+
+
+def connect(conn_params, fallback_params=None):
+    """Open a RealDictCursor connection, falling back to the local configuration."""
+    try:
+        return psycopg2.connect(**conn_params, cursor_factory=InstrumentedCursor)
+    except Exception as e:
+        if not fallback_params:
+            raise
+        logger.warning("Primary database connection failed (%s: %s), trying local configuration",
+                       type(e).__name__, e)
+        return psycopg2.connect(**fallback_params, cursor_factory=InstrumentedCursor)
+
+
+class ConnectionPool:
+    """A small thread-safe PostgreSQL connection pool.
+
+    Connections are handed out LIFO so the warmest connection is reused first,
+    validated with ``SELECT 1`` when they have been idle for a while and
+    recycled once they pass ``max_lifetime``. Callers wait at most ``timeout``
+    seconds for a free connection before ``PoolTimeoutError`` is raised.
+    """
+
+    def __init__(self, conn_params, fallback_params=None, min_size=POOL_MIN_SIZE,
+                 max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 validate_after=POOL_VALIDATE_AFTER, max_lifetime=POOL_MAX_LIFETIME):
+        self.conn_params = conn_params
+        self.fallback_params = fallback_params
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self.max_lifetime = max_lifetime
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = deque()       # (conn, created_at, last_used_at)
+        self._created_at = {}      # id(conn) -> creation time, for connections we own
+        self._connecting = 0       # slots reserved by threads currently opening a connection
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_recycled": 0,
+            "connections_failed_validation": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+        }
+
+        for _ in range(self.min_size):
+            try:
+                conn = self._connect()
+            except Exception as e:
+                logger.warning("Could not pre-open pooled connection: %s", e)
+                break
+            self._idle.append((conn, self._created_at[id(conn)], time.monotonic()))
+
+    # ---------------- Connection lifecycle ----------------
+    def _connect(self):
+        conn = connect(self.conn_params, self.fallback_params)
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self._stats["connections_created"] += 1
+        logger.info("Opened database connection to %s:%s/%s (pool size %d/%d)",
+                    conn.info.host, conn.info.port, conn.info.dbname,
+                    len(self._created_at), self.max_size)
+        return conn
+
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, created_at, last_used_at):
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            self._stats["connections_recycled"] += 1
+            return False
+        if self.validate_after is not None and now - last_used_at > self.validate_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except Exception:
+                self._stats["connections_failed_validation"] += 1
+                return False
+        return True
+
+    # ---------------- Checkout / return ----------------
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("connection pool is closed")
+                while not self._idle and len(self._created_at) + self._connecting >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {timeout:.1f}s waiting for a database connection "
+                            f"(pool size {self.max_size})"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    conn, created_at, last_used_at = self._idle.pop()
+                else:
+                    # Reserve a slot, then connect outside the lock.
+                    conn = None
+                    self._connecting += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                finally:
+                    with self._cond:
+                        self._connecting -= 1
+                        self._cond.notify()
+                break
+            if self._is_usable(conn, created_at, last_used_at):
+                break
+            with self._cond:
+                self._discard(conn)
+                self._cond.notify()
+
+        waited_ms = (time.monotonic() - started) * 1000
+        record_pool_wait(waited_ms / 1000)
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["total_wait_ms"] += waited_ms
+            self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], waited_ms)
+        return conn
+
+    def putconn(self, conn, close=False):
+        with self._cond:
+            created_at = self._created_at.get(id(conn))
+            if created_at is None:
+                # Not ours (e.g. inherited across a fork); never hand it out again.
+                return
+            broken = (close or self._closed or conn.closed
+                      or conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE)
+            if broken:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection; commit on success, roll back on error, always return it."""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except BaseException:  # includes GeneratorExit from abandoned streaming responses
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            raise
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            size = len(self._created_at)
+            stats = dict(self._stats)
+            checkouts = stats["checkouts"]
+            stats.update({
+                "pid": self.pid,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": size,
+                "idle": len(self._idle),
+                "in_use": size - len(self._idle),
+                "waiting": self._waiting,
+                "avg_wait_ms": round(stats["total_wait_ms"] / checkouts, 3) if checkouts else 0.0,
+            })
+            return stats
+
+
+# ---------------- Per-process pool ----------------
+_pool = None
+_pool_lock = threading.Lock()
+_orphaned = []  # connections inherited from a parent process; kept alive so they are never closed here
+
+
+def _reset_after_fork():
+    """Drop the pool inherited from the gunicorn master (--preload) without closing its sockets."""
+    global _pool, _pool_lock
+    if _pool is not None:
+        _orphaned.extend(conn for conn, _, _ in _pool._idle)
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_pool():
+    """Return this process's pool, creating it on first use."""
+    global _pool
+    if _pool is not None and _pool.pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(get_connection_params(), fallback_params=get_local_connection_params())
+        return _pool
+
+
+def get_db_connection(timeout=None):
+    """Borrow a pooled connection: ``with get_db_connection() as conn: ...``."""
+    return get_pool().connection(timeout)
+
+
+def open_connection(autocommit=False):
+    """Open a dedicated connection outside the pool (e.g. for LISTEN); the caller closes it."""
+    conn = connect(get_connection_params(), get_local_connection_params())
+    conn.autocommit = autocommit
+    return conn
+
+
+def pool_stats():
+    if _pool is None or _pool.pid != os.getpid():
+        return {"pid": os.getpid(), "size": 0, "max_size": POOL_MAX_SIZE, "initialized": False}
+    stats = _pool.stats()
+    stats["initialized"] = True
+    return stats
+
+
+# ---------------- Read replicas ----------------
+PRIMARY = "primary"
+
+
+def parse_lsn(lsn):
+    """``'16/B374D848'`` -> an int that orders like the WAL position."""
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class Replica:
+    """One read replica: its pool and what the last health check saw."""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.pool = ConnectionPool(get_connection_params(url), min_size=0, max_size=REPLICA_POOL_MAX_SIZE,
+                                   timeout=REPLICA_TIMEOUT)
+        self.healthy = False
+        self.checked_at = None
+        self.replay_lsn = 0
+        self.lag = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def _read_position(self, cur):
+        cur.execute("""
+            SELECT pg_is_in_recovery() AS standby,
+                   pg_last_wal_replay_lsn()::text AS replay_lsn,
+                   pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() AS caught_up,
+                   EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) AS lag
+        """)
+        row = cur.fetchone()
+        self.replay_lsn = parse_lsn(row["replay_lsn"]) if row["replay_lsn"] else 0
+        self.lag = float(row["lag"]) if row["lag"] is not None else None
+        # An idle primary makes the replay timestamp look old; nothing is pending then
+        return row["standby"] and (row["caught_up"] or self.lag is None or self.lag <= REPLICA_MAX_LAG)
+
+    def check(self, force=False):
+        """Refresh the health state if the last check is older than the check interval."""
+        now = time.monotonic()
+        if not force and self.checked_at is not None and now - self.checked_at < REPLICA_CHECK_INTERVAL:
+            return self.healthy
+        if not self._lock.acquire(blocking=False):
+            return self.healthy  # another thread is checking
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    self.healthy = self._read_position(cur)
+            self.error = None if self.healthy else "lagging or not in recovery"
+        except Exception as e:
+            self.healthy = False
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.checked_at = time.monotonic()
+            self._lock.release()
+        if not self.healthy:
+            logger.warning("Read replica %s unavailable: %s", self.name, self.error)
+        return self.healthy
+
+    def has_replayed(self, conn, min_lsn):
+        """Whether this replica has replayed WAL up to ``min_lsn``, re-reading its position if needed."""
+        if self.replay_lsn >= min_lsn:
+            return True
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_last_wal_replay_lsn()::text AS replay_lsn")
+            lsn = cur.fetchone()["replay_lsn"]
+        self.replay_lsn = parse_lsn(lsn) if lsn else 0
+        return self.replay_lsn >= min_lsn
+
+    def stats(self):
+        return {
+            "healthy": self.healthy,
+            "lag_seconds": round(self.lag, 3) if self.lag is not None else None,
+            "checked_ago": round(time.monotonic() - self.checked_at, 1) if self.checked_at is not None else None,
+            "error": self.error,
+            "pool": self.pool.stats(),
+        }
+
+
+class ReplicaRouter:
+    """Routes read-only work to healthy replicas round robin, falling back to the primary.
+
+    A replica is used only while its health check passes and, for callers
+    that pass ``min_lsn``, once it has replayed that far, so a client that
+    just wrote reads its own write.
+    """
+
+    def __init__(self, urls):
+        self.urls = list(urls)
+        self.pid = os.getpid()
+        self._next = 0
+        self._replicas = None
+        self._lock = threading.Lock()
+        self._stats = {"replica_reads": 0, "primary_reads": 0, "behind_lsn": 0, "replica_errors": 0}
+
+    @property
+    def replicas(self):
+        if self._replicas is None:
+            with self._lock:
+                if self._replicas is None:
+                    self._replicas = [Replica(f"replica{i}", url) for i, url in enumerate(self.urls)]
+        return self._replicas
+
+    def _candidates(self, prefer=None):
+        if not self.urls or prefer == PRIMARY:
+            return []
+        replicas = self.replicas
+        if prefer is not None:
+            return [replica for replica in replicas if replica.name == prefer]
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(replicas)
+        return replicas[start:] + replicas[:start]
+
+    @contextmanager
+    def connection(self, min_lsn=None, prefer=None):
+        """Yield ``(conn, target)`` where target is a replica name or ``PRIMARY``.
+
+        ``prefer`` pins a request to the target it already read from, so its
+        reads never go back in time.
+        """
+        for replica in self._candidates(prefer):
+            if not replica.check():
+                continue
+            try:
+                conn = replica.pool.getconn()
+            except Exception:
+                self._stats["replica_errors"] += 1
+                replica.check(force=True)
+                continue
+            try:
+                usable = not min_lsn or replica.has_replayed(conn, min_lsn)
+            except Exception:
+                replica.pool.putconn(conn, close=True)
+                self._stats["replica_errors"] += 1
+                replica.check(force=True)
+                continue
+            if not usable:
+                conn.rollback()
+                replica.pool.putconn(conn)
+                self._stats["behind_lsn"] += 1
+                continue
+            self._stats["replica_reads"] += 1
+            try:
+                yield conn, replica.name
+                if not conn.closed:
+                    conn.commit()
+            except BaseException:
+                if not conn.closed:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                raise
+            finally:
+                replica.pool.putconn(conn)
+            return
+
+        self._stats["primary_reads"] += 1
+        with get_db_connection() as conn:
+            yield conn, PRIMARY
+
+    def _reset(self):
+        """Forget inherited replica pools after a fork, like the primary pool."""
+        if self._replicas is not None:
+            for replica in self._replicas:
+                _orphaned.extend(conn for conn, _, _ in replica.pool._idle)
+        self.pid = os.getpid()
+        self._replicas = None
+        self._lock = threading.Lock()
+
+    def stats(self):
+        return dict(self._stats, replicas={replica.name: replica.stats() for replica in self.replicas})
+
+
+router = ReplicaRouter(REPLICA_URLS)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=router._reset)
+
+
+def get_read_connection(min_lsn=None, prefer=None):
+    """Borrow a connection for read-only work: ``with get_read_connection() as (conn, target): ...``."""
+    return router.connection(min_lsn, prefer)
+
+
+def current_wal_lsn():
+    """The primary's current WAL position (see :func:`parse_lsn`), for read-your-writes."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_current_wal_lsn()::text AS lsn")
+            return parse_lsn(cur.fetchone()["lsn"])
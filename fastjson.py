@@ -0,0 +1,129 @@
+"""JSON encoding for API responses: orjson when installed, the stdlib otherwise.
+
+The output has the same meaning as Flask's default ``jsonify``: keys are
+sorted, ``Decimal`` becomes a string and dates become HTTP dates. Only the
+bytes can differ: orjson writes non-ASCII characters as UTF-8 instead of
+``\\u`` escapes, and orders integer keys as strings. ``JSON_BACKEND=stdlib``
+forces the fallback.
+
+:func:`rows_response` adds two opt-in query parameters to row listings.
+``?fields=id,item_name,total_price`` keeps only those columns.
+``?layout=columns`` sends ``{"columns": [...], "rows": [[...], ...]}``
+instead of one object per row.
+"""
+import os
+import json
+import logging
+import dataclasses
+from uuid import UUID
+from datetime import date
+from decimal import Decimal
+
+from flask import request, current_app
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")  # auto | orjson | stdlib
+LAYOUTS = ("objects", "columns")
+
+
+def default(value):
+    """Types JSON has no literal for, converted the way Flask's default provider does."""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, date):  # datetime too
+        return http_date(value)
+    if isinstance(value, UUID):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_stdlib_encoder = json.JSONEncoder(default=default, sort_keys=True, separators=(",", ":"))
+
+
+def _stdlib_dumps(obj):
+    return _stdlib_encoder.encode(obj).encode()
+
+
+ENCODERS = {"stdlib": _stdlib_dumps}
+
+if orjson is not None:
+    # Datetimes go through default() so they stay HTTP dates, as with jsonify
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def _orjson_dumps(obj):
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+
+    ENCODERS["orjson"] = _orjson_dumps
+
+if JSON_BACKEND == "orjson" and orjson is None:
+    logger.warning("JSON_BACKEND=orjson but orjson is not installed; using the stdlib encoder")
+BACKEND = "orjson" if orjson is not None and JSON_BACKEND != "stdlib" else "stdlib"
+dumps_bytes = ENCODERS[BACKEND]
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's default provider with compact output encoded by :data:`dumps_bytes`.
+
+    Calls with other options (``indent`` when the app runs in debug mode)
+    go to the default implementation.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {"separators"}:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode()
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+
+
+def _fields(rows):
+    value = request.args.get("fields")
+    if not value:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    if rows:
+        unknown = [field for field in fields if field not in rows[0]]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}. "
+                             f"Available: {', '.join(rows[0].keys())}")
+    return fields
+
+
+def rows_response(rows, status=200):
+    """``jsonify(rows)`` for a list of row dicts, honouring ``?fields=`` and ``?layout=columns``.
+
+    Raises ValueError for an unknown field or layout.
+    """
+    layout = request.args.get("layout", "objects")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}'. Use one of: {', '.join(LAYOUTS)}")
+    fields = _fields(rows)
+
+    if layout == "columns":
+        columns = fields if fields is not None else (list(rows[0].keys()) if rows else [])
+        payload = {"columns": columns, "rows": [[row.get(column) for column in columns] for row in rows]}
+    elif fields is not None:
+        payload = [{field: row.get(field) for field in fields} for row in rows]
+    else:
+        payload = rows
+    return current_app.response_class(dumps_bytes(payload) + b"\n", status=status, mimetype="application/json")
@@ -0,0 +1,65 @@
+"""Cooperative I/O support for the gevent worker mode (gunicorn_gevent.conf.py).
+
+Under gevent the standard library is monkey-patched, but psycopg2 talks to
+Postgres through libpq in C and would still block the whole worker. A wait
+callback (as in psycogreen) makes libpq run non-blocking and yields to the
+gevent hub while a query waits on the socket. Gemini is switched to the REST
+transport, which goes through the patched ``socket`` module, instead of gRPC.
+"""
+import os
+import logging
+
+from psycopg2 import extensions, OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+def running_green():
+    """True inside a gevent worker (i.e. once ``socket`` has been monkey-patched)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+
+def gevent_wait_callback(conn, timeout=None):
+    """psycopg2 wait callback that parks the greenlet instead of the thread."""
+    from gevent.socket import wait_read, wait_write
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Bad result from poll: {state!r}")
+
+
+def patch_psycopg():
+    if extensions.get_wait_callback() is None:
+        extensions.set_wait_callback(gevent_wait_callback)
+        logger.info("psycopg2 switched to cooperative waiting (gevent)")
+
+
+def gemini_transport():
+    """Transport for ``genai.configure``: GEMINI_TRANSPORT, else REST when green, else the default."""
+    transport = os.getenv("GEMINI_TRANSPORT")
+    if transport:
+        return transport
+    return "rest" if running_green() else None
+
+
+def setup():
+    """Make blocking client libraries cooperative when running under gevent."""
+    if not running_green():
+        return False
+    patch_psycopg()
+    if gemini_transport() == "grpc":
+        # gRPC keeps its own threads and sockets; it needs its gevent integration
+        from grpc.experimental import gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+    return True
@@ -0,0 +1,22 @@
+"""Gunicorn settings loaded automatically from the working directory (gthread mode).
+
+Flags on the gunicorn command line take precedence over anything here. The
+gevent mode (the Procfile) uses gunicorn_gevent.conf.py instead, which
+repeats these hooks.
+"""
+import os
+import shutil
+import tempfile
+
+# /metrics aggregates every worker through files in this directory. It has to
+# exist before prometheus_client is imported (the master imports the app when
+# preloading), so it is created here rather than in a server hook.
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), f"lakuai-metrics-{os.getpid()}")
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
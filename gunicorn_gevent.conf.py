@@ -0,0 +1,46 @@
+"""Gunicorn settings for the cooperative (gevent) worker mode.
+
+    gunicorn -c gunicorn_gevent.conf.py wsgi:app
+
+Each worker serves up to ``worker_connections`` requests at once as
+greenlets. Postgres and Gemini waits yield to other greenlets (see green.py),
+so a worker is no longer capped at its thread count. Database connections
+stay bounded: greenlets queue for the per-worker pool instead of each
+holding a connection.
+"""
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = "gevent"
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+worker_connections = int(os.getenv("GEVENT_WORKER_CONNECTIONS", 200))
+timeout = 120
+max_requests = 1000
+max_requests_jitter = 50
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+# The gevent worker monkey-patches after forking; with preload the app (and
+# its locks, pools and threads) would be created unpatched in the master.
+preload_app = False
+
+# Defaults sized for hundreds of greenlets per worker; explicit settings win.
+# Keep workers * DB_POOL_MAX_SIZE below the server's max_connections.
+os.environ.setdefault("DB_POOL_MAX_SIZE", "20")
+os.environ.setdefault("DB_POOL_TIMEOUT", "10")
+os.environ.setdefault("LLM_MAX_CONCURRENCY", "32")
+os.environ.setdefault("LLM_QUEUE_TIMEOUT", "5")
+
+# /metrics aggregates every worker through files in this directory (see gunicorn.conf.py)
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), f"lakuai-metrics-{os.getpid()}")
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
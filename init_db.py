@@ -1,6 +1,12 @@
 import os
 import psycopg2
 from dotenv import load_dotenv
+
+from rollups import ROLLUP_TABLES_SQL
+from catalog import CATALOG_VERSION_SQL
+from data_versions import DATA_VERSION_SQL
+from stock_shards import STOCK_SHARDS_SQL
+from partitions import SALES_PARTITIONS_SQL, ensure_partitions
 from datetime import datetime
 
 # Load environment variables
@@ -16,35 +22,52 @@ DB_CONFIG = {
 
 # SQL to create tables
 CREATE_TABLES_SQL = """
--- Sales table to track all sales transactions
-CREATE TABLE IF NOT EXISTS sales (
-    id SERIAL PRIMARY KEY,
-    item_name TEXT NOT NULL,
-    quantity INTEGER NOT NULL,
-    price NUMERIC(10, 2) NOT NULL,
-    total_price NUMERIC(10, 2) GENERATED ALWAYS AS (quantity * price) STORED,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-);
-
 -- Storage table for inventory management
 CREATE TABLE IF NOT EXISTS storage (
     item_id SERIAL PRIMARY KEY,
     item_name TEXT NOT NULL UNIQUE,
     quantity INTEGER NOT NULL DEFAULT 0,
     price NUMERIC(10, 2) NOT NULL,
+    stock_shards SMALLINT NOT NULL DEFAULT 0,  -- see stock_shards.py
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Sales table to track all sales transactions, one partition per month
+-- (see partitions.py)
+CREATE TABLE IF NOT EXISTS sales (
+    id SERIAL,
+    item_id INTEGER REFERENCES storage(item_id),  -- NULL only for old sales of items that no longer exist
+    item_name TEXT NOT NULL,                      -- the item's name when it was sold
+    quantity INTEGER NOT NULL,
+    price NUMERIC(10, 2) NOT NULL,
+    total_price NUMERIC(10, 2) GENERATED ALWAYS AS (quantity * price) STORED,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
 
 -- Indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_sales_created_at ON sales(created_at);
+CREATE INDEX IF NOT EXISTS idx_sales_item_id_created_at ON sales(item_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_sales_unlinked_item_name ON sales(LOWER(item_name)) WHERE item_id IS NULL;
 CREATE INDEX IF NOT EXISTS idx_storage_item_name ON storage(LOWER(item_name));
 """
 
 
 
+def create_schema(cur):
+    """Create every table, index and trigger the app needs (idempotent)."""
+    cur.execute(CREATE_TABLES_SQL)
+    cur.execute(SALES_PARTITIONS_SQL)
+    ensure_partitions(cur)
+    cur.execute(ROLLUP_TABLES_SQL)
+    cur.execute(CATALOG_VERSION_SQL)
+    cur.execute(DATA_VERSION_SQL)
+    cur.execute(STOCK_SHARDS_SQL)
+
+
 def init_db():
     """Initialize the database with required tables and sample data."""
     try:
@@ -52,7 +75,7 @@ def init_db():
             conn.autocommit = False
             with conn.cursor() as cur:
                 # Create tables
-                cur.execute(CREATE_TABLES_SQL)
+                create_schema(cur)
                 
                 conn.commit()
                 print("✅ Database initialized successfully!")
@@ -0,0 +1,95 @@
+"""One Postgres LISTEN connection per worker, shared by every channel.
+
+Modules register a callback per channel at import time; the first caller
+of :meth:`NotificationListener.ensure_started` starts a daemon thread that
+LISTENs on all registered channels and hands each NOTIFY payload to its
+channel's callbacks. After every (re)connect the ``on_connect`` callbacks
+run, so consumers can resynchronise anything they missed while the
+connection was down.
+"""
+import os
+import time
+import select
+import logging
+import threading
+
+from db import open_connection
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationListener:
+    def __init__(self):
+        self._channels = {}      # channel -> [callback(payload)]
+        self._on_connect = []
+        self._reset()
+
+    def _reset(self):
+        """Forget the thread and connection; also run in each worker after a --preload fork."""
+        self._lock = threading.Lock()
+        self._thread = None
+        self.healthy = False
+
+    def register(self, channel, callback, on_connect=None):
+        """Deliver NOTIFYs on ``channel`` to ``callback(payload)``.
+
+        Channels registered after the thread has started are picked up on
+        its next reconnect, so register at import time.
+        """
+        self._channels.setdefault(channel, []).append(callback)
+        if on_connect is not None:
+            self._on_connect.append(on_connect)
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+                self._thread.start()
+
+    def _dispatch(self, channel, payload):
+        for callback in self._channels.get(channel, ()):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("Notification handler for %s failed", channel)
+
+    def _run(self):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = open_connection(autocommit=True)
+                with conn.cursor() as cur:
+                    for channel in list(self._channels):
+                        cur.execute(f"LISTEN {channel}")
+                # Anything sent before LISTEN took effect is recovered here
+                for callback in list(self._on_connect):
+                    callback()
+                self.healthy = True
+                backoff = 1
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except Exception as e:
+                self.healthy = False
+                logger.warning("Notification listener disconnected (%s); retrying in %ss", e, backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+listener = NotificationListener()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=listener._reset)
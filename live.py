@@ -0,0 +1,253 @@
+"""Live dashboard updates: writes NOTIFY change events, workers fan them out over SSE.
+
+Writers call the ``publish_*`` helpers inside their transaction, so an
+event is delivered exactly when its data commits and never for a rollback.
+Each worker's shared listener (listener.py) receives every event once and
+the :class:`Broadcaster` copies it to the worker's open ``/api/live``
+streams, so the database does O(writes) work however many dashboards are
+open.
+
+Events are compact deltas:
+
+* ``sale``: new sale rows (with the rollup ``hour``), the stock left for
+  the items sold and the new running totals;
+* ``sale_deleted``: the deleted rows and the new totals;
+* ``stock``: added or changed storage rows, and ``removed`` ones;
+* ``refresh``: ``tables`` changed too much to describe (bulk writes,
+  deleting all sales, renames); clients refetch them.
+
+A payload over NOTIFY's size limit is replaced by a ``refresh``.
+"""
+import os
+import json
+import uuid
+import queue
+import logging
+import threading
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
+
+import green
+import rollups
+from listener import listener
+
+logger = logging.getLogger(__name__)
+
+LIVE_CHANNEL = "dashboard_changes"
+LIVE_HISTORY = int(os.getenv("LIVE_HISTORY", 200))                 # events kept for Last-Event-ID replay
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", 100))           # events buffered per slow client
+LIVE_KEEPALIVE = float(os.getenv("LIVE_KEEPALIVE", 15))            # seconds between SSE comments
+LIVE_MAX_DURATION = float(os.getenv("LIVE_MAX_DURATION", 300))     # streams end after this; EventSource reconnects
+NOTIFY_MAX_BYTES = 7900  # Postgres rejects payloads of 8000 bytes or more
+MAX_DELTA_ROWS = 40      # larger batches are announced as a refresh without encoding them
+REFRESH_ALL = '{"tables":["sales","storage"]}'
+
+SALE_FIELDS = ("id", "item_id", "item_name", "quantity", "price", "total_price", "created_at")
+STOCK_FIELDS = ("item_id", "item_name", "quantity", "price")
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode(event, data):
+    return f"{event}\n{json.dumps(data, default=_default, separators=(',', ':'))}"
+
+
+# ---------------- Publishing (inside the writer's transaction) ----------------
+def publish(cur, event, data):
+    payload = _encode(event, data)
+    if len(payload.encode()) > NOTIFY_MAX_BYTES:
+        tables = ["sales", "storage"] if event.startswith("sale") else ["storage"]
+        payload = _encode("refresh", {"tables": tables})
+    cur.execute("SELECT pg_notify(%s, %s)", (LIVE_CHANNEL, payload))
+
+
+def _sale_delta(sale):
+    delta = {field: sale.get(field) for field in SALE_FIELDS}
+    delta["hour"] = sale["created_at"].hour if sale.get("created_at") is not None else None
+    return delta
+
+
+def publish_sales(cur, sales, stock=(), totals=None):
+    """Announce new sales; ``stock`` is ``[{item_id, item_name, quantity}]`` after the sale."""
+    if not sales:
+        return
+    if len(sales) > MAX_DELTA_ROWS:
+        return publish_refresh(cur, "sales", "storage")
+    publish(cur, "sale", {
+        "sales": [_sale_delta(sale) for sale in sales],
+        "stock": [{field: row.get(field) for field in STOCK_FIELDS if field in row} for row in stock],
+        "totals": totals if totals is not None else rollups.read_totals(cur),
+    })
+
+
+def publish_sales_deleted(cur, sales):
+    if not sales:
+        return
+    publish(cur, "sale_deleted", {
+        "sales": [_sale_delta(sale) for sale in sales],
+        "totals": rollups.read_totals(cur),
+    })
+
+
+def publish_stock(cur, items=(), removed=()):
+    """Announce added or changed ``items`` and ``removed`` ones (both storage rows)."""
+    publish(cur, "stock", {
+        "items": [{field: row.get(field) for field in STOCK_FIELDS} for row in items],
+        "removed": [{"item_id": row["item_id"], "item_name": row["item_name"]} for row in removed],
+    })
+
+
+def publish_refresh(cur, *tables):
+    publish(cur, "refresh", {"tables": list(tables)})
+
+
+# ---------------- Fan-out (per worker) ----------------
+class Subscription:
+    """One open SSE stream's queue; iterate :meth:`events` and close when done."""
+
+    def __init__(self, broadcaster, backlog):
+        self.broadcaster = broadcaster
+        self.queue = queue.Queue(LIVE_QUEUE_SIZE)
+        for item in backlog:
+            self.queue.put_nowait(item)
+
+    def events(self, keepalive=LIVE_KEEPALIVE):
+        """Yield ``(id, event, data)`` tuples, or None every ``keepalive`` seconds of silence."""
+        while True:
+            try:
+                yield self.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield None
+
+    def offer(self, item):
+        """Queue an event; returns False if the client was too far behind and got a refresh instead."""
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            # Too far behind to catch up with deltas: start over from a refresh
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait((item[0], "refresh", REFRESH_ALL))
+            return False
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _worker_mode():
+    return "gevent" if green.running_green() else "threads"
+
+
+class Broadcaster:
+    """Copies events from the worker's listener to every open stream in this worker.
+
+    Event ids are ``<worker token>-<sequence>``; a reconnecting EventSource
+    sends the last one back and gets the events it missed from
+    ``LIVE_HISTORY``, or a ``refresh`` if they are gone or came from another
+    worker.
+    """
+
+    def __init__(self, max_subscribers=None):
+        self.max_subscribers = max_subscribers
+        self._reset()
+
+    def _reset(self):
+        """(Re)initialise all state; also run in each worker after a --preload fork."""
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=LIVE_HISTORY)
+        self._token = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._listened = False
+        self._stats = {"events": 0, "refused": 0, "overflows": 0}
+
+    @property
+    def limit(self):
+        if self.max_subscribers is not None:
+            return self.max_subscribers
+        # A gthread worker spends a whole thread per open stream; greenlets are cheap
+        return int(os.getenv("LIVE_MAX_SUBSCRIBERS", 500 if green.running_green() else 1))
+
+    def _next_id(self):
+        self._seq += 1
+        return f"{self._token}-{self._seq}"
+
+    def _backlog(self, last_event_id):
+        if not last_event_id:
+            return []
+        token, _, seq = last_event_id.partition("-")
+        if token == self._token and seq.isdigit():
+            missed = [item for item in self._history if int(item[0].rpartition("-")[2]) > int(seq)]
+            oldest = int(self._history[0][0].rpartition("-")[2]) if self._history else self._seq + 1
+            if oldest <= int(seq) + 1 and len(missed) < LIVE_QUEUE_SIZE:
+                return missed
+        return [(self._next_id(), "refresh", REFRESH_ALL)]
+
+    def subscribe(self, last_event_id=None):
+        """Open a subscription, or return None when this worker is at its stream limit."""
+        listener.ensure_started()
+        with self._lock:
+            if len(self._subscribers) >= self.limit:
+                if not self._stats["refused"]:
+                    logger.warning("Live stream refused: %d open in this %s worker (LIVE_MAX_SUBSCRIBERS); "
+                                   "further dashboards poll instead%s", len(self._subscribers), _worker_mode(),
+                                   "" if green.running_green() else ". Run the gevent workers (Procfile) "
+                                   "to keep every dashboard live")
+                self._stats["refused"] += 1
+                return None
+            subscription = Subscription(self, self._backlog(last_event_id))
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def broadcast(self, event, data):
+        """Send an event (``data`` already JSON-encoded) to every stream in this worker."""
+        with self._lock:
+            item = (self._next_id(), event, data)
+            self._history.append(item)
+            self._stats["events"] += 1
+            for subscription in self._subscribers:
+                if not subscription.offer(item):
+                    self._stats["overflows"] += 1
+
+    def _on_notify(self, payload):
+        event, _, data = payload.partition("\n")
+        self.broadcast(event, data or "{}")
+
+    def _on_connect(self):
+        # Events published while the listener was reconnecting are lost
+        if self._listened:
+            self.broadcast("refresh", REFRESH_ALL)
+        self._listened = True
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, subscribers=len(self._subscribers), limit=self.limit,
+                        worker_mode=_worker_mode(), listener_healthy=listener.healthy)
+
+
+broadcaster = Broadcaster()
+listener.register(LIVE_CHANNEL, broadcaster._on_notify, on_connect=broadcaster._on_connect)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=broadcaster._reset)
@@ -0,0 +1,174 @@
+"""Cache of parsed Gemini replies, keyed on normalized user text.
+
+Only the parsed action JSON is stored, never the result of executing it, so
+a cached "2 kopi" still records a new sale every time. Keys include the
+catalog version and a prompt version, so renaming an item or editing the
+system prompt naturally misses.
+
+Two levels: a bounded in-process LRU, and a SQLite file shared by every
+gunicorn worker on the machine. Both honour ``LLM_CACHE_TTL``.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000))
+LLM_CACHE_SHARED_MAX_ENTRIES = int(os.getenv("LLM_CACHE_SHARED_MAX_ENTRIES", 10000))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "lakuai-llm-cache.sqlite3"))
+
+
+def normalize_text(text):
+    return " ".join(str(text).lower().split()).strip(" .!?")
+
+
+def make_key(user_text, catalog_version, prompt_version):
+    raw = f"{prompt_version}\x00{catalog_version}\x00{normalize_text(user_text)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES,
+                 shared_max_entries=LLM_CACHE_SHARED_MAX_ENTRIES, enabled=LLM_CACHE_ENABLED):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared_max_entries = shared_max_entries
+        self.enabled = enabled
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._local = OrderedDict()    # key -> (expires_at, json text)
+        self._threads = threading.local()
+        self._shared_ok = bool(self.path)
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "shared_errors": 0}
+
+    # ---------------- Shared (SQLite) level ----------------
+    def _db(self):
+        conn = getattr(self._threads, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._threads.conn = conn
+        return conn
+
+    def _shared_get(self, key):
+        if not self._shared_ok:
+            return None
+        try:
+            row = self._db().execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+            return row
+        except sqlite3.Error as e:
+            self._shared_error(e)
+            return None
+
+    def _shared_set(self, key, value, expires_at):
+        if not self._shared_ok:
+            return
+        try:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                       (key, value, expires_at))
+            if self._stats["stores"] % 100 == 0:
+                db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+                db.execute("""
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM llm_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.shared_max_entries,))
+        except sqlite3.Error as e:
+            self._shared_error(e)
+
+    def _shared_error(self, error):
+        with self._lock:
+            self._stats["shared_errors"] += 1
+        logger.warning("Shared LLM cache unavailable (%s); using the in-process cache only", error)
+
+    # ---------------- Public API ----------------
+    def get(self, key):
+        """Return a fresh copy of the cached action for ``key``, or None."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            cached = self._local.get(key)
+            if cached and cached[0] > now:
+                self._local.move_to_end(key)
+                self._stats["hits"] += 1
+                return json.loads(cached[1])
+            if cached:
+                del self._local[key]
+
+        row = self._shared_get(key)
+        with self._lock:
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["shared_hits"] += 1
+            self._put_local(key, row[0], row[1])
+        return json.loads(row[0])
+
+    def set(self, key, action):
+        if not self.enabled:
+            return
+        value = json.dumps(action)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._put_local(key, value, expires_at)
+            self._stats["stores"] += 1
+        self._shared_set(key, value, expires_at)
+
+    def _put_local(self, key, value, expires_at):
+        self._local[key] = (expires_at, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        if self._shared_ok:
+            try:
+                self._db().execute("DELETE FROM llm_cache")
+            except sqlite3.Error as e:
+                self._shared_error(e)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                enabled=self.enabled,
+                size=len(self._local),
+                max_entries=self.max_entries,
+                ttl_seconds=self.ttl,
+                hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            )
+
+
+response_cache = ResponseCache()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=response_cache._reset)
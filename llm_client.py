@@ -0,0 +1,221 @@
+"""Long-lived Gemini client, one per gunicorn worker.
+
+The model is built once with the system prompt as its ``system_instruction``
+and JSON output mode, so each request only sends the user's text and gets
+back a bare JSON object instead of prose with a fenced block in it. Token
+counts and latency are recorded for every call and exposed via ``stats()``.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import google.generativeai as genai
+
+from metrics import record_llm
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+SYSTEM_PROMPT = """You are Laku, a friendly Bruneian assistant built by Team Katalis that records sales and manages inventory for small businesses.
+
+Reply with exactly one JSON object, using one of these actions:
+- {"action": "add_sale", "items": [{"item_name": str, "quantity": int}], "currency": "BND", "message": str}
+- {"action": "remove_sale", "sale_id": int | "all", "confirmed": bool, "message": str}
+- {"action": "get_summary", "currency": "BND", "message": str}
+- {"action": "add_inventory", "item_name": str, "price": number, "quantity": int, "message": str}
+- {"action": "update_inventory", "item_id": int, "item_name": str, "price": number, "quantity": int, "message": str}
+- {"action": "remove_inventory", "item_id": int, "message": str}
+- {"action": "list_inventory", "message": str}
+- {"action": "chat", "message": str}
+
+Rules:
+- Money is a plain number, quantities are whole numbers, currency defaults to BND.
+- Put every item sold in "items"; users separate items with commas, "and" or new lines and write quantities as "2 kopi", "2x kopi", "kopi x2" or "2 of kopi".
+- Never ask for prices: they come from the inventory.
+- update_inventory only includes the fields being changed.
+- remove_sale "all" has "confirmed": true only if the user explicitly confirmed.
+- Write "message" first, in the user's language (English or Malay)."""
+
+# Older models sometimes still wrap the object in a fenced block
+JSON_BLOCK = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+def parse_reply(text):
+    """Turn a reply into an action dict.
+
+    Plain prose becomes a ``chat`` action; a reply that looks like JSON but
+    does not decode returns None.
+    """
+    text = (text or "").strip()
+    match = JSON_BLOCK.search(text)
+    body = match.group(1) if match else text
+    if not body.startswith(("{", "[")):
+        return {"action": "chat", "message": text}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+
+    if isinstance(data, dict):
+        return data
+    # A list of single-item add_sale actions is one basket
+    if data and all(isinstance(a, dict) and a.get("action") == "add_sale" for a in data):
+        items = []
+        for a in data:
+            items.extend(a.get("items") or [{"item_name": a.get("item_name"), "quantity": a.get("quantity")}])
+        return {"action": "add_sale", "items": items, "currency": data[0].get("currency", "BND")}
+    return None
+
+
+def _request_options(timeout):
+    return {"timeout": max(timeout, 1)} if timeout is not None else None
+
+
+class LLMClient:
+    def __init__(self, system_instruction=SYSTEM_PROMPT, model_name=GEMINI_MODEL):
+        self.system_instruction = system_instruction
+        self.model_name = model_name
+        # Part of the response cache key: editing the prompt or model invalidates cached parses
+        self.version = hashlib.sha256((model_name + system_instruction).encode()).hexdigest()[:12]
+        self._reset()
+
+    def _reset(self):
+        """(Re)initialise state; also run in each worker after a --preload fork."""
+        self._lock = threading.Lock()
+        self._model = None
+        self._stats = {"calls": 0, "errors": 0, "prompt_tokens": 0, "response_tokens": 0, "latency_ms": 0.0}
+        self._last = None
+
+    @property
+    def model(self):
+        # Built lazily so the gRPC channel is created inside the worker, not the master
+        with self._lock:
+            if self._model is None:
+                self._model = genai.GenerativeModel(
+                    self.model_name,
+                    system_instruction=self.system_instruction,
+                    generation_config=genai.GenerationConfig(response_mime_type="application/json"),
+                )
+            return self._model
+
+    def generate(self, user_text, timeout=None):
+        """Send ``user_text`` and return ``(reply_text, usage)``."""
+        started = time.perf_counter()
+        try:
+            response = self.model.generate_content(user_text, request_options=_request_options(timeout))
+            text = response.text
+        except Exception:
+            self._record_error(time.perf_counter() - started)
+            raise
+        usage = self._record(response, (time.perf_counter() - started) * 1000)
+        return text, usage
+
+    def stream(self, user_text, timeout=None):
+        """Send ``user_text`` with ``stream=True``; iterate the result for text chunks."""
+        return StreamedReply(self, user_text, timeout)
+
+    def _record_error(self, seconds):
+        with self._lock:
+            self._stats["errors"] += 1
+        record_llm(self.model_name, seconds, outcome="error")
+
+    def _record(self, response, latency_ms):
+        metadata = getattr(response, "usage_metadata", None)
+        usage = {
+            "prompt_tokens": getattr(metadata, "prompt_token_count", 0) or 0,
+            "response_tokens": getattr(metadata, "candidates_token_count", 0) or 0,
+            "latency_ms": round(latency_ms, 1),
+        }
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["prompt_tokens"] += usage["prompt_tokens"]
+            self._stats["response_tokens"] += usage["response_tokens"]
+            self._stats["latency_ms"] += latency_ms
+            self._last = usage
+        record_llm(self.model_name, latency_ms / 1000, usage["prompt_tokens"], usage["response_tokens"])
+        logger.info("Gemini %s: %d prompt + %d response tokens in %.0f ms",
+                    self.model_name, usage["prompt_tokens"], usage["response_tokens"], latency_ms,
+                    extra=dict(usage, model=self.model_name))
+        return usage
+
+    def stats(self):
+        with self._lock:
+            calls = self._stats["calls"]
+            return {
+                "model": self.model_name,
+                "prompt_version": self.version,
+                "calls": calls,
+                "errors": self._stats["errors"],
+                "prompt_tokens": self._stats["prompt_tokens"],
+                "response_tokens": self._stats["response_tokens"],
+                "avg_prompt_tokens": round(self._stats["prompt_tokens"] / calls, 1) if calls else 0.0,
+                "avg_response_tokens": round(self._stats["response_tokens"] / calls, 1) if calls else 0.0,
+                "avg_latency_ms": round(self._stats["latency_ms"] / calls, 1) if calls else 0.0,
+                "last_call": self._last,
+            }
+
+
+class StreamedReply:
+    """Iterable of reply text chunks; ``text`` and ``usage`` are set once it is exhausted."""
+
+    def __init__(self, client, user_text, timeout=None):
+        self.client = client
+        self.user_text = user_text
+        self.timeout = timeout
+        self.text = None
+        self.usage = None
+
+    def __iter__(self):
+        started = time.perf_counter()
+        parts = []
+        try:
+            response = self.client.model.generate_content(
+                self.user_text, stream=True, request_options=_request_options(self.timeout))
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. only safety ratings)
+                    continue
+                parts.append(text)
+                yield text
+        except Exception:
+            self.client._record_error(time.perf_counter() - started)
+            raise
+        self.text = "".join(parts)
+        self.usage = self.client._record(response, (time.perf_counter() - started) * 1000)
+
+
+class MessageExtractor:
+    """Pull the ``"message"`` string out of a JSON reply while it is still streaming."""
+
+    MESSAGE = re.compile(r'"message"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+    def __init__(self):
+        self.buffer = ""
+        self.sent = 0
+
+    def feed(self, chunk):
+        """Add a chunk and return any new message text (possibly empty)."""
+        self.buffer += chunk
+        match = self.MESSAGE.search(self.buffer)
+        if not match:
+            return ""
+        try:
+            message = json.loads('"' + match.group(1) + '"')
+        except ValueError:
+            # A \uXXXX escape split across chunks; wait for the rest
+            return ""
+        new, self.sent = message[self.sent:], max(self.sent, len(message))
+        return new
+
+
+llm = LLMClient()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=llm._reset)
@@ -0,0 +1,275 @@
+"""Admission control for Gemini calls: concurrency limit, deadline, retries, circuit breaker.
+
+Every worker lets at most ``LLM_MAX_CONCURRENCY`` Gemini calls run at once,
+so slow model calls cannot occupy every request thread and starve the fast
+endpoints. Callers wait at most ``LLM_QUEUE_TIMEOUT`` seconds for a slot.
+Each call gets ``LLM_DEADLINE`` seconds in total, including retries of
+transient errors (with full jitter). After ``LLM_BREAKER_FAILURES``
+consecutive failures the breaker opens and calls are refused immediately
+for ``LLM_BREAKER_RESET`` seconds, then a single trial call is let through.
+
+Refused or timed-out calls raise :class:`LLMUnavailable`; the assistant
+answers those with its "Gemini unavailable" reply.
+"""
+import os
+import time
+import random
+import logging
+import threading
+
+from google.api_core import exceptions as api_exceptions
+
+from llm_client import llm
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 4))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 10))    # about a slow (p95) Gemini call, so a burst queues instead of failing
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 20))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 0.5))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", 30))
+
+# Worth retrying, and counted against the breaker
+TRANSIENT_ERRORS = (
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class LLMUnavailable(Exception):
+    """Gemini was not called, or gave up, for one of the gateway's reasons."""
+
+    def __init__(self, reason, message=None):
+        super().__init__(message or reason)
+        self.reason = reason   # "circuit_open", "busy", "deadline" or "transient_error"
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Whether a call may go ahead; in half-open state only one trial call is allowed."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            if self._trial_running:
+                return False
+            self._state = self.HALF_OPEN
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Gemini circuit breaker closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("Gemini circuit breaker opened after %d failure(s)", self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """End a call that neither succeeded nor failed transiently (e.g. a bad request)."""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_seconds": self.reset_timeout,
+                "retry_in_seconds": (max(round(self.reset_timeout - (time.monotonic() - self._opened_at), 1), 0)
+                                     if state == self.OPEN else 0),
+            }
+
+
+class LLMGateway:
+    def __init__(self, client=llm, max_concurrency=LLM_MAX_CONCURRENCY, queue_timeout=LLM_QUEUE_TIMEOUT,
+                 deadline=LLM_DEADLINE, max_retries=LLM_MAX_RETRIES, retry_base_delay=LLM_RETRY_BASE_DELAY):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self._reset()
+
+    def _reset(self):
+        """(Re)initialise state; also run in each worker after a --preload fork."""
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._waiting = 0
+        self._in_flight = 0
+        self.breaker = CircuitBreaker()
+        self._stats = {"calls": 0, "retries": 0, "rejected_open": 0, "rejected_busy": 0,
+                       "deadline_exceeded": 0, "transient_errors": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def available(self):
+        """False while the breaker is open, so callers can degrade without queueing."""
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    # ---------------- Admission ----------------
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count("rejected_open")
+            raise LLMUnavailable("circuit_open", "Gemini is temporarily disabled after repeated failures")
+        with self._lock:
+            self._waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not acquired:
+            self.breaker.release()
+            self._count("rejected_busy")
+            raise LLMUnavailable("busy", "Too many Gemini requests in progress")
+        with self._lock:
+            self._in_flight += 1
+            self._stats["calls"] += 1
+
+    def _leave(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _give_up(self, error):
+        self.breaker.record_failure()
+        if isinstance(error, (api_exceptions.DeadlineExceeded, TimeoutError)):
+            self._count("deadline_exceeded")
+            raise LLMUnavailable("deadline", f"Gemini did not answer within {self.deadline:g}s") from error
+        raise LLMUnavailable("transient_error", str(error)) from error
+
+    def _backoff(self, attempt, deadline_at, error):
+        """Sleep before retry ``attempt``, or raise if out of retries or time."""
+        self._count("transient_errors")
+        delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+        if attempt >= self.max_retries or time.monotonic() + delay >= deadline_at:
+            self._give_up(error)
+        logger.info("Retrying Gemini call in %.2fs after %s", delay, error)
+        self._count("retries")
+        time.sleep(delay)
+
+    # ---------------- Calls ----------------
+    def generate(self, user_text):
+        """Gated ``llm.generate``: returns ``(reply_text, usage)`` or raises LLMUnavailable."""
+        self._admit()
+        deadline_at = time.monotonic() + self.deadline
+        try:
+            attempt = 0
+            while True:
+                try:
+                    result = self.client.generate(user_text, timeout=deadline_at - time.monotonic())
+                except TRANSIENT_ERRORS as e:
+                    self._backoff(attempt, deadline_at, e)
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                return result
+        finally:
+            # Frees a half-open trial slot if the call ended some other way
+            self.breaker.release()
+            self._leave()
+
+    def stream(self, user_text):
+        """Gated ``llm.stream``; transient errors are only retried before the first chunk."""
+        return GatedStream(self, user_text)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                breaker=self.breaker.stats(),
+                in_flight=self._in_flight,
+                queue_depth=self._waiting,
+                max_concurrency=self.max_concurrency,
+                queue_timeout_seconds=self.queue_timeout,
+                deadline_seconds=self.deadline,
+            )
+
+
+class GatedStream:
+    """Iterable of reply chunks; ``text`` and ``usage`` are set once it is exhausted."""
+
+    def __init__(self, gateway, user_text):
+        self.gateway = gateway
+        self.user_text = user_text
+        self.text = None
+        self.usage = None
+
+    def __iter__(self):
+        gateway = self.gateway
+        gateway._admit()
+        deadline_at = time.monotonic() + gateway.deadline
+        try:
+            attempt = 0
+            while True:
+                reply = gateway.client.stream(self.user_text, timeout=deadline_at - time.monotonic())
+                started = False
+                try:
+                    for chunk in reply:
+                        if time.monotonic() > deadline_at:
+                            raise TimeoutError("Gemini stream exceeded its deadline")
+                        started = True
+                        yield chunk
+                except TRANSIENT_ERRORS as e:
+                    if started:
+                        gateway._count("transient_errors")
+                        gateway._give_up(e)
+                    gateway._backoff(attempt, deadline_at, e)
+                    attempt += 1
+                    continue
+                gateway.breaker.record_success()
+                self.text, self.usage = reply.text, reply.usage
+                return
+        finally:
+            # Also runs when the client disconnects mid-stream (GeneratorExit)
+            gateway.breaker.release()
+            gateway._leave()
+
+
+gateway = LLMGateway()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=gateway._reset)
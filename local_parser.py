@@ -0,0 +1,129 @@
+"""Deterministic parser for common chat commands, used before calling Gemini.
+
+Recognises the multi-item sale formats listed in the assistant's system
+prompt::
+
+    2 nasi lemak, 1 teh tarik
+    3x kopi + 2 x roti
+    kopi x2 and teh tarik x 1
+    add 3 of kopi and 2 of roti
+    jual dua nasi lemak dan satu teh tarik
+
+plus a few one-word commands ("summary", "inventory"). Every item name must
+match the inventory exactly (ignoring case, spacing, underscores and a
+plural "s"); anything ambiguous returns ``None`` so the caller falls back to
+Gemini.
+"""
+import re
+
+from catalog import normalize_name
+
+MAX_QUANTITY = 10000
+
+NUMBER_WORDS = {
+    # English
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    # Malay
+    "se": 1, "satu": 1, "dua": 2, "tiga": 3, "empat": 4, "lima": 5,
+    "enam": 6, "tujuh": 7, "lapan": 8, "sembilan": 9, "sepuluh": 10,
+}
+
+SALE_VERBS = ("add", "added", "sold", "sell", "record", "jual", "terjual", "tambah", "tambahkan", "catat")
+POLITE_WORDS = ("please", "pls", "tolong", "sila")
+
+KEYWORD_COMMANDS = {
+    "summary": "get_summary",
+    "sales summary": "get_summary",
+    "show summary": "get_summary",
+    "ringkasan": "get_summary",
+    "ringkasan jualan": "get_summary",
+    "inventory": "list_inventory",
+    "list inventory": "list_inventory",
+    "show inventory": "list_inventory",
+    "stock": "list_inventory",
+    "inventori": "list_inventory",
+    "senarai inventori": "list_inventory",
+}
+
+_quantity = r"(?P<quantity>\d+|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+LEADING_QUANTITY = re.compile(r"^" + _quantity + r"\s*(?:x|×|pcs|biji|of)?\s+(?P<name>.+)$")
+TRAILING_QUANTITY = re.compile(r"^(?P<name>.+?)\s*[x×]\s*(?P<quantity>\d+)$")
+SEPARATORS = re.compile(r"\s*(?:,|;|\n|&|\+|\band\b|\bdan\b|\bserta\b)\s*")
+PREFIX = re.compile(r"^(?:(?:" + "|".join(POLITE_WORDS) + r")\s+)?(?:(?:" + "|".join(SALE_VERBS) + r")\s+)?")
+
+
+def _quantity_value(token):
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS.get(token)
+
+
+def _match_item(name, catalog):
+    """Resolve a written name to a catalog entry, or None if not an exact match."""
+    name = normalize_name(name.replace("_", " "))
+    candidates = [name]
+    if name.endswith("es"):
+        candidates.append(name[:-2])
+    if name.endswith("s"):
+        candidates.append(name[:-1])
+    for candidate in candidates:
+        entry = catalog.lookup(candidate)
+        if entry:
+            return entry
+    return None
+
+
+def _protect_names(text, catalog):
+    """Swap item names containing separator words (e.g. "fish and chips") for placeholders."""
+    protected = {}
+    for name in catalog.names():
+        key = normalize_name(name)
+        if SEPARATORS.search(key) and key in text:
+            token = f"item{len(protected)}\x00"
+            protected[token] = key
+            text = text.replace(key, token)
+    return text, protected
+
+
+def _parse_segment(segment, catalog, protected):
+    segment = segment.strip(" .!")
+    match = LEADING_QUANTITY.match(segment) or TRAILING_QUANTITY.match(segment)
+    if not match:
+        return None
+    quantity = _quantity_value(match.group("quantity"))
+    if not quantity or quantity > MAX_QUANTITY:
+        return None
+    name = match.group("name").strip()
+    for token, original in protected.items():
+        name = name.replace(token, original)
+    entry = _match_item(name, catalog)
+    if not entry:
+        return None
+    return {"item_name": entry["item_name"], "quantity": quantity}
+
+
+def parse_local_command(text, catalog):
+    """Return an assistant action dict for ``text``, or None to defer to Gemini."""
+    # Normalise case and spacing but keep newlines, which separate items
+    text = "\n".join(filter(None, (normalize_name(line) for line in str(text).splitlines()))).strip(" .!")
+    if not text:
+        return None
+
+    if text in KEYWORD_COMMANDS:
+        return {"action": KEYWORD_COMMANDS[text]}
+
+    text = PREFIX.sub("", text, count=1)
+    text, protected = _protect_names(text, catalog)
+    segments = [seg for seg in SEPARATORS.split(text) if seg.strip(" .!")]
+    if not segments:
+        return None
+
+    items = []
+    for segment in segments:
+        item = _parse_segment(segment, catalog, protected)
+        if item is None:
+            return None
+        items.append(item)
+
+    return {"action": "add_sale", "items": items, "currency": "BND"}
@@ -0,0 +1,166 @@
+"""Per-request instrumentation and Prometheus metrics.
+
+For every request we record wall time, the number and total time of
+database statements (reported by ``db.InstrumentedCursor``), time spent
+waiting for a pooled connection, Gemini time and tokens, and the response
+size. The totals are exported as histograms on ``/metrics``, logged as one
+structured line per request, and, with ``SERVER_TIMING=1``, returned in a
+``Server-Timing`` header.
+
+Under gunicorn, set ``PROMETHEUS_MULTIPROC_DIR`` (gunicorn.conf.py does) so
+``/metrics`` aggregates every worker rather than the one that answered.
+"""
+import os
+import time
+import logging
+
+from flask import g, request, has_app_context, Response
+from prometheus_client import (Counter, Histogram, CollectorRegistry, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+
+logger = logging.getLogger("lakuai.request")
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") not in ("0", "false", "False")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_DURATION = Histogram(
+    "lakuai_request_duration_seconds", "Wall time per request",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS)
+REQUEST_DB_QUERIES = Histogram(
+    "lakuai_request_db_queries", "Database statements executed per request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100))
+REQUEST_DB_SECONDS = Histogram(
+    "lakuai_request_db_seconds", "Total database statement time per request",
+    ["route"], buckets=LATENCY_BUCKETS)
+POOL_WAIT_SECONDS = Histogram(
+    "lakuai_pool_wait_seconds", "Time spent waiting for a pooled database connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10))
+RESPONSE_SIZE_BYTES = Histogram(
+    "lakuai_response_size_bytes", "Response body size (buffered responses only)",
+    ["route"], buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+LLM_CALL_SECONDS = Histogram(
+    "lakuai_llm_call_seconds", "Gemini call time",
+    ["model", "outcome"], buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30))
+LLM_TOKENS = Counter(
+    "lakuai_llm_tokens", "Gemini tokens used", ["model", "kind"])
+
+
+class RequestStats:
+    __slots__ = ("started", "db_queries", "db_seconds", "pool_wait_seconds",
+                 "llm_calls", "llm_seconds", "prompt_tokens", "response_tokens")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+
+
+def current():
+    """The running request's stats, or None outside a request (e.g. listener threads)."""
+    if has_app_context():
+        return g.get("request_stats")
+    return None
+
+
+# ---------------- Recording hooks ----------------
+def record_query(seconds):
+    stats = current()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_seconds += seconds
+
+
+def record_pool_wait(seconds):
+    POOL_WAIT_SECONDS.observe(seconds)
+    stats = current()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+
+def record_llm(model, seconds, prompt_tokens=0, response_tokens=0, outcome="ok"):
+    LLM_CALL_SECONDS.labels(model, outcome).observe(seconds)
+    if prompt_tokens:
+        LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+    if response_tokens:
+        LLM_TOKENS.labels(model, "response").inc(response_tokens)
+    stats = current()
+    if stats is not None:
+        stats.llm_calls += 1
+        stats.llm_seconds += seconds
+        stats.prompt_tokens += prompt_tokens
+        stats.response_tokens += response_tokens
+
+
+# ---------------- Flask integration ----------------
+def _route():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def _server_timing(stats, total):
+    parts = [f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_queries} queries"',
+             f"pool;dur={stats.pool_wait_seconds * 1000:.1f}"]
+    if stats.llm_calls:
+        parts.append(f"llm;dur={stats.llm_seconds * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def _finish(stats, route, method, status, size):
+    """Observe a finished request; for streamed bodies this runs once the stream closes."""
+    total = time.perf_counter() - stats.started
+    REQUEST_DURATION.labels(route, method, status).observe(total)
+    REQUEST_DB_QUERIES.labels(route).observe(stats.db_queries)
+    REQUEST_DB_SECONDS.labels(route).observe(stats.db_seconds)
+    if size is not None:
+        RESPONSE_SIZE_BYTES.labels(route).observe(size)
+    logger.info("%s %s %s", method, route, status, extra={
+        "route": route,
+        "method": method,
+        "status": status,
+        "duration_ms": round(total * 1000, 1),
+        "db_queries": stats.db_queries,
+        "db_ms": round(stats.db_seconds * 1000, 1),
+        "pool_wait_ms": round(stats.pool_wait_seconds * 1000, 1),
+        "llm_ms": round(stats.llm_seconds * 1000, 1),
+        "prompt_tokens": stats.prompt_tokens,
+        "response_tokens": stats.response_tokens,
+        "bytes": size,
+    })
+
+
+def metrics_response():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    """Install the per-request hooks and the ``/metrics`` route."""
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = g.get("request_stats")
+        if stats is None:
+            return response
+        route, method, status = _route(), request.method, str(response.status_code)
+        size = None if response.is_streamed else response.calculate_content_length()
+        if SERVER_TIMING:
+            # For streamed responses this only covers the work done before the first byte
+            response.headers["Server-Timing"] = _server_timing(stats, time.perf_counter() - stats.started)
+        response.call_on_close(lambda: _finish(stats, route, method, status, size))
+        return response
+
+    app.add_url_rule("/metrics", "metrics", metrics_response)
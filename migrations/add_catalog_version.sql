@@ -0,0 +1,22 @@
+-- Version counter bumped whenever the item catalog (names/prices) changes
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO catalog_version (id) VALUES (1) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1 RETURNING version INTO new_version;
+    PERFORM pg_notify('catalog_changed', new_version::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Stock-only updates (every sale) do not touch the catalog version
+DROP TRIGGER IF EXISTS storage_catalog_version ON storage;
+CREATE TRIGGER storage_catalog_version
+    AFTER INSERT OR DELETE OR UPDATE OF item_name, price ON storage
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
@@ -0,0 +1,23 @@
+-- Version counters bumped by every write to the versioned tables
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO data_versions (table_name) VALUES ('sales'), ('storage') ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_data_version ON sales;
+CREATE TRIGGER sales_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON sales
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+
+DROP TRIGGER IF EXISTS storage_data_version ON storage;
+CREATE TRIGGER storage_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON storage
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
@@ -0,0 +1,56 @@
+-- Link sales to storage by item_id. Run with psql outside a transaction
+-- (psql -f runs each statement on its own): the backfill commits every batch
+-- and the indexes are built CONCURRENTLY, so sales keep flowing meanwhile.
+-- Apply right before starting the new version (the per-item rollup is
+-- rekeyed at the end); it is safe to re-run.
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS item_id INTEGER;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'sales_item_id_fkey') THEN
+        -- NOT VALID: no full scan under lock now; validated after the backfill
+        ALTER TABLE sales ADD CONSTRAINT sales_item_id_fkey
+            FOREIGN KEY (item_id) REFERENCES storage(item_id) NOT VALID;
+    END IF;
+END $$;
+
+-- Backfill by primary-key range, 10000 rows per transaction. Old names that
+-- match no current item (renamed or deleted) keep item_id NULL.
+DO $$
+DECLARE
+    batch_start INTEGER := 0;
+    batch_size CONSTANT INTEGER := 10000;
+BEGIN
+    WHILE batch_start <= (SELECT COALESCE(MAX(id), 0) FROM sales) LOOP
+        UPDATE sales s SET item_id = st.item_id
+        FROM storage st
+        WHERE s.id >= batch_start AND s.id < batch_start + batch_size
+          AND s.item_id IS NULL
+          AND LOWER(st.item_name) = LOWER(s.item_name);
+        batch_start := batch_start + batch_size;
+        COMMIT;
+    END LOOP;
+END $$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sales_item_id_created_at ON sales(item_id, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sales_unlinked_item_name ON sales(LOWER(item_name)) WHERE item_id IS NULL;
+
+ALTER TABLE sales VALIDATE CONSTRAINT sales_item_id_fkey;
+
+-- Per-item totals are keyed by item_id, so renames keep their history
+BEGIN;
+LOCK TABLE sales IN SHARE MODE;
+DROP TABLE IF EXISTS sales_item_rollup;
+CREATE TABLE sales_item_rollup (
+    item_id INTEGER PRIMARY KEY,
+    order_count BIGINT NOT NULL DEFAULT 0,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    last_sale_id INTEGER
+);
+INSERT INTO sales_item_rollup (item_id, order_count, quantity, revenue, last_sale_id)
+SELECT item_id, COUNT(*), SUM(quantity), SUM(quantity * price), MAX(id)
+FROM sales
+WHERE item_id IS NOT NULL
+GROUP BY item_id;
+COMMIT;
@@ -0,0 +1,53 @@
+-- Running totals and per-item / per-hour rollups maintained by every sale writer
+CREATE TABLE IF NOT EXISTS sales_totals (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    order_count BIGINT NOT NULL DEFAULT 0,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0
+);
+INSERT INTO sales_totals (id) VALUES (1) ON CONFLICT DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS sales_item_rollup (
+    item_name TEXT PRIMARY KEY,
+    order_count BIGINT NOT NULL DEFAULT 0,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    last_sale_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS sales_hourly_rollup (
+    hour SMALLINT PRIMARY KEY CHECK (hour BETWEEN 0 AND 23),
+    order_count BIGINT NOT NULL DEFAULT 0,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0
+);
+
+-- Backfill from existing sales (same as `python rollups.py rebuild`)
+BEGIN;
+LOCK TABLE sales IN SHARE MODE;
+
+UPDATE sales_totals t SET
+    order_count = s.order_count,
+    quantity = s.quantity,
+    revenue = s.revenue
+FROM (
+    SELECT COUNT(*) AS order_count,
+           COALESCE(SUM(quantity), 0) AS quantity,
+           COALESCE(SUM(quantity * price), 0) AS revenue
+    FROM sales
+) s
+WHERE t.id = 1;
+
+DELETE FROM sales_item_rollup;
+INSERT INTO sales_item_rollup (item_name, order_count, quantity, revenue, last_sale_id)
+SELECT item_name, COUNT(*), SUM(quantity), SUM(quantity * price), MAX(id)
+FROM sales
+GROUP BY item_name;
+
+DELETE FROM sales_hourly_rollup;
+INSERT INTO sales_hourly_rollup (hour, order_count, quantity, revenue)
+SELECT EXTRACT(HOUR FROM created_at)::int, COUNT(*), SUM(quantity), SUM(quantity * price)
+FROM sales
+WHERE created_at IS NOT NULL
+GROUP BY 1;
+COMMIT;
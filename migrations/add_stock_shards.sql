@@ -0,0 +1,42 @@
+-- Opt-in sharded stock counters for hot items (see stock_shards.py)
+ALTER TABLE storage ADD COLUMN IF NOT EXISTS stock_shards SMALLINT NOT NULL DEFAULT 0;
+
+-- Bumps the version of the trigger's table, or of the table named in its argument
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE table_name = COALESCE(TG_ARGV[0], TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Per-item stock shards; the item's stock is storage.quantity plus these
+CREATE TABLE IF NOT EXISTS storage_shards (
+    item_id INTEGER NOT NULL REFERENCES storage(item_id) ON DELETE CASCADE,
+    shard SMALLINT NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0 CHECK (quantity >= 0),
+    PRIMARY KEY (item_id, shard)
+);
+
+-- Storage rows with the total stock (reserve plus shards)
+CREATE OR REPLACE VIEW storage_stock AS
+SELECT s.item_id, s.item_name,
+       s.quantity + COALESCE(sh.quantity, 0) AS quantity,
+       s.price, s.created_at, s.updated_at, s.stock_shards
+FROM storage s
+LEFT JOIN (
+    SELECT item_id, SUM(quantity)::integer AS quantity
+    FROM storage_shards
+    GROUP BY item_id
+) sh ON sh.item_id = s.item_id;
+
+-- Shard writes change the item's stock, so they count as storage writes
+DROP TRIGGER IF EXISTS storage_shards_data_version ON storage_shards;
+CREATE TRIGGER storage_shards_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON storage_shards
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('storage');
+
+-- Turning sharding on or off changes how the catalog takes stock
+DROP TRIGGER IF EXISTS storage_catalog_version ON storage;
+CREATE TRIGGER storage_catalog_version
+    AFTER INSERT OR DELETE OR UPDATE OF item_name, price, stock_shards ON storage
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
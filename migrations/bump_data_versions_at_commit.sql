@@ -0,0 +1,73 @@
+-- Bump data_versions once per transaction at commit instead of in every
+-- statement, so sales of different items no longer queue or deadlock on the
+-- version rows (apply after add_data_versions.sql)
+
+-- Bumps the version of the trigger's table, or of the table named in its
+-- argument, straight away (TRUNCATE, which takes the table's strongest lock anyway)
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE table_name = COALESCE(TG_ARGV[0], TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Notes that this transaction changes the version of the trigger's table (or
+-- of the table in its argument); takes no lock
+CREATE OR REPLACE FUNCTION mark_data_version() RETURNS trigger AS $$
+DECLARE
+    marked TEXT := COALESCE(current_setting('lakuai.data_versions', true), '');
+    name TEXT := COALESCE(TG_ARGV[0], TG_TABLE_NAME);
+BEGIN
+    IF NOT name = ANY(string_to_array(marked, ',')) THEN
+        PERFORM set_config('lakuai.data_versions', concat_ws(',', NULLIF(marked, ''), name), true);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Deferred to commit: bumps every version the transaction marked, once, in
+-- table_name order. The version rows are locked after all of the
+-- transaction's other locks and only until it commits, so writers of
+-- different rows never deadlock or queue on them mid-transaction.
+CREATE OR REPLACE FUNCTION bump_marked_data_versions() RETURNS trigger AS $$
+DECLARE
+    marked TEXT := NULLIF(current_setting('lakuai.data_versions', true), '');
+    name TEXT;
+BEGIN
+    IF marked IS NOT NULL THEN
+        PERFORM set_config('lakuai.data_versions', '', true);
+        FOREACH name IN ARRAY (SELECT array_agg(t ORDER BY t) FROM unnest(string_to_array(marked, ',')) t) LOOP
+            UPDATE data_versions SET version = version + 1 WHERE table_name = name;
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_data_version ON sales;
+CREATE TRIGGER sales_data_version
+    AFTER INSERT OR UPDATE OR DELETE ON sales
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_data_version('sales');
+DROP TRIGGER IF EXISTS sales_data_version_commit ON sales;
+CREATE CONSTRAINT TRIGGER sales_data_version_commit
+    AFTER INSERT OR UPDATE OR DELETE ON sales
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION bump_marked_data_versions();
+DROP TRIGGER IF EXISTS sales_data_version_truncate ON sales;
+CREATE TRIGGER sales_data_version_truncate
+    AFTER TRUNCATE ON sales
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('sales');
+
+DROP TRIGGER IF EXISTS storage_data_version ON storage;
+CREATE TRIGGER storage_data_version
+    AFTER INSERT OR UPDATE OR DELETE ON storage
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_data_version('storage');
+DROP TRIGGER IF EXISTS storage_data_version_commit ON storage;
+CREATE CONSTRAINT TRIGGER storage_data_version_commit
+    AFTER INSERT OR UPDATE OR DELETE ON storage
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION bump_marked_data_versions();
+DROP TRIGGER IF EXISTS storage_data_version_truncate ON storage;
+CREATE TRIGGER storage_data_version_truncate
+    AFTER TRUNCATE ON storage
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('storage');
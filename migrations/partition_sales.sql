@@ -0,0 +1,114 @@
+-- Convert sales into monthly range partitions on created_at (see partitions.py).
+-- Needs PostgreSQL 12+. Stop the app first: the rows are copied into the new
+-- table under an exclusive lock, in one transaction.
+BEGIN;
+LOCK TABLE sales IN ACCESS EXCLUSIVE MODE;
+
+ALTER TABLE sales RENAME TO sales_unpartitioned;
+ALTER TABLE sales_unpartitioned DROP CONSTRAINT IF EXISTS sales_pkey;
+ALTER TABLE sales_unpartitioned DROP CONSTRAINT IF EXISTS sales_item_id_fkey;
+DROP INDEX IF EXISTS idx_sales_created_at;
+DROP INDEX IF EXISTS idx_sales_item_id_created_at;
+DROP INDEX IF EXISTS idx_sales_unlinked_item_name;
+DROP TRIGGER IF EXISTS sales_data_version ON sales_unpartitioned;
+
+CREATE TABLE sales (
+    id INTEGER NOT NULL DEFAULT nextval('sales_id_seq'),
+    item_id INTEGER REFERENCES storage(item_id),
+    item_name TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    price NUMERIC(10, 2) NOT NULL,
+    total_price NUMERIC(10, 2) GENERATED ALWAYS AS (quantity * price) STORED,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+ALTER SEQUENCE sales_id_seq OWNED BY sales.id;
+
+CREATE INDEX idx_sales_created_at ON sales(created_at);
+CREATE INDEX idx_sales_item_id_created_at ON sales(item_id, created_at);
+CREATE INDEX idx_sales_unlinked_item_name ON sales(LOWER(item_name)) WHERE item_id IS NULL;
+
+-- Catch-all for sales outside every monthly partition (moved out when their month is created)
+CREATE TABLE sales_default PARTITION OF sales DEFAULT;
+
+-- Creates the partition for the month starting at month_start, moving any
+-- of its rows out of sales_default first
+CREATE OR REPLACE FUNCTION create_sales_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT := 'sales_' || to_char(month_start, 'YYYY_MM');
+    month_end DATE := (month_start + INTERVAL '1 month')::date;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+    PERFORM pg_advisory_xact_lock(hashtext('sales_partitions'));
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM sales_default WHERE created_at >= month_start AND created_at < month_end) THEN
+        EXECUTE format('CREATE TABLE %I (LIKE sales INCLUDING DEFAULTS INCLUDING GENERATED)', partition_name);
+        EXECUTE format($move$
+            WITH moved AS (
+                DELETE FROM sales_default
+                WHERE created_at >= %L AND created_at < %L
+                RETURNING id, item_id, item_name, quantity, price, created_at, updated_at
+            )
+            INSERT INTO %I (id, item_id, item_name, quantity, price, created_at, updated_at)
+            SELECT * FROM moved
+        $move$, month_start, month_end, partition_name);
+        EXECUTE format('ALTER TABLE sales ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, month_start, month_end);
+    ELSE
+        EXECUTE format('CREATE TABLE %I PARTITION OF sales FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, month_start, month_end);
+    END IF;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Every month with sales, through three months from now
+SELECT create_sales_partition(m::date)
+FROM generate_series(
+    date_trunc('month', COALESCE((SELECT MIN(created_at) FROM sales_unpartitioned), now())),
+    date_trunc('month', now()) + INTERVAL '3 months',
+    INTERVAL '1 month'
+) m;
+
+INSERT INTO sales (id, item_id, item_name, quantity, price, created_at, updated_at)
+SELECT id, item_id, item_name, quantity, price,
+       COALESCE(created_at, updated_at, CURRENT_TIMESTAMP), updated_at
+FROM sales_unpartitioned;
+DROP TABLE sales_unpartitioned;
+
+-- The data-version triggers left with the old table. They are the same three
+-- as in data_versions.py: writes mark the table and it is bumped once at
+-- commit, so sales never queue on the version row mid-transaction. On a
+-- database without bump_data_versions_at_commit.sql yet, that migration
+-- creates them.
+DO $$
+BEGIN
+    IF to_regproc('mark_data_version') IS NOT NULL AND to_regproc('bump_marked_data_versions') IS NOT NULL THEN
+        CREATE TRIGGER sales_data_version
+            AFTER INSERT OR UPDATE OR DELETE ON sales
+            FOR EACH STATEMENT EXECUTE FUNCTION mark_data_version('sales');
+        CREATE CONSTRAINT TRIGGER sales_data_version_commit
+            AFTER INSERT OR UPDATE OR DELETE ON sales
+            DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW EXECUTE FUNCTION bump_marked_data_versions();
+        CREATE TRIGGER sales_data_version_truncate
+            AFTER TRUNCATE ON sales
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('sales');
+    END IF;
+END $$;
+
+-- Sales that had no created_at now have one; recount the hourly rollup
+DELETE FROM sales_hourly_rollup;
+INSERT INTO sales_hourly_rollup (hour, order_count, quantity, revenue)
+SELECT EXTRACT(HOUR FROM created_at)::int, COUNT(*), SUM(quantity), SUM(quantity * price)
+FROM sales
+GROUP BY 1;
+
+COMMIT;
+ANALYZE sales;
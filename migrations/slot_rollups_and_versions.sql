@@ -0,0 +1,76 @@
+-- Split data_versions and the sales rollups into slot rows that concurrent
+-- transactions update at random, and bump stock shard versions at commit.
+-- Apply after bump_data_versions_at_commit.sql (and add_stock_shards.sql).
+BEGIN;
+
+ALTER TABLE data_versions ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE data_versions DROP CONSTRAINT IF EXISTS data_versions_pkey;
+ALTER TABLE data_versions ADD PRIMARY KEY (table_name, slot);
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'sales_totals' AND column_name = 'id') THEN
+        ALTER TABLE sales_totals DROP CONSTRAINT IF EXISTS sales_totals_id_check;
+        ALTER TABLE sales_totals ALTER COLUMN id DROP DEFAULT;
+        ALTER TABLE sales_totals RENAME COLUMN id TO slot;
+    END IF;
+END;
+$$;
+
+ALTER TABLE sales_item_rollup ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE sales_item_rollup DROP CONSTRAINT IF EXISTS sales_item_rollup_pkey;
+ALTER TABLE sales_item_rollup ADD PRIMARY KEY (item_id, slot);
+
+ALTER TABLE sales_hourly_rollup ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE sales_hourly_rollup DROP CONSTRAINT IF EXISTS sales_hourly_rollup_pkey;
+ALTER TABLE sales_hourly_rollup ADD PRIMARY KEY (hour, slot);
+
+-- Bumps the version of the trigger's table, or of the table named in its
+-- argument, straight away (TRUNCATE, which takes the table's strongest lock anyway)
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE data_versions SET version = version + 1
+    WHERE table_name = COALESCE(TG_ARGV[0], TG_TABLE_NAME) AND slot = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Deferred to commit: bumps every version the transaction marked, once, in
+-- table_name order, each in the same random one of 16 slots. The version
+-- rows are locked after all of the transaction's other locks and only until
+-- it commits, so writers never deadlock or queue on them mid-transaction.
+CREATE OR REPLACE FUNCTION bump_marked_data_versions() RETURNS trigger AS $$
+DECLARE
+    marked TEXT := NULLIF(current_setting('lakuai.data_versions', true), '');
+    picked_slot SMALLINT := floor(random() * 16);
+    name TEXT;
+BEGIN
+    IF marked IS NOT NULL THEN
+        PERFORM set_config('lakuai.data_versions', '', true);
+        FOREACH name IN ARRAY (SELECT array_agg(t ORDER BY t) FROM unnest(string_to_array(marked, ',')) t) LOOP
+            INSERT INTO data_versions AS v (table_name, slot, version) VALUES (name, picked_slot, 1)
+            ON CONFLICT (table_name, slot) DO UPDATE SET version = v.version + 1;
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Shard writes change the item's stock, so they count as storage writes
+-- (bumped at commit, see data_versions.py)
+DROP TRIGGER IF EXISTS storage_shards_data_version ON storage_shards;
+CREATE TRIGGER storage_shards_data_version
+    AFTER INSERT OR UPDATE OR DELETE ON storage_shards
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_data_version('storage');
+DROP TRIGGER IF EXISTS storage_shards_data_version_commit ON storage_shards;
+CREATE CONSTRAINT TRIGGER storage_shards_data_version_commit
+    AFTER INSERT OR UPDATE OR DELETE ON storage_shards
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION bump_marked_data_versions();
+DROP TRIGGER IF EXISTS storage_shards_data_version_truncate ON storage_shards;
+CREATE TRIGGER storage_shards_data_version_truncate
+    AFTER TRUNCATE ON storage_shards
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('storage');
+
+COMMIT;
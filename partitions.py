@@ -0,0 +1,318 @@
+"""Monthly partitions of the sales table: creation ahead of time, retention and archival.
+
+``sales`` is range-partitioned on ``created_at``, one partition per month
+(``sales_YYYY_MM``) plus ``sales_default`` for rows outside all of them, so
+"today" and "this month" queries only scan the current partition. Each
+worker's :class:`PartitionMaintainer` creates the coming months'
+partitions and applies the retention policy; an advisory lock lets one
+worker at a time do it.
+
+Old months leave the table whole: ``archive`` writes a partition to
+``SALES_ARCHIVE_DIR/sales_YYYY_MM.csv.gz`` while it is still attached,
+then detaches and drops it, ``purge`` just drops it. The detach, which
+locks the whole sales table, is left for a short transaction of its own
+that also reduces the rollups by the partition's aggregates, so no row
+is deleted one at a time.
+
+    python partitions.py list
+    python partitions.py maintain                # create coming months, apply retention
+    python partitions.py archive --before 2024-01
+    python partitions.py purge --before 2024-01
+"""
+import os
+import re
+import sys
+import gzip
+import time
+import logging
+import argparse
+import threading
+from datetime import date
+
+import live
+import rollups
+from db import open_connection
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS_AHEAD = int(os.getenv("SALES_PARTITIONS_AHEAD", 3))               # months created past the current one
+RETENTION_MONTHS = int(os.getenv("SALES_RETENTION_MONTHS", 0))               # whole months kept before this one; 0 keeps all
+ARCHIVE_DIR = os.getenv("SALES_ARCHIVE_DIR", "archive")
+CHECK_INTERVAL = float(os.getenv("SALES_PARTITION_CHECK_INTERVAL", 3600))    # seconds between maintenance runs; 0 disables
+ARCHIVE_ATTEMPTS = 3    # copies of a month that changed while it was being copied
+
+PARTITION_NAME = re.compile(r"^sales_(\d{4})_(\d{2})$")
+MAINTENANCE_LOCK = "sales_partitions_maintenance"
+
+SALES_PARTITIONS_SQL = """
+-- Catch-all for sales outside every monthly partition (moved out when their month is created)
+CREATE TABLE IF NOT EXISTS sales_default PARTITION OF sales DEFAULT;
+
+-- Creates the partition for the month starting at month_start, moving any
+-- of its rows out of sales_default first
+CREATE OR REPLACE FUNCTION create_sales_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT := 'sales_' || to_char(month_start, 'YYYY_MM');
+    month_end DATE := (month_start + INTERVAL '1 month')::date;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+    PERFORM pg_advisory_xact_lock(hashtext('sales_partitions'));
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM sales_default WHERE created_at >= month_start AND created_at < month_end) THEN
+        EXECUTE format('CREATE TABLE %I (LIKE sales INCLUDING DEFAULTS INCLUDING GENERATED)', partition_name);
+        EXECUTE format($move$
+            WITH moved AS (
+                DELETE FROM sales_default
+                WHERE created_at >= %L AND created_at < %L
+                RETURNING id, item_id, item_name, quantity, price, created_at, updated_at
+            )
+            INSERT INTO %I (id, item_id, item_name, quantity, price, created_at, updated_at)
+            SELECT * FROM moved
+        $move$, month_start, month_end, partition_name);
+        EXECUTE format('ALTER TABLE sales ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, month_start, month_end);
+    ELSE
+        EXECUTE format('CREATE TABLE %I PARTITION OF sales FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, month_start, month_end);
+    END IF;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_partitions(cur, months=None):
+    """Create the partitions for ``months`` (any dates in them); by default this month and the next PARTITIONS_AHEAD."""
+    if months is None:
+        this_month = month_start(date.today())
+        months = [add_months(this_month, n) for n in range(PARTITIONS_AHEAD + 1)]
+    months = sorted({month_start(month) for month in months})
+    if months:
+        cur.execute("SELECT create_sales_partition(m) FROM unnest(%s::date[]) m", (months,))
+
+
+def list_partitions(cur):
+    """Every partition of ``sales`` with its month (None for the default) and approximate size."""
+    cur.execute("""
+        SELECT c.relname AS name,
+               GREATEST(c.reltuples, 0)::bigint AS approx_rows,
+               pg_total_relation_size(c.oid) AS bytes
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'sales'::regclass
+        ORDER BY c.relname
+    """)
+    partitions = cur.fetchall()
+    for partition in partitions:
+        match = PARTITION_NAME.match(partition["name"])
+        partition["month"] = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+    return partitions
+
+
+def partitions_before(cur, before):
+    """Names of the monthly partitions that end on or before the month of ``before``, oldest first."""
+    cutoff = month_start(before)
+    return [p["name"] for p in list_partitions(cur) if p["month"] is not None and p["month"] < cutoff]
+
+
+def _check_name(name):
+    if not PARTITION_NAME.match(name):
+        raise ValueError(f"'{name}' is not a monthly sales partition")
+
+
+def _detach(cur, name):
+    _check_name(name)
+    cur.execute(f'ALTER TABLE sales DETACH PARTITION "{name}"')
+
+
+def _fingerprint(cur, name):
+    cur.execute(f'SELECT COUNT(*) AS count, COALESCE(SUM(id), 0) AS id_sum FROM "{name}"')
+    return cur.fetchone()
+
+
+def _drop(cur, name):
+    cur.execute(f'DROP TABLE "{name}"')
+    # Detaching and dropping fire no triggers on sales
+    cur.execute("UPDATE data_versions SET version = version + 1 WHERE table_name = 'sales' AND slot = 0")
+    live.publish_refresh(cur, "sales")
+
+
+def archive_partition(conn, name, directory=ARCHIVE_DIR):
+    """Write a month to ``directory/<name>.csv.gz``, then detach and drop it; returns the file path.
+
+    Commits twice, so call it with no transaction open. The copy runs in
+    a REPEATABLE READ transaction while the partition is still attached,
+    and sales keep flowing. The detach, the rollup subtraction and the drop
+    follow in a short transaction, which starts over with a fresh copy if
+    the month's rows changed in between (a deleted sale, say).
+    """
+    _check_name(name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    with conn.cursor() as cur:
+        for _ in range(ARCHIVE_ATTEMPTS):
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            copied = _fingerprint(cur, name)
+            with gzip.open(path + ".partial", "wt", encoding="utf-8", newline="") as out:
+                cur.copy_expert(f'COPY (SELECT * FROM "{name}" ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)', out)
+            conn.commit()
+
+            _detach(cur, name)
+            if _fingerprint(cur, name) != copied:
+                conn.rollback()
+                continue
+            os.replace(path + ".partial", path)
+            rollups.subtract(cur, name)
+            _drop(cur, name)
+            conn.commit()
+            return path
+    raise RuntimeError(f"{name} kept changing while it was being archived; try again later")
+
+
+def purge_partition(cur, name):
+    """Drop a month's sales without keeping a copy."""
+    _detach(cur, name)
+    rollups.subtract(cur, name)
+    _drop(cur, name)
+
+
+def apply_retention(conn, months=RETENTION_MONTHS, directory=ARCHIVE_DIR):
+    """Archive every month older than ``months`` whole months (0 keeps everything), one at a time."""
+    if not months:
+        return []
+    cutoff = add_months(month_start(date.today()), -months)
+    with conn.cursor() as cur:
+        names = partitions_before(cur, cutoff)
+    conn.commit()
+    archived = []
+    for name in names:
+        archived.append(archive_partition(conn, name, directory))
+        logger.info("Archived %s to %s", name, archived[-1])
+    return archived
+
+
+class PartitionMaintainer:
+    """Runs :func:`ensure_partitions` and :func:`apply_retention` every ``interval`` seconds in this worker."""
+
+    def __init__(self, interval=CHECK_INTERVAL):
+        self.interval = interval
+        self._reset()
+
+    def _reset(self):
+        """Forget the thread; also run in each worker after a --preload fork."""
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {"runs": 0, "skipped": 0, "errors": 0, "archived": 0,
+                       "last_run": None, "last_error": None}
+
+    def ensure_started(self):
+        if not self.interval or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sales-partitions", daemon=True)
+                self._thread.start()
+
+    def run_once(self):
+        """One maintenance pass; returns False if another worker holds the maintenance lock."""
+        conn = open_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(hashtext(%s)) AS locked", (MAINTENANCE_LOCK,))
+                if not cur.fetchone()["locked"]:
+                    conn.rollback()
+                    self._stats["skipped"] += 1
+                    return False
+                try:
+                    ensure_partitions(cur)
+                    conn.commit()
+                    archived = apply_retention(conn)
+                finally:
+                    conn.rollback()
+                    cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (MAINTENANCE_LOCK,))
+                    conn.commit()
+        finally:
+            conn.close()
+        self._stats["runs"] += 1
+        self._stats["archived"] += len(archived)
+        self._stats["last_run"] = time.time()
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self._stats["errors"] += 1
+                self._stats["last_error"] = str(e)
+                logger.warning("Sales partition maintenance failed: %s", e)
+            time.sleep(self.interval)
+
+    def stats(self):
+        return dict(self._stats, interval=self.interval, retention_months=RETENTION_MONTHS,
+                    archive_dir=ARCHIVE_DIR if RETENTION_MONTHS else None)
+
+
+maintainer = PartitionMaintainer()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=maintainer._reset)
+
+
+def _month(value):
+    try:
+        return date.fromisoformat(value + "-01" if len(value) == 7 else value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid month '{value}'. Use YYYY-MM.")
+
+
+if __name__ == "__main__":
+    from db import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Manage the monthly partitions of the sales table")
+    parser.add_argument("command", choices=("list", "maintain", "archive", "purge"))
+    parser.add_argument("--before", type=_month, help="archive/purge months before this one (YYYY-MM)")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="archive directory")
+    args = parser.parse_args()
+    if args.command in ("archive", "purge") and args.before is None:
+        parser.error(f"{args.command} needs --before YYYY-MM")
+
+    if args.command == "maintain":
+        if not maintainer.run_once():
+            print("❌ Another worker is maintaining the partitions right now")
+            sys.exit(1)
+        print(f"✅ Partitions ready through {add_months(month_start(date.today()), PARTITIONS_AHEAD):%Y-%m}")
+        sys.exit(0)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if args.command == "list":
+                for partition in list_partitions(cur):
+                    print(f"{partition['name']:<16} ~{partition['approx_rows']:>10} rows "
+                          f"{partition['bytes'] / 1024 / 1024:>9.1f} MB")
+            else:
+                names = partitions_before(cur, args.before)
+                conn.commit()
+                if not names:
+                    print(f"Nothing before {args.before:%Y-%m}")
+                for name in names:
+                    if args.command == "archive":
+                        print(f"✅ {name} -> {archive_partition(conn, name, args.dir)}")
+                    else:
+                        purge_partition(cur, name)
+                        print(f"✅ Dropped {name}")
+                    conn.commit()
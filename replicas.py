@@ -0,0 +1,66 @@
+"""Per-request read routing to the replicas in ``DATABASE_REPLICA_URLS``.
+
+Read-only views borrow :func:`read_connection` instead of
+``get_db_connection``. After a session's successful write request the
+primary's WAL position is stored in its session, and that session's reads
+only go to a replica that has replayed at least that far (otherwise to the
+primary), so a cashier always sees their own sale. Streamed responses
+write after the response has started, too late to read the position, so
+they pin the session to the primary for ``DB_REPLICA_STICKY_SECONDS``
+instead.
+
+Within one request every read goes to the same target. A view therefore
+never reads older data than the ETag that :func:`data_versions.conditional`
+computed earlier in the same request.
+"""
+import os
+import time
+import logging
+from contextlib import contextmanager
+
+from flask import g, request, session, has_request_context
+
+from db import PRIMARY, REPLICA_URLS, get_read_connection, current_wal_lsn
+
+logger = logging.getLogger(__name__)
+
+STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", 5))
+
+SESSION_LSN = "db_lsn"
+SESSION_PRIMARY_UNTIL = "db_primary_until"
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+@contextmanager
+def read_connection():
+    """Borrow a connection for read-only work: a replica when it is safe, else the primary."""
+    min_lsn = prefer = None
+    if has_request_context():
+        min_lsn = session.get(SESSION_LSN)
+        prefer = g.get("read_target")
+        if prefer is None and session.get(SESSION_PRIMARY_UNTIL, 0) > time.time():
+            prefer = PRIMARY
+    with get_read_connection(min_lsn, prefer) as (conn, target):
+        if has_request_context():
+            g.read_target = target
+        yield conn
+
+
+def init_app(app):
+    if not REPLICA_URLS:
+        return
+
+    @app.after_request
+    def remember_write_position(response):
+        if request.method in READ_ONLY_METHODS or response.status_code >= 400:
+            return response
+        if response.is_streamed:
+            session[SESSION_PRIMARY_UNTIL] = time.time() + STICKY_SECONDS
+            return response
+        try:
+            session[SESSION_LSN] = current_wal_lsn()
+        except Exception as e:
+            # Without a position the session's next reads may briefly lag
+            logger.warning("Could not read the primary's WAL position: %s", e)
+            session[SESSION_PRIMARY_UNTIL] = time.time() + STICKY_SECONDS
+        return response
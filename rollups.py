@@ -0,0 +1,379 @@
+"""Incrementally maintained sales rollups.
+
+Every writer to ``sales`` calls ``apply_sales`` in the same transaction, so
+the totals, per-item and per-hour tables always agree with the raw rows and
+the dashboard summary can be read from O(items) rows instead of a full scan.
+
+Each rollup row is split into ``SALES_ROLLUP_SLOTS`` slot rows and a
+transaction adds to one slot picked at random, so concurrent sales (even of
+the same item, in the same hour) rarely wait for each other's rollup rows.
+Readers sum over the slots; a key whose slots sum to zero counts as absent.
+
+Run ``python rollups.py verify`` to check for drift and
+``python rollups.py rebuild`` to recompute everything from ``sales``.
+"""
+import os
+import sys
+import random
+from decimal import Decimal
+
+from psycopg2.extras import execute_values
+
+from analytics import empty_summary
+
+ROLLUP_SLOTS = int(os.getenv("SALES_ROLLUP_SLOTS", 16))
+
+ROLLUP_TABLES_SQL = """
+-- Running totals over all sales (summed over the slot rows)
+CREATE TABLE IF NOT EXISTS sales_totals (
+    slot SMALLINT PRIMARY KEY,
+    order_count BIGINT NOT NULL DEFAULT 0,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0
+);
+
+-- Per-item totals (sales without an item_id are summed from sales directly)
+CREATE TABLE IF NOT EXISTS sales_item_rollup (
+    item_id INTEGER NOT NULL,
+    slot SMALLINT NOT NULL DEFAULT 0,
+    order_count BIGINT NOT NULL DEFAULT 0,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    last_sale_id INTEGER,
+    PRIMARY KEY (item_id, slot)
+);
+
+-- Per-hour-of-day totals
+CREATE TABLE IF NOT EXISTS sales_hourly_rollup (
+    hour SMALLINT NOT NULL CHECK (hour BETWEEN 0 AND 23),
+    slot SMALLINT NOT NULL DEFAULT 0,
+    order_count BIGINT NOT NULL DEFAULT 0,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, slot)
+);
+"""
+
+REBUILD_SQL = """
+DELETE FROM sales_totals;
+INSERT INTO sales_totals (slot, order_count, quantity, revenue)
+SELECT 0, COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(quantity * price), 0)
+FROM sales;
+
+DELETE FROM sales_item_rollup;
+INSERT INTO sales_item_rollup (item_id, order_count, quantity, revenue, last_sale_id)
+SELECT item_id, COUNT(*), SUM(quantity), SUM(quantity * price), MAX(id)
+FROM sales
+WHERE item_id IS NOT NULL
+GROUP BY item_id;
+
+DELETE FROM sales_hourly_rollup;
+INSERT INTO sales_hourly_rollup (hour, order_count, quantity, revenue)
+SELECT EXTRACT(HOUR FROM created_at)::int, COUNT(*), SUM(quantity), SUM(quantity * price)
+FROM sales
+WHERE created_at IS NOT NULL
+GROUP BY 1;
+"""
+
+
+def apply_sales(cur, sales, sign=1):
+    """Add (``sign=1``) or remove (``sign=-1``) sale rows from the rollups.
+
+    ``sales`` are rows as returned by ``INSERT/DELETE ... RETURNING *``.
+    Everything goes to one random slot. Groups are written in sorted key
+    order, so writers that pick the same slot lock its rows in the same
+    order.
+    """
+    if not sales:
+        return
+
+    slot = random.randrange(ROLLUP_SLOTS)
+    order_count = 0
+    quantity = 0
+    revenue = Decimal(0)
+    by_item = {}
+    by_hour = {}
+    for sale in sales:
+        line_revenue = sale['quantity'] * Decimal(sale['price'])
+        order_count += 1
+        quantity += sale['quantity']
+        revenue += line_revenue
+
+        if sale.get('item_id') is not None:
+            item = by_item.setdefault(sale['item_id'], [0, 0, Decimal(0), None])
+            item[0] += 1
+            item[1] += sale['quantity']
+            item[2] += line_revenue
+            if sign > 0:
+                item[3] = max(item[3] or 0, sale['id'])
+
+        if sale.get('created_at') is not None:
+            hour = by_hour.setdefault(sale['created_at'].hour, [0, 0, Decimal(0)])
+            hour[0] += 1
+            hour[1] += sale['quantity']
+            hour[2] += line_revenue
+
+    if by_item:
+        execute_values(cur, """
+            INSERT INTO sales_item_rollup (item_id, slot, order_count, quantity, revenue, last_sale_id)
+            VALUES %s
+            ON CONFLICT (item_id, slot) DO UPDATE SET
+                order_count = sales_item_rollup.order_count + EXCLUDED.order_count,
+                quantity = sales_item_rollup.quantity + EXCLUDED.quantity,
+                revenue = sales_item_rollup.revenue + EXCLUDED.revenue,
+                last_sale_id = GREATEST(sales_item_rollup.last_sale_id, EXCLUDED.last_sale_id)
+        """, [(item_id, slot, sign * c, sign * q, sign * r, last_id)
+              for item_id, (c, q, r, last_id) in sorted(by_item.items())])
+
+    if by_hour:
+        execute_values(cur, """
+            INSERT INTO sales_hourly_rollup (hour, slot, order_count, quantity, revenue)
+            VALUES %s
+            ON CONFLICT (hour, slot) DO UPDATE SET
+                order_count = sales_hourly_rollup.order_count + EXCLUDED.order_count,
+                quantity = sales_hourly_rollup.quantity + EXCLUDED.quantity,
+                revenue = sales_hourly_rollup.revenue + EXCLUDED.revenue
+        """, [(hour, slot, sign * c, sign * q, sign * r) for hour, (c, q, r) in sorted(by_hour.items())])
+
+    # The totals row is the most contended, so it is touched last.
+    cur.execute("""
+        INSERT INTO sales_totals (slot, order_count, quantity, revenue)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (slot) DO UPDATE SET
+            order_count = sales_totals.order_count + EXCLUDED.order_count,
+            quantity = sales_totals.quantity + EXCLUDED.quantity,
+            revenue = sales_totals.revenue + EXCLUDED.revenue
+    """, (slot, sign * order_count, sign * quantity, sign * revenue))
+
+
+def subtract(cur, table):
+    """Remove every sale in ``table`` (e.g. a detached partition) from the rollups, set-based.
+
+    The negated aggregates go to slot 0, in sorted key order like
+    ``apply_sales``. ``last_sale_id`` is left alone; it only breaks ties.
+    """
+    cur.execute(f"""
+        INSERT INTO sales_item_rollup (item_id, slot, order_count, quantity, revenue)
+        SELECT item_id, 0, -COUNT(*), -SUM(quantity), -SUM(quantity * price)
+        FROM "{table}"
+        WHERE item_id IS NOT NULL
+        GROUP BY item_id
+        ORDER BY item_id
+        ON CONFLICT (item_id, slot) DO UPDATE SET
+            order_count = sales_item_rollup.order_count + EXCLUDED.order_count,
+            quantity = sales_item_rollup.quantity + EXCLUDED.quantity,
+            revenue = sales_item_rollup.revenue + EXCLUDED.revenue
+    """)
+    cur.execute(f"""
+        INSERT INTO sales_hourly_rollup (hour, slot, order_count, quantity, revenue)
+        SELECT EXTRACT(HOUR FROM created_at)::int, 0, -COUNT(*), -SUM(quantity), -SUM(quantity * price)
+        FROM "{table}"
+        WHERE created_at IS NOT NULL
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (hour, slot) DO UPDATE SET
+            order_count = sales_hourly_rollup.order_count + EXCLUDED.order_count,
+            quantity = sales_hourly_rollup.quantity + EXCLUDED.quantity,
+            revenue = sales_hourly_rollup.revenue + EXCLUDED.revenue
+    """)
+    cur.execute(f"""
+        INSERT INTO sales_totals (slot, order_count, quantity, revenue)
+        SELECT 0, -COUNT(*), -COALESCE(SUM(quantity), 0), -COALESCE(SUM(quantity * price), 0)
+        FROM "{table}"
+        ON CONFLICT (slot) DO UPDATE SET
+            order_count = sales_totals.order_count + EXCLUDED.order_count,
+            quantity = sales_totals.quantity + EXCLUDED.quantity,
+            revenue = sales_totals.revenue + EXCLUDED.revenue
+    """)
+
+
+def reset(cur):
+    """Zero every rollup (used when all sales are deleted)."""
+    cur.execute("DELETE FROM sales_item_rollup")
+    cur.execute("DELETE FROM sales_hourly_rollup")
+    cur.execute("DELETE FROM sales_totals")
+
+
+TOTALS_SQL = """
+    SELECT COALESCE(SUM(order_count), 0)::bigint AS order_count,
+           COALESCE(SUM(quantity), 0)::bigint AS quantity,
+           COALESCE(SUM(revenue), 0) AS revenue
+    FROM sales_totals
+"""
+
+
+def read_totals(cur):
+    """Running totals in the shape of add_sale's ``summary`` field.
+
+    Reads the committed slots plus this transaction's own writes, so a
+    concurrent sale still in flight may be missing.
+    """
+    cur.execute(TOTALS_SQL)
+    totals = cur.fetchone()
+    return {
+        "total_sales": totals['order_count'],
+        "total_items_sold": totals['quantity'],
+        "total_revenue": totals['revenue'],
+    }
+
+
+def read_summary(cur):
+    """All-time sales summary (compute_summary shape) read from the rollups."""
+    cur.execute(TOTALS_SQL)
+    totals = cur.fetchone()
+    if not totals['order_count']:
+        return empty_summary()
+
+    # Items under their current names; old sales of items that no longer
+    # exist (served by idx_sales_unlinked_item_name) under the name they had
+    cur.execute("""
+        SELECT item_name, SUM(quantity) AS quantity, MAX(last_id) AS last_id
+        FROM (
+            SELECT st.item_name, r.quantity, r.last_sale_id AS last_id
+            FROM sales_item_rollup r
+            JOIN storage st ON st.item_id = r.item_id
+            UNION ALL
+            SELECT item_name, SUM(quantity), MAX(id)
+            FROM sales
+            WHERE item_id IS NULL
+            GROUP BY item_name
+        ) items
+        GROUP BY item_name
+        HAVING SUM(quantity) <> 0
+        ORDER BY quantity DESC, last_id DESC NULLS LAST
+    """)
+    items_sold = {row['item_name']: row['quantity'] for row in cur.fetchall()}
+
+    cur.execute("SELECT hour, SUM(quantity)::bigint AS quantity FROM sales_hourly_rollup GROUP BY hour")
+    hourly_sales = {hour: 0 for hour in range(24)}
+    for row in cur.fetchall():
+        hourly_sales[row['hour']] = row['quantity']
+
+    # Served by idx_sales_created_at
+    cur.execute("""
+        SELECT COALESCE(st.item_name, s.item_name) AS item_name, s.quantity, s.price, s.created_at
+        FROM sales s
+        LEFT JOIN storage st ON st.item_id = s.item_id
+        ORDER BY s.created_at DESC
+        LIMIT 5
+    """)
+    recent_sales = cur.fetchall()
+
+    best_selling_item, best_selling_quantity = next(iter(items_sold.items()), (None, 0))
+
+    return {
+        "total_revenue": totals['revenue'],
+        "total_sales_count": totals['quantity'],
+        "avg_order_value": totals['revenue'] / totals['order_count'],
+        "best_selling_item": best_selling_item,
+        "best_selling_quantity": best_selling_quantity,
+        "items_sold": items_sold,
+        "hourly_sales": hourly_sales,
+        "recent_sales": [{
+            'item_name': s['item_name'],
+            'quantity': s['quantity'],
+            'price': float(s['price']),
+            'total': float(s['quantity'] * s['price']),
+            'time': s['created_at'].strftime('%H:%M')
+        } for s in recent_sales]
+    }
+
+
+def rebuild(cur):
+    """Recompute every rollup from the raw sales table."""
+    cur.execute(ROLLUP_TABLES_SQL)
+    cur.execute("LOCK TABLE sales IN SHARE MODE")  # block writers while recomputing
+    cur.execute(REBUILD_SQL)
+
+
+def verify(cur):
+    """Compare the rollups with fresh aggregates; returns a list of drift descriptions.
+
+    Runs in a REPEATABLE READ transaction of its own, so the aggregates over
+    ``sales`` and the rollups are read from one snapshot and a sale that
+    commits in between is not reported as drift. Call it with no
+    transaction open on ``cur``'s connection; the transaction is rolled
+    back afterwards.
+    """
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+    try:
+        return _drift(cur)
+    finally:
+        cur.connection.rollback()
+
+
+def _drift(cur):
+    drift = []
+
+    cur.execute("""
+        SELECT COUNT(*) AS order_count,
+               COALESCE(SUM(quantity), 0) AS quantity,
+               COALESCE(SUM(quantity * price), 0) AS revenue
+        FROM sales
+    """)
+    expected = cur.fetchone()
+    cur.execute(TOTALS_SQL)
+    actual = cur.fetchone()
+    for key in ('order_count', 'quantity', 'revenue'):
+        if expected[key] != actual[key]:
+            drift.append(f"sales_totals.{key}: expected {expected[key]}, found {actual[key]}")
+
+    checks = (
+        ("sales_item_rollup", "item_id", "item_id", "item_id IS NOT NULL"),
+        ("sales_hourly_rollup", "hour", "EXTRACT(HOUR FROM created_at)::int", "created_at IS NOT NULL"),
+    )
+    for table, key, expr, condition in checks:
+        cur.execute(f"""
+            SELECT COALESCE(r.{key}, s.{key}) AS key,
+                   s.order_count AS expected_count, r.order_count AS actual_count,
+                   s.quantity AS expected_quantity, r.quantity AS actual_quantity,
+                   s.revenue AS expected_revenue, r.revenue AS actual_revenue
+            FROM (
+                SELECT {expr} AS {key}, COUNT(*) AS order_count,
+                       SUM(quantity) AS quantity, SUM(quantity * price) AS revenue
+                FROM sales
+                WHERE {condition}
+                GROUP BY 1
+            ) s
+            FULL OUTER JOIN (
+                SELECT {key}, SUM(order_count) AS order_count,
+                       SUM(quantity) AS quantity, SUM(revenue) AS revenue
+                FROM {table}
+                GROUP BY {key}
+                HAVING SUM(order_count) <> 0 OR SUM(quantity) <> 0 OR SUM(revenue) <> 0
+            ) r ON r.{key} = s.{key}
+            WHERE s.order_count IS DISTINCT FROM r.order_count
+               OR s.quantity IS DISTINCT FROM r.quantity
+               OR s.revenue IS DISTINCT FROM r.revenue
+        """)
+        for row in cur.fetchall():
+            drift.append(
+                f"{table}[{row['key']}]: expected count/quantity/revenue "
+                f"{row['expected_count']}/{row['expected_quantity']}/{row['expected_revenue']}, "
+                f"found {row['actual_count']}/{row['actual_quantity']}/{row['actual_revenue']}"
+            )
+
+    return drift
+
+
+if __name__ == "__main__":
+    from db import get_db_connection
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    if command not in ("verify", "rebuild"):
+        print("Usage: python rollups.py [verify|rebuild]")
+        sys.exit(2)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if command == "rebuild":
+                rebuild(cur)
+                print("✅ Sales rollups rebuilt from raw sales")
+            else:
+                drift = verify(cur)
+                if drift:
+                    print(f"❌ Found {len(drift)} rollup discrepancies:")
+                    for line in drift:
+                        print(f"- {line}")
+                    sys.exit(1)
+                print("✅ Sales rollups match raw sales")
@@ -0,0 +1,238 @@
+"""Batched sale recording: a whole basket in one transaction.
+
+Lines are resolved against the catalog cache, then a single transaction
+takes stock with one conditional ``UPDATE ... WHERE quantity >= n`` per
+item, in ``item_id`` order (so concurrent baskets can never deadlock; the
+data-version bump these writes trigger waits for the commit, see
+data_versions.py), inserts all sale rows with one multi-row INSERT, updates the rollups and
+announces the sale to live dashboards. No row is read and then written
+back, so a hot item's lock is held only from its UPDATE to the commit.
+Items with sharded stock (stock_shards.py) take from one of their shards
+instead, so parallel sales of the same item do not queue at all.
+"""
+from decimal import Decimal, InvalidOperation
+
+from psycopg2.extras import execute_values
+
+import live
+import rollups
+import stock_shards
+from catalog import catalog
+from db import get_db_connection
+
+ALL_OR_NOTHING = "all_or_nothing"
+BEST_EFFORT = "best_effort"
+
+
+def _line(item, index):
+    return {
+        "line": index,
+        "item_name": item.get("item_name"),
+        "quantity": item.get("quantity"),
+        "price": item.get("price"),
+        "status": "pending",
+    }
+
+
+def _reject(line, error):
+    line["status"] = "rejected"
+    line["error"] = error
+    return line
+
+
+def take_stock(cur, item_id, quantity, shards=0):
+    """Decrement an item's stock by ``quantity`` if that much is left.
+
+    A single conditional UPDATE: the row lock is taken and the check made
+    in one statement, so nothing runs between reading and writing the
+    stock. Items with ``shards`` take from a shard instead (see
+    :func:`stock_shards.take`). Returns the updated storage row, or None if
+    the item is missing or short.
+    """
+    if shards:
+        return stock_shards.take(cur, item_id, quantity, shards)
+    cur.execute("""
+        UPDATE storage
+        SET quantity = quantity - %s
+        WHERE item_id = %s AND quantity >= %s
+        RETURNING *
+    """, (quantity, item_id, quantity))
+    return cur.fetchone()
+
+
+def _allocate_short(cur, lines, lock):
+    """Give an item's remaining stock to its lines in basket order; reject the rest.
+
+    Only runs when ``take_stock`` could not cover every line. With ``lock``
+    the row is locked so the allocation can be applied; otherwise it is read
+    just to report what was available. Returns ``(row, accepted_lines)``.
+    """
+    cur.execute(f"""
+        SELECT item_id, item_name, quantity, price, stock_shards
+        FROM storage
+        WHERE item_id = %s
+        {"FOR UPDATE" if lock else ""}
+    """, (lines[0]["item_id"],))
+    row = cur.fetchone()
+    if row is None:
+        catalog.invalidate()
+        for line in lines:
+            _reject(line, f"Item '{line['item_name']}' not found in inventory")
+        return None, []
+
+    available = row["quantity"]
+    if row["stock_shards"]:
+        available += stock_shards.shard_total(cur, row["item_id"], lock=lock)
+    taken = []
+    for line in lines:
+        if line["quantity"] > available:
+            _reject(line, f"Insufficient stock for '{row['item_name']}'. "
+                          f"Available: {available}, Requested: {line['quantity']}")
+        else:
+            available -= line["quantity"]
+            taken.append(line)
+    return row, taken
+
+
+def record_sales(items, mode=BEST_EFFORT):
+    """Record a basket of ``{item_name, quantity[, price]}`` lines.
+
+    With ``mode=ALL_OR_NOTHING`` nothing is written unless every line can be
+    sold; with ``BEST_EFFORT`` valid lines are written and the rest rejected.
+    Returns ``{"success", "mode", "lines", "total_amount", "sales"}`` where each
+    line carries ``status`` ("added"/"rejected") and, if rejected, ``error``.
+    """
+    if mode not in (ALL_OR_NOTHING, BEST_EFFORT):
+        raise ValueError(f"Unknown mode '{mode}'. Use '{ALL_OR_NOTHING}' or '{BEST_EFFORT}'")
+
+    lines = [_line(item or {}, i) for i, item in enumerate(items)]
+
+    # Validate and resolve names without touching the database
+    pending = []
+    shards = {}
+    for line in lines:
+        if not line["item_name"] or line["quantity"] is None:
+            _reject(line, "Missing name or quantity")
+            continue
+        try:
+            line["quantity"] = int(line["quantity"])
+            if line["quantity"] <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            _reject(line, "Quantity must be a positive whole number")
+            continue
+        if line["price"] is not None:
+            try:
+                line["price"] = Decimal(str(line["price"]))
+                if line["price"] <= 0:
+                    raise InvalidOperation
+            except (InvalidOperation, ValueError):
+                _reject(line, "Price must be a positive number")
+                continue
+        entry = catalog.lookup(line["item_name"])
+        if not entry:
+            _reject(line, f"Item '{line['item_name']}' not found in inventory")
+            continue
+        line["item_id"] = entry["item_id"]
+        line["item_name"] = entry["item_name"]
+        shards[entry["item_id"]] = entry["stock_shards"]
+        pending.append(line)
+
+    def result(sales):
+        added = [line for line in lines if line["status"] == "added"]
+        return {
+            "success": bool(added) and (mode == BEST_EFFORT or len(added) == len(lines)),
+            "mode": mode,
+            "lines": lines,
+            "total_amount": sum((line["total"] for line in added), Decimal(0)),
+            "sales": sales,
+        }
+
+    if mode == ALL_OR_NOTHING and len(pending) != len(lines):
+        for line in pending:
+            _reject(line, "Not recorded because another line in the order failed")
+        return result([])
+    if not pending:
+        return result([])
+
+    by_item = {}
+    for line in pending:
+        by_item.setdefault(line["item_id"], []).append(line)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            accepted = []
+            stock = []
+            remaining = {}
+            failed = False
+            # One conditional decrement per item, in item_id order so concurrent
+            # baskets can never deadlock
+            for item_id in sorted(by_item):
+                lines_for_item = by_item[item_id]
+                if failed:
+                    for line in lines_for_item:
+                        _reject(line, "Not recorded because another line in the order failed")
+                    continue
+                row = take_stock(cur, item_id, sum(line["quantity"] for line in lines_for_item),
+                                 shards[item_id])
+                if row is not None:
+                    taken = lines_for_item
+                else:
+                    # Not enough for every line: sell what there is, in basket order
+                    row, taken = _allocate_short(cur, lines_for_item, lock=(mode == BEST_EFFORT))
+                    if mode == ALL_OR_NOTHING:
+                        for line in taken:
+                            _reject(line, "Not recorded because another line in the order failed")
+                        failed = True
+                        continue
+                    if taken:
+                        row = take_stock(cur, item_id, sum(line["quantity"] for line in taken),
+                                         row["stock_shards"])
+                if not taken:
+                    continue
+                remaining[item_id] = row["quantity"]
+                stock.append(row)
+                for line in taken:
+                    if line["price"] is None:
+                        line["price"] = row["price"]
+                    accepted.append(line)
+
+            if not accepted or failed:
+                conn.rollback()
+                if mode == ALL_OR_NOTHING:
+                    for line in accepted:
+                        _reject(line, "Not recorded because another line in the order failed")
+                return result([])
+
+            accepted.sort(key=lambda line: line["line"])
+            # RETURNING does not promise the VALUES order, so each row is
+            # matched back to its line through the id drawn for it
+            sales = execute_values(cur, """
+                WITH numbered AS (
+                    SELECT nextval(pg_get_serial_sequence('sales', 'id'))::integer AS id, v.*
+                    FROM (VALUES %s) AS v(line, item_id, item_name, quantity, price)
+                ), inserted AS (
+                    INSERT INTO sales (id, item_id, item_name, quantity, price)
+                    SELECT id, item_id, item_name, quantity, price FROM numbered
+                    RETURNING *
+                )
+                SELECT numbered.line, inserted.*
+                FROM inserted
+                JOIN numbered USING (id)
+                ORDER BY numbered.line
+            """, [(line["line"], line["item_id"], line["item_name"], line["quantity"], line["price"])
+                  for line in accepted],
+                page_size=len(accepted), fetch=True)
+            lines_by_number = {line["line"]: line for line in accepted}
+            for sale in sales:
+                lines_by_number[sale.pop("line")]["sale_id"] = sale["id"]
+
+            rollups.apply_sales(cur, sales)
+            live.publish_sales(cur, sales, stock)
+            conn.commit()
+
+    for line in accepted:
+        line["status"] = "added"
+        line["total"] = line["quantity"] * line["price"]
+        line["remaining_stock"] = remaining[line["item_id"]]
+    return result(sales)
@@ -0,0 +1,151 @@
+"""Read queries over the sales table: filtered listing and streaming export."""
+import io
+import csv
+import json
+import base64
+import binascii
+from datetime import datetime, date
+from decimal import Decimal
+
+from psycopg2.extras import RealDictCursor
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+UNPAGED_CAP = 500  # rows returned by a bare GET /api/sales
+EXPORT_FETCH_SIZE = 2000  # rows per round trip from the server-side export cursor
+EXPORT_COLUMNS = ('id', 'item_id', 'item_name', 'quantity', 'price', 'total_price', 'created_at', 'updated_at')
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def encode_cursor(sale_id):
+    return base64.urlsafe_b64encode(f"id:{sale_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        kind, _, value = base64.urlsafe_b64decode(padded.encode()).decode().partition(":")
+        if kind != "id":
+            raise ValueError
+        return int(value)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_datetime(value, name):
+    """Parse an ISO 8601 date or datetime query parameter."""
+    if value is None or value == "":
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}'. Use an ISO 8601 date or datetime.")
+
+
+def build_filters(since=None, until=None, item=None, q=None):
+    """WHERE clauses and params shared by listing and export."""
+    clauses = []
+    params = []
+    if since is not None:
+        clauses.append("created_at >= %s")
+        params.append(since)
+    if until is not None:
+        clauses.append("created_at < %s")
+        params.append(until)
+    if item:
+        # The item's whole history, including sales from before a rename
+        clauses.append("""(item_id = (SELECT item_id FROM storage WHERE LOWER(item_name) = LOWER(%s))
+             OR (item_id IS NULL AND LOWER(item_name) = LOWER(%s)))""")
+        params.extend([item, item])
+    if q:
+        q = q.strip()
+        like = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        if q.lstrip("#").isdigit():
+            clauses.append("(item_name ILIKE %s OR id::text LIKE %s)")
+            params.extend([like, q.lstrip("#") + "%"])
+        else:
+            clauses.append("item_name ILIKE %s")
+            params.append(like)
+    return clauses, params
+
+
+def fetch_sales_page(cur, limit=DEFAULT_PAGE_SIZE, cursor=None, since=None, until=None, item=None, q=None):
+    """Return ``(rows, next_cursor)`` for one page of sales, newest first.
+
+    Pages are keyed on ``id`` (the same order the dashboard has always
+    used), so each page is an index range scan no matter how deep it is.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    clauses, params = build_filters(since, until, item, q)
+    if cursor:
+        clauses.append("id < %s")
+        params.append(decode_cursor(cursor))
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    cur.execute(f"""
+        SELECT * FROM sales
+        {where}
+        ORDER BY id DESC
+        LIMIT %s
+    """, params + [limit + 1])
+    rows = cur.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['id'])
+    return rows, next_cursor
+
+
+def _export_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_sales_export(conn, fmt='ndjson', since=None, until=None, item=None, fetch_size=EXPORT_FETCH_SIZE):
+    """Yield an export of the sales table as NDJSON or CSV text chunks.
+
+    Rows are read through a named (server-side) cursor ``fetch_size`` at a
+    time, so memory use does not depend on the size of the table. One chunk
+    is yielded per fetched batch.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Use one of: {', '.join(EXPORT_FORMATS)}")
+
+    clauses, params = build_filters(since, until, item)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_COLUMNS)
+
+    with conn.cursor(name='sales_export', cursor_factory=RealDictCursor) as cur:
+        cur.itersize = fetch_size
+        cur.execute(f"""
+            SELECT {', '.join(EXPORT_COLUMNS)} FROM sales
+            {where}
+            ORDER BY id
+        """, params)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                if writer:
+                    writer.writerow([_export_value(row[col]) for col in EXPORT_COLUMNS])
+                else:
+                    buffer.write(json.dumps({col: _export_value(row[col]) for col in EXPORT_COLUMNS}))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
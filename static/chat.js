@@ -77,6 +77,7 @@ document.addEventListener('DOMContentLoaded', function() {
         messageDiv.textContent = content;
         chatMessages.appendChild(messageDiv);
         scrollToBottom();
+        return messageDiv;
     }
     
     // Show typing indicator
@@ -150,6 +151,175 @@ document.addEventListener('DOMContentLoaded', function() {
         document.removeEventListener('mouseup', stopDrag);
     }
     
+    // Parse one Server-Sent Event block into {event, data}
+    function parseSseEvent(block) {
+        let event = 'message';
+        const dataLines = [];
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : null };
+    }
+    
+    // Stream the reply from /ai/stream, showing text as it arrives
+    async function streamAiResponse(message) {
+        const response = await fetch('/ai/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify({ user_text: message })
+        });
+        
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!response.ok || !response.body || !contentType.startsWith('text/event-stream')) {
+            throw new Error('Streaming response not available');
+        }
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let acknowledged = false;
+        let bubble = null;
+        
+        try {
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const { event, data } = parseSseEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                    
+                    if (event === 'ack') {
+                        acknowledged = true;
+                    } else if (event === 'delta' && data && data.text) {
+                        if (!bubble) {
+                            hideTypingIndicator();
+                            bubble = addMessage('', false);
+                        }
+                        bubble.textContent += data.text;
+                        scrollToBottom();
+                    } else if (event === 'result') {
+                        hideTypingIndicator();
+                        await handleAiResult(data, bubble);
+                        return data;
+                    }
+                }
+            }
+        } catch (error) {
+            error.acknowledged = acknowledged;
+            throw error;
+        }
+        
+        const error = new Error('Stream ended before the result arrived');
+        error.acknowledged = acknowledged;
+        throw error;
+    }
+    
+    // Plain JSON request to /ai (fallback when streaming is unavailable)
+    async function fetchAiResponse(message) {
+        const response = await fetch('/ai', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ user_text: message })
+        });
+        
+        if (!response.ok) {
+            throw new Error('Network response was not ok');
+        }
+        
+        const data = await response.json();
+        console.log('Server response:', data); // Debug log
+        
+        // Hide typing indicator
+        hideTypingIndicator();
+        await handleAiResult(data, null);
+        return data;
+    }
+    
+    // Show the assistant's answer and refresh whatever it changed
+    async function handleAiResult(data, bubble) {
+        // Add bot's response to chat (or finish the streamed bubble)
+        if (data.ai_response) {
+            if (bubble) {
+                bubble.textContent = data.ai_response;
+                scrollToBottom();
+            } else {
+                addMessage(data.ai_response, false);
+            }
+            
+            // Check if we need to refresh any data based on the action
+            console.log('Action received:', data.action); // Debug log
+            if (data.action) {
+                // Refresh sales data if it's a sales-related action
+                if (['add_sale', 'sale_added', 'remove_sale'].includes(data.action)) {
+                    console.log('Processing sales action:', data.action); // Debug log
+                    if (window.fetchSales) {
+                        console.log('Calling window.fetchSales()');
+                        try {
+                            await window.fetchSales();
+                            console.log('Sales data refreshed');
+                        } catch (e) {
+                            console.error('Error refreshing sales:', e);
+                        }
+                    } else {
+                        console.warn('window.fetchSales is not defined');
+                    }
+                    
+                    if (window.updateSummary) {
+                        console.log('Updating summary');
+                        window.updateSummary();
+                    }
+                    if (window.updateCharts) {
+                        console.log('Updating charts');
+                        window.updateCharts();
+                    }
+                }
+                
+                // Refresh inventory if it's an inventory-related action
+                if (['add_inventory', 'update_inventory', 'remove_inventory'].includes(data.action) && window.loadInventory) {
+                    await window.loadInventory();
+                    // Also update the item dropdown in the sales form
+                    if (window.fetchAndPopulateItems) {
+                        await window.fetchAndPopulateItems();
+                    }
+                }
+                
+                // If we have a chart update function, call it
+                if (window.updateInventoryChart) {
+                    window.updateInventoryChart();
+                }
+            }
+            
+            // Handle summary data if present
+            if (data.summary) {
+                let summaryText = '📊 Summary:\n';
+                if (data.summary.total_revenue !== undefined) {
+                    summaryText += `• Total Revenue: $${data.summary.total_revenue.toFixed(2)}\n`;
+                }
+                if (data.summary.best_selling_item) {
+                    summaryText += `• Best Selling Item: ${data.summary.best_selling_item}\n`;
+                }
+                if (data.summary.peak_hour) {
+                    summaryText += `• Peak Sales Hour: ${data.summary.peak_hour}\n`;
+                }
+                addMessage(summaryText, false);
+            }
+        } else {
+            addMessage("I'm sorry, I couldn't process your request. Please try again.", false);
+        }
+    }
+    
     // Send message to backend
     async function sendMessage() {
         const message = userInput.value.trim();
@@ -165,87 +335,15 @@ document.addEventListener('DOMContentLoaded', function() {
         sendButton.disabled = true;
         
         try {
-            const response = await fetch('/ai', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ user_text: message })
-            });
-            
-            if (!response.ok) {
-                throw new Error('Network response was not ok');
-            }
-            
-            const data = await response.json();
-            console.log('Server response:', data); // Debug log
-            
-            // Hide typing indicator
-            hideTypingIndicator();
-            
-            // Add bot's response to chat
-            if (data.ai_response) {
-                addMessage(data.ai_response, false);
-                
-                // Check if we need to refresh any data based on the action
-                console.log('Action received:', data.action); // Debug log
-                if (data.action) {
-                    // Refresh sales data if it's a sales-related action
-                    if (['add_sale', 'sale_added', 'remove_sale'].includes(data.action)) {
-                        console.log('Processing sales action:', data.action); // Debug log
-                        if (window.fetchSales) {
-                            console.log('Calling window.fetchSales()');
-                            try {
-                                await window.fetchSales();
-                                console.log('Sales data refreshed');
-                            } catch (e) {
-                                console.error('Error refreshing sales:', e);
-                            }
-                        } else {
-                            console.warn('window.fetchSales is not defined');
-                        }
-                        
-                        if (window.updateSummary) {
-                            console.log('Updating summary');
-                            window.updateSummary();
-                        }
-                        if (window.updateCharts) {
-                            console.log('Updating charts');
-                            window.updateCharts();
-                        }
-                    }
-                    
-                    // Refresh inventory if it's an inventory-related action
-                    if (['add_inventory', 'update_inventory', 'remove_inventory'].includes(data.action) && window.loadInventory) {
-                        await window.loadInventory();
-                        // Also update the item dropdown in the sales form
-                        if (window.fetchAndPopulateItems) {
-                            await window.fetchAndPopulateItems();
-                        }
-                    }
-                    
-                    // If we have a chart update function, call it
-                    if (window.updateInventoryChart) {
-                        window.updateInventoryChart();
-                    }
+            try {
+                await streamAiResponse(message);
+            } catch (error) {
+                if (error.acknowledged) {
+                    // The server may already have acted on the message; don't send it twice
+                    throw error;
                 }
-                
-                // Handle summary data if present
-                if (data.summary) {
-                    let summaryText = '📊 Summary:\n';
-                    if (data.summary.total_revenue !== undefined) {
-                        summaryText += `• Total Revenue: $${data.summary.total_revenue.toFixed(2)}\n`;
-                    }
-                    if (data.summary.best_selling_item) {
-                        summaryText += `• Best Selling Item: ${data.summary.best_selling_item}\n`;
-                    }
-                    if (data.summary.peak_hour) {
-                        summaryText += `• Peak Sales Hour: ${data.summary.peak_hour}\n`;
-                    }
-                    addMessage(summaryText, false);
-                }
-            } else {
-                addMessage("I'm sorry, I couldn't process your request. Please try again.", false);
+                console.warn('Streaming unavailable, falling back to /ai:', error);
+                await fetchAiResponse(message);
             }
         } catch (error) {
             console.error('Error:', error);
@@ -168,9 +168,25 @@ const formatDate = (dateString) => {
 };
 
 // Fetch sales data
+const SALES_PAGE_SIZE = 10;
+
+// Build the /api/sales query for the current time filter and search box
+const buildSalesQuery = () => {
+    const params = new URLSearchParams({ limit: SALES_PAGE_SIZE });
+    const startDate = getPeriodStart(timeFilter ? timeFilter.value : 'all');
+    if (startDate) {
+        params.set('since', startDate.toISOString());
+    }
+    const searchQuery = searchInput ? searchInput.value.trim() : '';
+    if (searchQuery) {
+        params.set('q', searchQuery);
+    }
+    return params.toString();
+};
+
 const fetchSales = async () => {
     try {
-        const response = await fetch('/api/sales');
+        const response = await fetch(`/api/sales?${buildSalesQuery()}`);
         if (!response.ok) {
             const error = await response.json().catch(() => ({}));
             throw new Error(error.message || 'Failed to fetch sales');
@@ -282,12 +298,14 @@ const addSale = async (e) => {
         // Reset form
         saleForm.reset();
         
-        // Refresh data
-        await Promise.all([
-            fetchSales(),
-            fetchAnalytics(),
-            updateInventoryChart()  // Refresh the inventory chart
-        ]);
+        // Refresh data (the live stream delivers this sale on its own)
+        if (!liveConnected) {
+            await Promise.all([
+                fetchSales(),
+                fetchAnalytics(),
+                updateInventoryChart()  // Refresh the inventory chart
+            ]);
+        }
         
         // Update UI
         renderSales();
@@ -322,8 +340,10 @@ const deleteSale = async (saleId) => {
         const data = await response.json();
         
         if (response.ok) {
-            // Refresh the sales list and analytics
-            await Promise.all([fetchSales(), fetchAnalytics()]);
+            // Refresh the sales list and analytics (the live stream delivers the deletion on its own)
+            if (!liveConnected) {
+                await Promise.all([fetchSales(), fetchAnalytics()]);
+            }
             renderSales();
             updateSummary();
             
@@ -345,14 +365,8 @@ const renderSales = () => {
     // Get search query
     const searchQuery = searchInput ? searchInput.value : '';
     
-    // Get filtered sales based on selected time period
-    const selectedPeriod = timeFilter ? timeFilter.value : 'all';
-    let filteredSales = filterSalesByTime(sales, selectedPeriod);
-    
-    // Apply search filter if there's a search query
-    if (searchQuery) {
-        filteredSales = searchSales(filteredSales, searchQuery);
-    }
+    // Sales are already filtered by time period and search on the server
+    const filteredSales = sales;
     
     if (!filteredSales.length) {
         const noResultsMessage = searchQuery 
@@ -610,19 +624,8 @@ const updateCharts = () => {
     }
 };
 
-// Search sales by item name
-const searchSales = (sales, query) => {
-    if (!query) return sales;
-    
-    const searchTerm = query.toLowerCase().trim();
-    return sales.filter(sale => 
-        sale.item_name.toLowerCase().includes(searchTerm) ||
-        (sale.id && sale.id.toString().includes(searchTerm))
-    );
-};
-
-// Filter sales by time period
-const filterSalesByTime = (sales, period) => {
+// Start of the selected time period (null for all time)
+const getPeriodStart = (period) => {
     const now = new Date();
     let startDate;
 
@@ -642,13 +645,10 @@ const filterSalesByTime = (sales, period) => {
             break;
         case 'all':
         default:
-            return sales; // Return all sales if 'all' or unknown period
+            return null; // No lower bound for 'all' or unknown period
     }
 
-    return sales.filter(sale => {
-        const saleDate = new Date(sale.sale_date || sale.created_at);
-        return saleDate >= startDate;
-    });
+    return startDate;
 };
 
 // Initialize the app
@@ -666,8 +666,7 @@ const init = async () => {
         // Set up time filter event listener
         if (timeFilter) {
             timeFilter.addEventListener('change', () => {
-                renderSales();
-                updateSummary();
+                fetchSales();
             });
         }
         
@@ -678,8 +677,7 @@ const init = async () => {
             searchInput.addEventListener('input', () => {
                 clearTimeout(searchTimeout);
                 searchTimeout = setTimeout(() => {
-                    renderSales();
-                    updateSummary();
+                    fetchSales();
                     
                     // Show/hide clear button based on input
                     if (clearSearchBtn) {
@@ -694,8 +692,7 @@ const init = async () => {
                 clearSearchBtn.addEventListener('click', () => {
                     searchInput.value = '';
                     clearSearchBtn.style.display = 'none';
-                    renderSales();
-                    updateSummary();
+                    fetchSales();
                 });
             }
             
@@ -703,8 +700,7 @@ const init = async () => {
             searchInput.addEventListener('keyup', (e) => {
                 if (e.key === 'Enter') {
                     clearTimeout(searchTimeout);
-                    renderSales();
-                    updateSummary();
+                    fetchSales();
                 }
             });
         }
@@ -728,8 +724,8 @@ const init = async () => {
             renderSales();
         }
         
-        // Set up auto-refresh every 30 seconds
-        setInterval(fetchAnalytics, 30000);
+        // Keep the dashboard current from the live stream (or by polling)
+        startLiveUpdates();
         
     } catch (error) {
         console.error('Error initializing app:', error);
@@ -737,6 +733,165 @@ const init = async () => {
     }
 };
 
+// ---------------- Live updates ----------------
+// Deltas pushed by /api/live (Server-Sent Events). Falls back to polling
+// when EventSource is unavailable or the server turns the stream away.
+const POLL_INTERVAL = 30000;
+const LIVE_RETRY_DELAY = 60000;
+let liveSource = null;
+let liveConnected = false;
+let pollTimer = null;
+
+const startPolling = () => {
+    if (!pollTimer) {
+        pollTimer = setInterval(fetchAnalytics, POLL_INTERVAL);
+    }
+};
+
+const stopPolling = () => {
+    clearInterval(pollTimer);
+    pollTimer = null;
+};
+
+// Recompute the best seller from the per-item quantities
+const updateBestSeller = () => {
+    let bestItem = null;
+    let bestQuantity = 0;
+    Object.entries(analytics.items_sold || {}).forEach(([name, quantity]) => {
+        if (quantity > bestQuantity) {
+            bestItem = name;
+            bestQuantity = quantity;
+        }
+    });
+    analytics.best_selling_item = bestItem;
+    analytics.best_selling_quantity = bestQuantity;
+};
+
+// Add (sign 1) or remove (sign -1) sale rows from the analytics and take the new running totals
+const applySalesToAnalytics = (changedSales, totals, sign) => {
+    analytics.items_sold = analytics.items_sold || {};
+    analytics.hourly_sales = analytics.hourly_sales || {};
+    changedSales.forEach(sale => {
+        const quantity = analytics.items_sold[sale.item_name] || 0;
+        if (quantity + sign * sale.quantity > 0) {
+            analytics.items_sold[sale.item_name] = quantity + sign * sale.quantity;
+        } else {
+            delete analytics.items_sold[sale.item_name];
+        }
+        if (sale.hour !== null) {
+            analytics.hourly_sales[sale.hour] = (analytics.hourly_sales[sale.hour] || 0) + sign * sale.quantity;
+        }
+    });
+    if (totals) {
+        analytics.total_revenue = parseFloat(totals.total_revenue);
+        analytics.total_sales_count = totals.total_items_sold;
+        analytics.avg_order_value = totals.total_sales ? analytics.total_revenue / totals.total_sales : 0;
+    }
+    updateBestSeller();
+    updateSummary();
+    updateCharts();
+};
+
+// Merge new or deleted sales into the visible page of the sales list
+const applySalesToList = (changedSales, sign) => {
+    const ids = new Set(changedSales.map(sale => sale.id));
+    if (sign < 0) {
+        if (sales.some(sale => ids.has(sale.id))) {
+            fetchSales();  // refill the page
+        }
+        return;
+    }
+    if (searchInput && searchInput.value.trim()) {
+        fetchSales();  // let the server match the search
+        return;
+    }
+    const startDate = getPeriodStart(timeFilter ? timeFilter.value : 'all');
+    const visible = changedSales.filter(sale => !startDate || new Date(sale.created_at) >= startDate);
+    if (!visible.length) return;
+    sales = [...visible, ...sales.filter(sale => !ids.has(sale.id))]
+        .sort((a, b) => b.id - a.id)
+        .slice(0, SALES_PAGE_SIZE);
+    renderSales();
+};
+
+// Update the inventory chart in place from changed and removed storage rows
+const applyStockToChart = (changedItems, removedItems) => {
+    const chart = window.inventoryChart;
+    if (!chart || !chart.data) return;
+    const stock = new Map(chart.data.labels.map((name, i) => [name, chart.data.datasets[0].data[i]]));
+    removedItems.forEach(item => stock.delete(item.item_name));
+    changedItems.forEach(item => stock.set(item.item_name, item.quantity));
+    const rows = [...stock.entries()]
+        .filter(([_, quantity]) => quantity > 0)
+        .sort((a, b) => b[1] - a[1]);
+    chart.data.labels = rows.map(([name]) => name);
+    chart.data.datasets[0].data = rows.map(([_, quantity]) => quantity);
+    chart.update();
+};
+
+const liveHandlers = {
+    sale: (data) => {
+        applySalesToAnalytics(data.sales, data.totals, 1);
+        applySalesToList(data.sales, 1);
+        applyStockToChart(data.stock, []);
+    },
+    sale_deleted: (data) => {
+        applySalesToAnalytics(data.sales, data.totals, -1);
+        applySalesToList(data.sales, -1);
+    },
+    stock: (data) => {
+        applyStockToChart(data.items, data.removed);
+        // The item picker only shows names and prices
+        const known = new Map(items.map(item => [item.item_id, item]));
+        const pickerChanged = data.removed.length || data.items.some(item =>
+            !known.has(item.item_id) || known.get(item.item_id).price !== item.price);
+        if (pickerChanged) {
+            fetchAndPopulateItems();
+        }
+    },
+    refresh: (data) => {
+        if (data.tables.includes('sales')) {
+            fetchSales();
+            fetchAnalytics();
+        }
+        if (data.tables.includes('storage')) {
+            updateInventoryChart();
+            fetchAndPopulateItems();
+        }
+    }
+};
+
+const startLiveUpdates = () => {
+    if (liveSource) return;
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    liveSource = new EventSource('/api/live');
+    Object.entries(liveHandlers).forEach(([name, handler]) => {
+        liveSource.addEventListener(name, (e) => {
+            try {
+                handler(JSON.parse(e.data));
+            } catch (error) {
+                console.error(`Error applying live ${name} event:`, error);
+            }
+        });
+    });
+    liveSource.onopen = () => {
+        liveConnected = true;
+        stopPolling();
+    };
+    liveSource.onerror = () => {
+        liveConnected = false;
+        // EventSource reconnects by itself unless the server refused the stream
+        if (liveSource.readyState === EventSource.CLOSED) {
+            liveSource = null;
+            startPolling();
+            setTimeout(startLiveUpdates, LIVE_RETRY_DELAY);
+        }
+    };
+};
+
 // Function to fetch and render inventory chart
 async function updateInventoryChart() {
     try {
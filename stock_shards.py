@@ -0,0 +1,268 @@
+"""Sharded stock counters for very hot items (opt-in per item).
+
+An item with ``storage.stock_shards = N`` keeps its stock split across N
+rows of ``storage_shards``. A sale takes from one shard chosen at random,
+skipping shards other sellers have locked, so up to N sales of the same
+item commit in parallel instead of queueing on one ``storage`` row.
+
+``storage.quantity`` stays a central reserve: restocks and manual stock
+edits land there, and the item's stock is always the reserve plus the
+shards (the ``storage_stock`` view). When no single shard can cover a
+sale, the item is rebalanced: the reserve and all shards are locked, the
+sale is taken from their sum and what is left is spread evenly over the
+shards.
+
+    python stock_shards.py enable <item_id> <shards>
+    python stock_shards.py disable <item_id>
+"""
+import sys
+import random
+
+from psycopg2.extras import execute_values
+
+MAX_SHARDS = 64
+
+STOCK_SHARDS_SQL = """
+-- Per-item stock shards; the item's stock is storage.quantity plus these
+CREATE TABLE IF NOT EXISTS storage_shards (
+    item_id INTEGER NOT NULL REFERENCES storage(item_id) ON DELETE CASCADE,
+    shard SMALLINT NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0 CHECK (quantity >= 0),
+    PRIMARY KEY (item_id, shard)
+);
+
+-- Storage rows with the total stock (reserve plus shards)
+CREATE OR REPLACE VIEW storage_stock AS
+SELECT s.item_id, s.item_name,
+       s.quantity + COALESCE(sh.quantity, 0) AS quantity,
+       s.price, s.created_at, s.updated_at, s.stock_shards
+FROM storage s
+LEFT JOIN (
+    SELECT item_id, SUM(quantity)::integer AS quantity
+    FROM storage_shards
+    GROUP BY item_id
+) sh ON sh.item_id = s.item_id;
+
+-- Shard writes change the item's stock, so they count as storage writes
+-- (bumped at commit, see data_versions.py)
+DROP TRIGGER IF EXISTS storage_shards_data_version ON storage_shards;
+CREATE TRIGGER storage_shards_data_version
+    AFTER INSERT OR UPDATE OR DELETE ON storage_shards
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_data_version('storage');
+DROP TRIGGER IF EXISTS storage_shards_data_version_commit ON storage_shards;
+CREATE CONSTRAINT TRIGGER storage_shards_data_version_commit
+    AFTER INSERT OR UPDATE OR DELETE ON storage_shards
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION bump_marked_data_versions();
+DROP TRIGGER IF EXISTS storage_shards_data_version_truncate ON storage_shards;
+CREATE TRIGGER storage_shards_data_version_truncate
+    AFTER TRUNCATE ON storage_shards
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('storage');
+"""
+
+# Take ``quantity`` from one shard that holds enough, starting at a random
+# shard. Returns the storage row with the item's stock after the sale (as
+# of the statement's snapshot; other sellers may commit meanwhile).
+TAKE_SQL = """
+WITH pick AS (
+    SELECT shard FROM storage_shards
+    WHERE item_id = %(item_id)s AND quantity >= %(quantity)s
+    ORDER BY (shard + %(offset)s) %% %(shards)s
+    LIMIT 1
+    FOR UPDATE {wait}
+), taken AS (
+    UPDATE storage_shards sh
+    SET quantity = sh.quantity - %(quantity)s
+    FROM pick
+    WHERE sh.item_id = %(item_id)s AND sh.shard = pick.shard AND sh.quantity >= %(quantity)s
+    RETURNING sh.item_id
+)
+SELECT s.item_id, s.item_name,
+       s.quantity + (SELECT COALESCE(SUM(quantity), 0)::integer FROM storage_shards
+                     WHERE item_id = s.item_id) - %(quantity)s AS quantity,
+       s.price, s.created_at, s.updated_at, s.stock_shards
+FROM storage s
+JOIN taken ON taken.item_id = s.item_id
+"""
+
+
+def take(cur, item_id, quantity, shards):
+    """Take ``quantity`` units of a sharded item; returns its row (total stock) or None if short.
+
+    First a shard nobody else holds, then waiting for one (in shard order,
+    like a rebalance locks them), then a rebalance across all shards, which
+    also covers sales bigger than any one shard.
+    """
+    params = {"item_id": item_id, "quantity": quantity, "shards": shards}
+    # A shard that turns out short once locked stays locked; the savepoint
+    # lets those go before the rebalance locks the item's row, which has to
+    # come before its shards. Left open on success until the commit.
+    cur.execute("SAVEPOINT take_shard")
+    for wait, offset in (("SKIP LOCKED", random.randrange(shards)), ("", 0)):
+        cur.execute(TAKE_SQL.format(wait=wait), dict(params, offset=offset))
+        row = cur.fetchone()
+        if row is not None:
+            return row
+    cur.execute("ROLLBACK TO SAVEPOINT take_shard")
+    return _rebalance_and_take(cur, item_id, quantity)
+
+
+def _lock_item(cur, item_id):
+    """Lock the reserve, then the shards in order; returns ``(storage row, shard total)``."""
+    cur.execute("""
+        SELECT item_id, item_name, quantity, price, created_at, updated_at, stock_shards
+        FROM storage
+        WHERE item_id = %s
+        FOR UPDATE
+    """, (item_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None, 0
+    cur.execute("SELECT quantity FROM storage_shards WHERE item_id = %s ORDER BY shard FOR UPDATE",
+                (item_id,))
+    return row, sum(shard["quantity"] for shard in cur.fetchall())
+
+
+def _rebalance_and_take(cur, item_id, quantity):
+    row, in_shards = _lock_item(cur, item_id)
+    if row is None:
+        return None
+    total = row["quantity"] + in_shards
+    if total < quantity:
+        return None
+
+    shards = row["stock_shards"]
+    if not shards:
+        # Sharding was switched off after the caller looked the item up
+        cur.execute("UPDATE storage SET quantity = %s WHERE item_id = %s", (total - quantity, item_id))
+    else:
+        _spread(cur, item_id, total - quantity, shards)
+        if row["quantity"]:
+            cur.execute("UPDATE storage SET quantity = 0 WHERE item_id = %s", (item_id,))
+    row["quantity"] = total - quantity
+    return row
+
+
+def _spread(cur, item_id, quantity, shards):
+    per_shard, extra = divmod(quantity, shards)
+    execute_values(cur, """
+        INSERT INTO storage_shards (item_id, shard, quantity)
+        VALUES %s
+        ON CONFLICT (item_id, shard) DO UPDATE SET quantity = EXCLUDED.quantity
+    """, [(item_id, shard, per_shard + (1 if shard < extra else 0)) for shard in range(shards)])
+
+
+def shard_total(cur, item_id, lock=True):
+    """Stock held in an item's shards, locking them (in shard order) unless ``lock`` is False."""
+    cur.execute(f"""
+        SELECT quantity FROM storage_shards
+        WHERE item_id = %s
+        ORDER BY shard
+        {"FOR UPDATE" if lock else ""}
+    """, (item_id,))
+    return sum(shard["quantity"] for shard in cur.fetchall())
+
+
+def reset(cur, item_id):
+    """Empty an item's shards after its stock was set directly on ``storage.quantity``."""
+    cur.execute("UPDATE storage_shards SET quantity = 0 WHERE item_id = %s AND quantity <> 0", (item_id,))
+
+
+def lock_items(cur, item_ids):
+    """Lock the ``storage`` rows of ``item_ids`` and move their shards' stock into the reserve.
+
+    For bulk writes that work on ``storage.quantity`` directly. Locks are
+    taken in the order sales take them, item by item in ``item_id`` order
+    with each item's shards right after its row, so a bulk write cannot
+    deadlock with a seller holding a shard. (Neither side locks a shared
+    row in between: data versions are bumped at commit and rollups go to
+    random slots, after all stock locks.)
+    """
+    item_ids = sorted(item_ids)
+    cur.execute("SELECT item_id FROM storage WHERE item_id = ANY(%s) AND stock_shards > 0", (item_ids,))
+    sharded = sorted(row["item_id"] for row in cur.fetchall())
+    after = None
+    for upto in sharded + [None]:
+        cur.execute("""
+            SELECT item_id FROM storage
+            WHERE item_id = ANY(%(ids)s)
+              AND (%(after)s IS NULL OR item_id > %(after)s)
+              AND (%(upto)s IS NULL OR item_id <= %(upto)s)
+            ORDER BY item_id
+            FOR UPDATE
+        """, {"ids": item_ids, "after": after, "upto": upto})
+        if upto is not None:
+            _collapse(cur, [upto])
+        after = upto
+    # Items sharded after the first query have had their rows locked since
+    _collapse(cur, item_ids)
+
+
+def _collapse(cur, item_ids):
+    """Move the shards' stock of ``item_ids`` back into the reserve; their rows must be locked."""
+    cur.execute("""
+        SELECT item_id, quantity FROM storage_shards
+        WHERE item_id = ANY(%s) AND quantity <> 0
+        ORDER BY item_id, shard
+        FOR UPDATE
+    """, (list(item_ids),))
+    moved = {}
+    for shard in cur.fetchall():
+        moved[shard["item_id"]] = moved.get(shard["item_id"], 0) + shard["quantity"]
+    if not moved:
+        return
+    cur.execute("UPDATE storage_shards SET quantity = 0 WHERE item_id = ANY(%s)", (list(moved),))
+    execute_values(cur, """
+        UPDATE storage AS s
+        SET quantity = s.quantity + v.moved
+        FROM (VALUES %s) AS v(item_id, moved)
+        WHERE s.item_id = v.item_id
+    """, sorted(moved.items()))
+
+
+def set_shards(cur, item_id, shards):
+    """Shard an item's stock ``shards`` ways (0 turns sharding off). Returns the storage row or None."""
+    shards = int(shards)
+    if not 0 <= shards <= MAX_SHARDS:
+        raise ValueError(f"Shards must be between 0 and {MAX_SHARDS}")
+    row, in_shards = _lock_item(cur, item_id)
+    if row is None:
+        return None
+    total = row["quantity"] + in_shards
+    cur.execute("DELETE FROM storage_shards WHERE item_id = %s AND shard >= %s", (item_id, shards))
+    if shards:
+        _spread(cur, item_id, total, shards)
+        total_in_reserve = 0
+    else:
+        total_in_reserve = total
+    cur.execute("""
+        UPDATE storage SET quantity = %s, stock_shards = %s
+        WHERE item_id = %s
+        RETURNING *
+    """, (total_in_reserve, shards, item_id))
+    row = cur.fetchone()
+    row["quantity"] = total
+    return row
+
+
+if __name__ == "__main__":
+    from db import get_db_connection
+
+    usage = "Usage: python stock_shards.py enable <item_id> <shards> | disable <item_id>"
+    if len(sys.argv) < 3 or sys.argv[1] not in ("enable", "disable"):
+        print(usage)
+        sys.exit(2)
+    try:
+        item_id = int(sys.argv[2])
+        shards = int(sys.argv[3]) if sys.argv[1] == "enable" else 0
+    except (IndexError, ValueError):
+        print(usage)
+        sys.exit(2)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            row = set_shards(cur, item_id, shards)
+    if row is None:
+        print(f"❌ No item with ID {item_id}")
+        sys.exit(1)
+    print(f"✅ {row['item_name']}: {row['quantity']} in stock, {row['stock_shards']} shards")
@@ -0,0 +1,39 @@
+"""Shared fixtures: a throwaway Postgres seeded like the benchmarks (see bench/pgserver.py).
+
+Tests that need the database are skipped when no server can be started
+(set ``PG_BIN`` or ``BENCH_DATABASE_URL``).
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+# Read by db when it is imported; concurrency tests run several sellers at once
+os.environ.setdefault("DB_POOL_MAX_SIZE", "16")
+
+ITEMS = 5
+STOCK = 1_000_000_000
+
+
+@pytest.fixture(scope="session")
+def database_url():
+    from pgserver import throwaway_postgres
+    import seed
+
+    try:
+        context = throwaway_postgres()
+        url = context.__enter__()
+    except Exception as e:
+        pytest.skip(f"No Postgres available: {e}")
+    try:
+        seed.seed(url, sales=0, items=ITEMS)
+        os.environ["DATABASE_URL"] = url
+        yield url
+    finally:
+        from db import get_pool
+        get_pool().closeall()
+        context.__exit__(None, None, None)
@@ -0,0 +1,22 @@
+"""Fingerprinted assets built by several workers at once."""
+import os
+import gzip
+import multiprocessing
+
+import assets
+
+
+def test_concurrent_builds(tmp_path):
+    """Workers started without --preload all build at once; none may fail or leave a torn file."""
+    script = "".join(f"console.log('lakuai {n}');\n" for n in range(200_000)).encode()
+    (tmp_path / "script.js").write_bytes(script)
+
+    with multiprocessing.get_context("fork").Pool(8) as pool:
+        manifests = pool.map(assets.build, [str(tmp_path)] * 16)
+
+    assert all(manifest == manifests[0] for manifest in manifests)
+    dist = tmp_path / assets.DIST
+    target = dist / manifests[0]["script.js"]
+    assert target.read_bytes() == script
+    assert gzip.decompress((dist / (target.name + ".gz")).read_bytes()) == script
+    assert not [name for name in os.listdir(dist) if name.endswith(".partial")]
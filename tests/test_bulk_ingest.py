@@ -0,0 +1,49 @@
+"""Bulk ingest allocates stock like the sale engine."""
+import pytest
+
+
+@pytest.fixture
+def scarce_item(database_url):
+    """An item with 10 in stock, removed with its sales afterwards; yields its name."""
+    import rollups
+    from catalog import catalog
+    from db import get_db_connection
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO storage (item_name, quantity, price) VALUES ('scarce item', 10, 3.00)
+                RETURNING item_id
+            """)
+            item_id = cur.fetchone()["item_id"]
+        conn.commit()
+    catalog.invalidate()
+    try:
+        yield "scarce item"
+    finally:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM sales WHERE item_id = %s RETURNING *", (item_id,))
+                rollups.apply_sales(cur, cur.fetchall(), sign=-1)
+                cur.execute("DELETE FROM storage WHERE item_id = %s", (item_id,))
+            conn.commit()
+        catalog.invalidate()
+
+
+def test_line_that_does_not_fit_leaves_stock_for_later_lines(scarce_item):
+    from bulk_ingest import ingest_sales
+    from db import get_db_connection
+
+    result = ingest_sales([{"item_name": scarce_item, "quantity": quantity} for quantity in (8, 5, 1)])
+
+    assert result["inserted"] == 2
+    assert result["rejected"] == [{
+        "line": 2, "item_name": scarce_item,
+        "error": f"Insufficient stock for '{scarce_item}'. Available: 2, Requested: 5",
+    }]
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT quantity FROM storage WHERE item_name = %s", (scarce_item,))
+            assert cur.fetchone()["quantity"] == 1
+            cur.execute("SELECT quantity FROM sales WHERE item_name = %s ORDER BY id", (scarce_item,))
+            assert [row["quantity"] for row in cur.fetchall()] == [8, 1]
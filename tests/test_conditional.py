@@ -0,0 +1,35 @@
+"""ETags of responses that show item names change when an item is renamed."""
+import pytest
+
+
+@pytest.fixture
+def client(database_url):
+    from app import app
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["username"] = "test"
+    return client
+
+
+def rename_item(item_id, name):
+    from db import get_db_connection
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE storage SET item_name = %s WHERE item_id = %s", (name, item_id))
+        conn.commit()
+
+
+@pytest.mark.parametrize("path", ["/api/analytics", "/api/sales?item=item%201"])
+def test_rename_invalidates_etag(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    rename_item(1, "item one")
+    try:
+        assert client.get(path, headers={"If-None-Match": etag}).status_code == 200
+    finally:
+        rename_item(1, "item 1")
@@ -0,0 +1,32 @@
+"""Admission control of Gemini calls, with a stand-in client."""
+import threading
+
+from llm_gateway import LLMGateway
+
+
+class SlowClient:
+    """Answers once ``calls`` callers are inside ``generate`` at the same time."""
+
+    def __init__(self, calls):
+        self.barrier = threading.Barrier(calls, timeout=5)
+
+    def generate(self, user_text, timeout=None):
+        self.barrier.wait()
+        return f"reply to {user_text}", {}
+
+
+def test_overlapping_calls_both_run_with_the_defaults():
+    gateway = LLMGateway(client=SlowClient(2))
+    results = {}
+    callers = [threading.Thread(target=lambda n=n: results.update({n: gateway.generate(f"sale {n}")}))
+               for n in range(2)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join(timeout=10)
+
+    # With the old single slot and 1 s queue timeout the second call was turned away as busy
+    assert results == {0: ("reply to sale 0", {}), 1: ("reply to sale 1", {})}
+    stats = gateway.stats()
+    assert stats["calls"] == 2
+    assert stats["rejected_busy"] == 0
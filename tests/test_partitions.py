@@ -0,0 +1,94 @@
+"""Archiving a month: the file matches what is dropped and the rollups stay exact."""
+import csv
+import gzip
+from datetime import date, datetime, timezone
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+import pytest
+
+
+@pytest.fixture
+def old_month(database_url):
+    """Three sales in March 2020, in their own partition and the rollups; yields the partition name."""
+    import partitions
+    import rollups
+
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            partitions.ensure_partitions(cur, [date(2020, 3, 1)])
+            cur.execute("""
+                INSERT INTO sales (item_id, item_name, quantity, price, created_at)
+                SELECT 1, 'item 1', n, 2.50, %s FROM generate_series(1, 3) n
+                RETURNING *
+            """, (datetime(2020, 3, 14, 9, tzinfo=timezone.utc),))
+            rollups.apply_sales(cur, cur.fetchall())
+        conn.commit()
+        yield "sales_2020_03"
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS sales_2020_03")
+        conn.commit()
+        conn.close()
+
+
+def archived_rows(path):
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def check_dropped(database_url, name):
+    import rollups
+
+    with psycopg2.connect(database_url, cursor_factory=RealDictCursor) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) AS partition", (name,))
+            assert cur.fetchone()["partition"] is None
+            conn.rollback()
+            assert rollups.verify(cur) == []
+
+
+def test_archive_partition(database_url, old_month, tmp_path):
+    import partitions
+
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        path = partitions.archive_partition(conn, old_month, str(tmp_path))
+    finally:
+        conn.close()
+
+    assert [row["quantity"] for row in archived_rows(path)] == ["1", "2", "3"]
+    check_dropped(database_url, old_month)
+
+
+def test_archive_partition_copies_again_after_a_change(database_url, old_month, tmp_path, monkeypatch):
+    """A sale deleted between the copy and the detach must not be left in the archive."""
+    import partitions
+    import rollups
+
+    detach = partitions._detach
+    deleted = []
+
+    def delete_then_detach(cur, name):
+        if not deleted:
+            with psycopg2.connect(database_url, cursor_factory=RealDictCursor) as other:
+                with other.cursor() as other_cur:
+                    other_cur.execute("DELETE FROM sales WHERE created_at < '2020-04-01' AND quantity = 2 RETURNING *")
+                    deleted.extend(other_cur.fetchall())
+                    rollups.apply_sales(other_cur, deleted, sign=-1)
+            other.close()
+        detach(cur, name)
+
+    monkeypatch.setattr(partitions, "_detach", delete_then_detach)
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        path = partitions.archive_partition(conn, old_month, str(tmp_path))
+    finally:
+        conn.close()
+
+    assert len(deleted) == 1
+    assert [row["quantity"] for row in archived_rows(path)] == ["1", "3"]
+    check_dropped(database_url, old_month)
@@ -0,0 +1,31 @@
+"""Rollup verification against sales that keep coming in."""
+
+
+class SaleAfterFirstRead:
+    """Cursor that records a sale on another connection right after the first SELECT."""
+
+    def __init__(self, cur):
+        self.cur = cur
+        self.sold = False
+
+    def execute(self, query, *args):
+        self.cur.execute(query, *args)
+        if not self.sold and query.lstrip().upper().startswith("SELECT"):
+            from sale_engine import record_sales
+
+            self.sold = True
+            assert record_sales([{"item_name": "item 3", "quantity": 1}])["success"]
+
+    def __getattr__(self, name):
+        return getattr(self.cur, name)
+
+
+def test_verify_does_not_report_a_sale_committed_while_it_reads(database_url):
+    import rollups
+    from db import get_db_connection
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            racing = SaleAfterFirstRead(cur)
+            assert rollups.verify(racing) == []
+            assert racing.sold
@@ -0,0 +1,66 @@
+"""Concurrent sales against a real Postgres: no deadlocks, no lost stock."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from conftest import ITEMS, STOCK
+
+
+def sale(*item_numbers):
+    return [{"item_name": f"item {n}", "quantity": 1} for n in item_numbers]
+
+
+def test_basket_and_single_sale_do_not_deadlock(database_url):
+    """A basket holding item 1 and waiting for item 2 must not block a sale of item 2 alone."""
+    from sale_engine import take_stock, record_sales, ALL_OR_NOTHING
+
+    basket = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        with basket.cursor() as cur:
+            assert take_stock(cur, 1, 1) is not None
+
+            single = {}
+            seller = threading.Thread(target=lambda: single.update(record_sales(sale(2), ALL_OR_NOTHING)))
+            seller.start()
+            seller.join(timeout=5)
+            # Before the data-version bump was deferred to commit, the single
+            # sale queued behind the basket here and the next line deadlocked
+            assert not seller.is_alive(), "single-item sale blocked by an unrelated basket"
+            assert single["success"]
+
+            assert take_stock(cur, 2, 1) is not None
+        # Only the locking order matters here; leave the stock untouched
+        basket.rollback()
+    finally:
+        basket.close()
+
+
+def test_concurrent_baskets_and_single_sales(database_url):
+    from sale_engine import record_sales, ALL_OR_NOTHING
+    from db import get_db_connection
+    import rollups
+
+    orders = [sale(*range(1, ITEMS + 1)), sale(ITEMS, 1), sale(2), sale(3, 3), sale(1)] * 40
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda order: record_sales(order, ALL_OR_NOTHING), orders))
+
+    assert all(result["success"] for result in results)
+    for result in results:
+        sales_by_id = {s["id"]: s for s in result["sales"]}
+        for line in result["lines"]:
+            assert sales_by_id[line["sale_id"]]["item_name"] == line["item_name"]
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT st.item_id, st.quantity, COALESCE(SUM(s.quantity), 0) AS sold
+                FROM storage_stock st
+                LEFT JOIN sales s ON s.item_id = st.item_id
+                GROUP BY st.item_id, st.quantity
+            """)
+            for row in cur.fetchall():
+                assert row["quantity"] + row["sold"] == STOCK
+            conn.rollback()
+            assert rollups.verify(cur) == []